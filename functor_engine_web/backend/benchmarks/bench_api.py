@@ -0,0 +1,384 @@
+"""
+Benchmark: the HTTP request path end to end, offline.
+
+Drives the FastAPI app in-process (httpx ASGI transport, no sockets) with both Gemini
+models replaced by benchmarks.fake_llm.FakeChatModel, against synthetic worlds of the
+given sizes and at the given concurrency levels. Reports throughput and p50/p95/p99
+latency per scenario and writes the results as JSON; with --baseline the run is
+compared against an earlier result file and exits with status 1 on a regression.
+
+The translation and image description caches are cleared before every measured run,
+so each (world size, scenario, concurrency) row starts cold.
+
+Scenarios:
+- translate         POST /translate (unique texts, so the translation cache misses)
+- translate_same    POST /translate with each text sent by `concurrency` clients at once
+                    (single-flight: llm_calls_per_request drops with concurrency)
+- translate_stream  POST /translate/stream (also reports time to first byte)
+- document          POST /translate/document with a --doc-paragraphs paragraph document, one
+                    paragraph edited per request (the first request translates every
+                    paragraph, later ones only the edited paragraph)
+- image             POST /translate/image (a pool of --images distinct photos: the first
+                    pass misses the description cache, later ones hit it)
+- initialize        POST /world/{id}/initialize?wait=true (--init-chunks chunks per world)
+- graph             GET /world/graph (full export)
+- graph_304         GET /world/graph revalidated with If-None-Match
+
+Usage (from functor_engine_web/backend):
+    python -m benchmarks.bench_api --edges 100 10000 --concurrency 1 16
+    python -m benchmarks.bench_api --edges 1000000 --scenarios translate graph_304 --requests 50
+    python -m benchmarks.bench_api --baseline benchmarks/results/bench_api-20260101-120000.json
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_graph_store import make_edges  # noqa: E402
+from benchmarks.fake_llm import FakeChatModel  # noqa: E402
+
+SCENARIOS = ["translate", "translate_same", "translate_stream", "document", "image", "initialize", "graph", "graph_304"]
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+BENCH_ID_HEADER = "x-bench-id"
+
+
+class FirstByteTimer:
+    """
+    ASGI wrapper recording when each response sends its first body bytes.
+    (httpx's ASGI transport hands the body over only once the response is complete.)
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.first_byte = {}
+
+    async def __call__(self, scope, receive, send):
+        bench_id = None
+        if scope["type"] == "http":
+            bench_id = dict(scope["headers"]).get(BENCH_ID_HEADER.encode())
+
+        async def timed_send(message):
+            if (bench_id is not None and message["type"] == "http.response.body"
+                    and message.get("body") and bench_id not in self.first_byte):
+                self.first_byte[bench_id] = time.perf_counter()
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+def load_app(args):
+    """Imports main with an offline configuration and swaps in the fake models."""
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+    os.environ["WORLD_SNAPSHOT_DIR"] = tempfile.mkdtemp(prefix="bench_api_")
+    os.environ["GRAPH_BACKEND"] = args.backend
+    os.environ.pop("TRANSLATION_CACHE_PATH", None)
+    os.environ.pop("PRELOAD_WORLDS", None)
+    import main
+    main.load_engine()
+    main.engine.llm = FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency,
+                                    jitter=args.jitter, seed=args.seed, error_rate=args.llm_error_rate,
+                                    rpm_limit=args.llm_rpm_limit)
+    main.engine.vision_llm = FakeChatModel(latency=args.vision_latency, jitter=args.jitter, seed=args.seed + 1)
+    return main
+
+
+def install_world(main, n_edges: int, backend: str, seed: int) -> int:
+    """Publishes a synthetic world (concept_<n> nodes, random laws) as the default world."""
+    from core.graph_logic import CategoryGraph
+    from core.models import WorldObject
+
+    n_nodes, edges = make_edges(n_edges, seed)
+    nodes = [(f"concept_{i}", {"data": WorldObject(id=f"concept_{i}", label=f"Concept {i}",
+                                                   description=f"Synthetic concept number {i}")})
+             for i in range(n_nodes)]
+    graph = CategoryGraph(backend)
+    graph.load_bulk(nodes, edges)
+    graph.reset_history(1, fingerprint=hashlib.sha1(f"synthetic-{n_edges}-{seed}".encode()).hexdigest())
+    main.world_registry.put(main.DEFAULT_WORLD_ID, graph, persist=False)
+    return n_nodes
+
+
+def make_images(count: int, seed: int):
+    """Photo-sized JPEGs (gradient + noise), distinct enough to get different perceptual hashes."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        y, x = np.mgrid[0:1500, 0:2000]
+        angle = 2 * np.pi * i / max(count, 1)
+        base = (np.sin(x / 150 * np.cos(angle) + y / 150 * np.sin(angle) + i) + 1) * 110
+        pixels = np.stack([base, base[::-1], np.roll(base, 300 * i, axis=1)], axis=-1)
+        pixels += rng.integers(0, 30, pixels.shape)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def world_text(chunks: int, chunk_chars: int, offset: int, rng: random.Random) -> str:
+    """`chunks` sections of roughly chunk_chars characters, each mentioning a few concepts."""
+    sections = []
+    for c in range(chunks):
+        lines = [f"# Region {offset + c}"]
+        size = len(lines[0])
+        while size < chunk_chars * 0.8:
+            a, b = rng.randrange(1000), rng.randrange(1000)
+            line = f"In this region concept_{a} trades with concept_{b}, and the old customs still hold."
+            lines.append(line)
+            size += len(line) + 1
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def summarize(values):
+    if not values:
+        return None
+    ms = np.asarray(values) * 1000
+    return {
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p95": round(float(np.percentile(ms, 95)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+async def drive(request, n_requests: int, concurrency: int):
+    """Runs request(i) for i in range(n_requests) with `concurrency` in flight; returns stats."""
+    counter = itertools.count()
+    latencies, ttfbs = [], []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= n_requests:
+                return
+            start = time.perf_counter()
+            try:
+                ok, first_byte = await request(i)
+            except Exception as e:
+                print(f"  request {i} failed: {e}")
+                ok, first_byte = False, None
+            latencies.append(time.perf_counter() - start)
+            if first_byte is not None:
+                ttfbs.append(first_byte - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "seconds": round(wall, 3),
+        "throughput_rps": round(n_requests / wall, 2) if wall else None,
+        "latency_ms": summarize(latencies),
+        "ttfb_ms": summarize(ttfbs),
+    }
+
+
+def make_request(scenario: str, client, timer: FirstByteTimer, main, n_nodes: int, concurrency: int, args, state):
+    rng = random.Random(args.seed)
+
+    def concept():
+        return f"concept_{rng.randrange(n_nodes)}"
+
+    if scenario == "translate":
+        async def request(i):
+            text = f"Report {i}: {concept()} trades with {concept()} while {concept()} watches the harbor."
+            response = await client.post("/translate", json={"text": text})
+            return response.status_code == 200, None
+    elif scenario == "translate_same":
+        texts = {}
+
+        async def request(i):
+            group = i // concurrency  # 同時に送られる concurrency 件が同じテキスト
+            if group not in texts:
+                texts[group] = f"Rumor {group}: {concept()} quarrels with {concept()} over the harbor tolls."
+            response = await client.post("/translate", json={"text": texts[group]})
+            return response.status_code == 200, None
+    elif scenario == "translate_stream":
+        async def request(i):
+            text = f"Story {i}: {concept()} forbids {concept()} from crossing the river."
+            bench_id = f"stream-{i}"
+            response = await client.post("/translate/stream", json={"text": text},
+                                         headers={BENCH_ID_HEADER: bench_id})
+            first_byte = timer.first_byte.pop(bench_id.encode(), None)
+            return response.status_code == 200 and "event: done" in response.text, first_byte
+    elif scenario == "document":
+        paragraphs = [f"## Chapter {p}\n\n{concept()} crosses the bridge to meet {concept()}." if p % 5 == 0
+                      else f"Paragraph {p}: {concept()} and {concept()} argue about the tides."
+                      for p in range(args.doc_paragraphs)]
+
+        async def request(i):
+            p = i % len(paragraphs)
+            paragraphs[p] = f"Paragraph {p} (revision {i}): {concept()} and {concept()} argue about the tides."
+            response = await client.post("/translate/document", json={"text": "\n\n".join(paragraphs)})
+            return response.status_code == 200 and not response.json()["failed_chunks"], None
+    elif scenario == "image":
+        if "images" not in state:
+            state["images"] = make_images(args.images, args.seed)
+        images = state["images"]
+
+        async def request(i):
+            files = {"file": (f"photo{i}.jpg", images[i % len(images)], "image/jpeg")}
+            response = await client.post("/translate/image", files=files)
+            return response.status_code == 200, None
+    elif scenario == "initialize":
+        text_rng = random.Random(args.seed)
+        texts = [world_text(args.init_chunks, main.INIT_CHUNK_CHARS, i * args.init_chunks, text_rng)
+                 for i in range(args.init_requests)]
+
+        async def request(i):
+            world_id = f"bench-init-{i}"
+            state.setdefault("worlds", []).append(world_id)
+            response = await client.post(f"/world/{world_id}/initialize?wait=true", json={"config_text": texts[i]})
+            return response.status_code == 200, None
+    elif scenario == "graph":
+        async def request(i):
+            response = await client.get("/world/graph")
+            return response.status_code == 200, None
+    elif scenario == "graph_304":
+        etag = state["etag"]
+
+        async def request(i):
+            response = await client.get("/world/graph", headers={"If-None-Match": etag})
+            return response.status_code == 304, None
+    else:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    return request
+
+
+async def run(args):
+    import httpx
+
+    main = load_app(args)
+    timer = FirstByteTimer(main.app)
+    transport = httpx.ASGITransport(app=timer)
+    results = []
+    print(f"{'scenario':>16} {'edges':>8} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb p50':>9}")
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for n_edges in args.edges:
+                n_nodes = install_world(main, n_edges, args.backend, args.seed)
+                # 最初のリクエストは索引の構築を含むため計測から外し、別に記録する
+                start = time.perf_counter()
+                await client.post("/translate", json={"text": "warm up concept_0"})
+                warmup = time.perf_counter() - start
+                state = {"etag": (await client.get("/world/status")).json()["etag"]}
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        n_requests = args.init_requests if scenario == "initialize" else args.requests
+                        request = make_request(scenario, client, timer, main, n_nodes, concurrency, args, state)
+                        main.translation_cache.clear()
+                        main.image_cache.clear()
+                        calls_before = main.engine.llm.calls + main.engine.vision_llm.calls
+                        hits_before = main.translation_cache.hits + main.image_cache.hits
+                        row = await drive(request, n_requests, concurrency)
+                        calls = main.engine.llm.calls + main.engine.vision_llm.calls - calls_before
+                        hits = main.translation_cache.hits + main.image_cache.hits - hits_before
+                        for world_id in state.pop("worlds", []):
+                            main.world_registry.delete(world_id)
+                        row = {"scenario": scenario, "edges": n_edges, "backend": args.backend,
+                               "concurrency": concurrency, **row,
+                               "llm_calls_per_request": round(calls / n_requests, 2),
+                               "cache_hits": hits,
+                               "warmup_ms": round(warmup * 1000, 1)}
+                        results.append(row)
+                        latency, ttfb = row["latency_ms"], row["ttfb_ms"]
+                        print(f"{scenario:>16} {n_edges:>8} {concurrency:>5} {n_requests:>5} {row['errors']:>4} "
+                              f"{row['throughput_rps']:>8.1f} {latency['p50']:>8.1f} {latency['p95']:>8.1f} "
+                              f"{latency['p99']:>8.1f} {ttfb['p50'] if ttfb else '-':>9}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path: str, threshold: float) -> int:
+    """Prints the change against a previous result file; returns the number of regressions."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["scenario"], r["edges"], r["backend"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nvs {baseline_path} (regression: p95 or req/s worse by more than {threshold:.0%})")
+    print(f"{'scenario':>16} {'edges':>8} {'conc':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    for row in results:
+        old = baseline.get((row["scenario"], row["edges"], row["backend"], row["concurrency"]))
+        if old is None:
+            continue
+        change = {q: row["latency_ms"][q] / old["latency_ms"][q] - 1 for q in ("p50", "p95", "p99")}
+        change["rps"] = row["throughput_rps"] / old["throughput_rps"] - 1
+        worse = change["p95"] > threshold or change["rps"] < -threshold
+        regressions += worse
+        print(f"{row['scenario']:>16} {row['edges']:>8} {row['concurrency']:>5} {change['p50']:>+8.1%} "
+              f"{change['p95']:>+8.1%} {change['p99']:>+8.1%} {change['rps']:>+8.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, nargs="+", default=[100, 10000],
+                        help="synthetic world sizes (100 .. 1000000 edges)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--init-requests", type=int, default=8, help="worlds initialized per concurrency level")
+    parser.add_argument("--init-chunks", type=int, default=8, help="chunks per initialized world")
+    parser.add_argument("--doc-paragraphs", type=int, default=20, help="paragraphs per /translate/document request")
+    parser.add_argument("--images", type=int, default=8, help="distinct images in the /translate/image pool")
+    parser.add_argument("--backend", choices=["networkx", "array"], default="networkx")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake text model call")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds per streamed word")
+    parser.add_argument("--vision-latency", type=float, default=0.2, help="seconds per fake vision model call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of the fake model latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0,
+                        help="fraction of fake text model calls failing with 429 (retried by the gateway)")
+    parser.add_argument("--llm-rpm-limit", type=int, default=0,
+                        help="fake text model calls per minute before it answers 429 (0: unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/bench_api-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_api-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,121 @@
+"""
+Benchmark: CategoryGraph storage backends (networkx vs array).
+
+Reports, per backend and graph size:
+- build time through add_morphism (incremental) and load_bulk (snapshot-style)
+- memory allocated by the store per edge (tracemalloc, WorldObjects and indexes excluded)
+- get_context latency for hot concepts, cold (cache cleared every call) and cached
+- copy() time (what a copy-on-write update of a published world costs up front)
+
+Usage (from functor_engine_web/backend):
+    python -m benchmarks.bench_graph_store --edges 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.graph_logic import CategoryGraph  # noqa: E402
+from core.graph_store import create_store  # noqa: E402
+from core.models import Morphism  # noqa: E402
+
+BACKENDS = ["networkx", "array"]
+LABELS = ["rules", "feeds", "fears", "worships", "trades with", "forbids", "creates", "destroys"]
+
+
+def make_edges(n_edges: int, seed: int = 0):
+    rng = random.Random(seed)
+    n_nodes = max(10, n_edges // 10)
+    edges = []
+    for _ in range(n_edges):
+        u, v = rng.randrange(n_nodes), rng.randrange(n_nodes)
+        label = rng.choice(LABELS)
+        edges.append((f"concept_{u}", f"concept_{v}", {"label": label, "rule": f"concept {u} {label} concept {v}"}))
+    return n_nodes, edges
+
+
+def store_bytes_per_edge(backend: str, edges) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = create_store(backend)
+    store.load_bulk([], edges)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return (after - before) / len(edges)
+
+
+def timed(fn):
+    """Runs fn with the cyclic GC paused (its full collections over the benchmark's own
+    edge lists otherwise dominate and blur the comparison)."""
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def build_incremental(backend: str, morphisms) -> float:
+    graph = CategoryGraph(backend)
+
+    def add_all():
+        for morphism in morphisms:
+            graph.add_morphism(morphism)
+    return timed(add_all)[1]
+
+
+def build_bulk(backend: str, n_nodes: int, edges):
+    graph = CategoryGraph(backend)
+    nodes = [(f"concept_{i}", {}) for i in range(n_nodes)]
+    _, seconds = timed(lambda: graph.load_bulk(nodes, edges))
+    return graph, seconds
+
+
+def context_latency_us(graph: CategoryGraph, hot, cached: bool, rounds: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for node_id in hot:
+            if not cached:
+                graph._context_cache.clear()
+            graph.get_context(node_id)
+    return (time.perf_counter() - start) / (rounds * len(hot)) * 1e6
+
+
+def run(edge_counts, incremental_limit: int, seed: int):
+    print(f"{'edges':>9} {'backend':>9} {'B/edge':>8} {'add s':>8} {'bulk s':>8} "
+          f"{'ctx cold us':>12} {'ctx hot us':>11} {'copy s':>8}")
+    for n_edges in edge_counts:
+        n_nodes, edges = make_edges(n_edges, seed)
+        morphisms = [Morphism(source=u, target=v, **attrs) for u, v, attrs in edges[:incremental_limit]]
+        rng = random.Random(seed)
+        hot = [f"concept_{rng.randrange(n_nodes)}" for _ in range(200)]
+        for backend in BACKENDS:
+            per_edge = store_bytes_per_edge(backend, edges)
+            # add_morphism is measured on at most `incremental_limit` edges and extrapolated
+            add_seconds = build_incremental(backend, morphisms) * n_edges / len(morphisms)
+            graph, bulk_seconds = build_bulk(backend, n_nodes, edges)
+            cold = context_latency_us(graph, hot, cached=False)
+            context_latency_us(graph, hot, cached=True, rounds=1)  # fill the cache
+            warm = context_latency_us(graph, hot, cached=True)
+            copy, copy_seconds = timed(graph.copy)
+            print(f"{n_edges:>9} {backend:>9} {per_edge:>8.0f} {add_seconds:>8.2f} {bulk_seconds:>8.2f} "
+                  f"{cold:>12.1f} {warm:>11.2f} {copy_seconds:>8.2f}")
+            del graph, copy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--incremental-limit", type=int, default=100000,
+                        help="edges added one by one through add_morphism (the rest is extrapolated)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.edges, args.incremental_limit, args.seed)
@@ -0,0 +1,81 @@
+"""
+Benchmark: entity -> node resolution, legacy linear scan vs. NodeMatcher index.
+
+"unique" queries carry a number token that is rare in the graph; "common" queries are a
+single word from WORDS, contained in about 1/8 of the node ids (the worst case of the index).
+
+Usage (from functor_engine_web/backend):
+    python -m benchmarks.bench_matcher --sizes 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.graph_logic import CategoryGraph  # noqa: E402
+from core.models import WorldObject  # noqa: E402
+
+WORDS = [
+    "crystal", "spire", "iron", "king", "rose", "rebellion", "aether", "guild",
+    "mage", "ration", "tower", "river", "empire", "shadow", "forge", "archive",
+]
+
+
+def legacy_find_nearest_node(graph: CategoryGraph, entity: str):
+    """The original FunctorEngine._find_nearest_node implementation."""
+    for node_id, _ in graph.nodes():
+        if entity.lower() in node_id.lower() or node_id.lower() in entity.lower():
+            return node_id
+    return None
+
+
+def build_graph(size: int, rng: random.Random) -> CategoryGraph:
+    graph = CategoryGraph()
+    for i in range(size):
+        words = rng.sample(WORDS, 2)
+        node_id = f"{words[0]}_{words[1]}_{i}"
+        graph.add_node(WorldObject(id=node_id, label=f"{words[0].title()} {words[1].title()} {i}", description=""))
+    return graph
+
+
+def time_per_query(lookup, entities) -> float:
+    start = time.perf_counter()
+    for entity in entities:
+        lookup(entity)
+    return (time.perf_counter() - start) / len(entities) * 1000
+
+
+def run(sizes, queries: int, seed: int):
+    rng = random.Random(seed)
+    print(f"{'nodes':>8} {'legacy ms/query':>16} {'index ms/query':>15} {'speedup':>8}"
+          f" {'common legacy':>14} {'common index':>13}")
+    for size in sizes:
+        graph = build_graph(size, rng)
+        entities = []
+        for _ in range(queries):
+            i = rng.randrange(size * 2)  # about half of the queries miss
+            words = rng.sample(WORDS, 2)
+            entities.append(f"{words[0]} {words[1]} {i}")
+        common = [rng.choice(WORDS) for _ in range(queries)]
+
+        graph.find_nodes("warmup")  # builds the automaton once
+
+        legacy = time_per_query(lambda entity: legacy_find_nearest_node(graph, entity), entities)
+        indexed = time_per_query(lambda entity: graph.find_nodes(entity, limit=5), entities)
+        common_legacy = time_per_query(lambda entity: legacy_find_nearest_node(graph, entity), common)
+        common_indexed = time_per_query(lambda entity: graph.find_nodes(entity, limit=5), common)
+
+        print(f"{size:>8} {legacy:>16.4f} {indexed:>15.4f} {legacy / indexed:>7.1f}x"
+              f" {common_legacy:>14.4f} {common_indexed:>13.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.seed)
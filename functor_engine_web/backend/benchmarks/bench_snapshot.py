@@ -0,0 +1,130 @@
+"""
+Benchmark: CategoryGraph snapshot load time and resident memory.
+
+Each load runs in a fresh subprocess so the RSS growth is not polluted by the writer.
+The JSON baseline rebuilds the graph through add_node/add_morphism with full
+Pydantic validation (what a naive dump/load would do).
+
+Usage (from functor_engine_web/backend):
+    python -m benchmarks.bench_snapshot --edges 10000 100000 1000000
+    python -m benchmarks.bench_snapshot --edges 10000 100000 --baseline
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from core.graph_logic import CategoryGraph  # noqa: E402
+from core.models import WorldObject, Morphism  # noqa: E402
+from core.snapshot import load_snapshot, save_snapshot  # noqa: E402
+
+LABELS = ["rules", "feeds", "fears", "worships", "trades with", "forbids", "creates", "destroys"]
+
+
+def build_graph(n_edges: int, seed: int = 0) -> CategoryGraph:
+    rng = random.Random(seed)
+    n_nodes = max(10, n_edges // 10)
+    nodes = [
+        (f"concept_{i}", {"data": WorldObject.model_construct(
+            id=f"concept_{i}", label=f"Concept {i}",
+            description=f"Description of concept {i} in the world.", type="concept", meta={},
+        )})
+        for i in range(n_nodes)
+    ]
+    edges = []
+    for _ in range(n_edges):
+        u, v = rng.randrange(n_nodes), rng.randrange(n_nodes)
+        label = rng.choice(LABELS)
+        edges.append((f"concept_{u}", f"concept_{v}", {"label": label, "rule": f"concept {u} {label} concept {v}"}))
+    graph = CategoryGraph()
+    graph.load_bulk(nodes, edges)
+    return graph
+
+
+def save_json(graph: CategoryGraph, path: str):
+    data = {
+        "nodes": [node.model_dump() for _, node in graph.nodes()],
+        "edges": [{"source": u, "target": v, "label": a["label"], "rule": a["rule"]}
+                  for u, v, _, a in graph.edges()],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def load_json(path: str) -> CategoryGraph:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    graph = CategoryGraph()
+    for node in data["nodes"]:
+        graph.add_node(WorldObject(**node))
+    for edge in data["edges"]:
+        graph.add_morphism(Morphism(**edge))
+    return graph
+
+
+def current_rss_mb() -> float:
+    # ru_maxrss survives fork/exec on Linux (it would report the parent's peak), so read statm
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_load(kind: str, path: str):
+    """Runs inside the subprocess: loads once and prints seconds / RSS growth as JSON."""
+    before = current_rss_mb()
+    start = time.perf_counter()
+    graph = load_snapshot(path) if kind == "fgs" else load_json(path)
+    seconds = time.perf_counter() - start
+    after = current_rss_mb()
+    print(json.dumps({
+        "seconds": seconds,
+        "rss_delta_mb": after - before,
+        "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges(),
+    }))
+
+
+def run_load(kind: str, path: str):
+    out = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_snapshot", "--measure", kind, path],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(edge_counts, baseline: bool):
+    workdir = tempfile.mkdtemp(prefix="fgs_bench_")
+    print(f"{'edges':>9} {'format':>6} {'file MB':>8} {'load s':>8} {'RSS +MB':>8}")
+    for n_edges in edge_counts:
+        graph = build_graph(n_edges)
+        targets = [("fgs", os.path.join(workdir, f"{n_edges}.fgs"), save_snapshot)]
+        if baseline:
+            targets.append(("json", os.path.join(workdir, f"{n_edges}.json"), save_json))
+        for kind, path, save in targets:
+            save(graph, path)
+            result = run_load(kind, path)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"{n_edges:>9} {kind:>6} {size_mb:>8.1f} {result['seconds']:>8.2f} {result['rss_delta_mb']:>8.1f}")
+            os.remove(path)
+        del graph
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure":
+        measure_load(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--baseline", action="store_true", help="also measure a validated JSON load")
+    args = parser.parse_args()
+    run(args.edges, args.baseline)
@@ -0,0 +1,208 @@
+"""
+Cold start benchmark: import time and time to first response of the API.
+
+Every sample runs in a fresh interpreter (`python -m benchmarks.bench_startup --child`)
+with an empty snapshot directory, once per STARTUP_WARMUP mode (--warmup):
+
+- import_ms        `import main`
+- startup_ms       lifespan startup (returns early unless STARTUP_WARMUP=blocking)
+- first_graph_ms   from before `import main` to the first GET /world/graph response
+- engine_ms        from that response until the engine and both model clients exist
+                   (created lazily, or awaited if the warm-up is still running)
+- first_translate_ms  from before `import main` to the first POST /translate response
+                   (engine_ms included; the fake model answers instantly, so no network)
+- process_ms       wall time of the child process, interpreter start included
+
+Requests are passed to the ASGI app directly, so no HTTP client library is imported
+into the measured process.
+
+Usage (from functor_engine_web/backend):
+    python -m benchmarks.bench_startup --repeat 5
+    python -m benchmarks.bench_startup --imports 15
+    python -m benchmarks.bench_startup --baseline benchmarks/results/bench_startup-20260101-120000.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+MODES = ["off", "background", "blocking"]
+METRICS = ["import_ms", "startup_ms", "first_graph_ms", "engine_ms", "first_translate_ms", "process_ms"]
+
+
+async def _request(app, method: str, path: str, body=None):
+    """Minimal in-process ASGI request; returns (status, body)."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    sent = False
+    status, chunks = None, []
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.Future()  # 切断は起きない
+        sent = True
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def child():
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        status, _ = await _request(main.app, "GET", "/world/graph")
+        assert status == 200, status
+        graph_done = time.perf_counter()
+        engine = await asyncio.to_thread(main.load_engine)
+        await asyncio.to_thread(engine.warm_up)
+        engine_done = time.perf_counter()
+
+        # 実クライアントを作った後で偽モデルに差し替える (この import は計測から外す)
+        from benchmarks.fake_llm import FakeChatModel
+        engine.llm = FakeChatModel(latency=0.0)
+        engine.vision_llm = FakeChatModel(latency=0.0)
+        request_start = time.perf_counter()
+        status, _ = await _request(main.app, "POST", "/translate", {"text": "concept_0 crosses the river"})
+        assert status == 200, status
+        translate_seconds = time.perf_counter() - request_start
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "startup_ms": (started - imported) * 1000,
+        "first_graph_ms": (graph_done - start) * 1000,
+        "engine_ms": (engine_done - graph_done) * 1000,
+        "first_translate_ms": (engine_done - start + translate_seconds) * 1000,
+    }))
+
+
+def run_child(mode: str) -> dict:
+    env = {**os.environ, "STARTUP_WARMUP": mode, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "offline-benchmark")}
+    env.pop("PRELOAD_WORLDS", None)
+    env.pop("TRANSLATION_CACHE_PATH", None)
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as snapshot_dir:
+        env["WORLD_SNAPSHOT_DIR"] = snapshot_dir
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child"], cwd=BACKEND_DIR,
+                                   env=env, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"child failed ({mode}):\n{completed.stderr}")
+    sample = json.loads(completed.stdout.strip().splitlines()[-1])
+    sample["process_ms"] = elapsed * 1000
+    return sample
+
+
+def slowest_imports(count: int):
+    """Prints the modules with the largest cumulative import time under `import main` (-X importtime)."""
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "offline-benchmark")}
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as snapshot_dir:
+        env["WORLD_SNAPSHOT_DIR"] = snapshot_dir
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                                   env=env, capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    print("\nslowest imports (cumulative ms) of `import main`:")
+    for cumulative, name in sorted(rows, reverse=True)[:count]:
+        print(f"{cumulative / 1000:>9.1f}  {name}")
+
+
+def summarize(samples):
+    return {metric: {"median": round(statistics.median(s[metric] for s in samples), 1),
+                     "min": round(min(s[metric] for s in samples), 1),
+                     "max": round(max(s[metric] for s in samples), 1)}
+            for metric in METRICS}
+
+
+def compare(results, baseline_path: str, threshold: float) -> int:
+    """Prints the change of the medians against a previous result file; returns the number of regressions."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["warmup"]: r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"\nvs {baseline_path} (regression: a median worse by more than {threshold:.0%})")
+    for row in results:
+        old = baseline.get(row["warmup"])
+        if old is None:
+            continue
+        changes = []
+        for metric in METRICS:
+            before, after = old["ms"][metric]["median"], row["ms"][metric]["median"]
+            change = after / before - 1 if before else 0.0
+            worse = change > threshold and after - before > 5.0  # 数 ms の揺れは無視する
+            regressions += worse
+            changes.append(f"{metric}={change:+.1%}{'!' if worse else ''}")
+        print(f"{row['warmup']:>10}  " + "  ".join(changes))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", nargs="+", choices=MODES, default=MODES, help="STARTUP_WARMUP modes to run")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--imports", type=int, default=0, help="also list the N slowest imports of main")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/bench_startup-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold for --baseline")
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child())
+        sys.exit(0)
+
+    results = []
+    print(f"{'warmup':>10} " + " ".join(f"{m.replace('_ms', ''):>15}" for m in METRICS) + "   (median ms)")
+    for mode in args.warmup:
+        samples = [run_child(mode) for _ in range(args.repeat)]
+        row = {"warmup": mode, "samples": len(samples), "ms": summarize(samples)}
+        results.append(row)
+        print(f"{mode:>10} " + " ".join(f"{row['ms'][m]['median']:>15.1f}" for m in METRICS))
+    if args.imports:
+        slowest_imports(args.imports)
+
+    sys.path.insert(0, BACKEND_DIR)
+    from benchmarks.bench_api import git_commit
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_startup-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "args": vars(args),
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
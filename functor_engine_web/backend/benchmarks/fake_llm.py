@@ -0,0 +1,193 @@
+"""
+Deterministic stand-in for the Gemini chat models (offline benchmarks).
+
+FakeChatModel recognizes the engine's prompts and answers them the way the real model
+is asked to: entity lists, grouped entity lists, world-chunk extractions (nodes/edges
+between the `concept_<n>` names found in the chunk), translations (streamed word by
+word; fused prompts apply every candidate law) and image descriptions. Every call
+waits `latency` seconds (+/- `jitter`), streamed chunks additionally `token_latency`
+each, so the server's own overhead can be measured against a known model cost. Token
+usage is reported at ~4 characters per token.
+
+Overload can be simulated: `error_rate` fails that fraction of calls, `rpm_limit` fails
+calls beyond that many per rolling minute, `fail_first` fails the first n calls, each
+with FakeRateLimitError (status_code 429, like the real API's RESOURCE_EXHAUSTED).
+
+    engine.llm = FakeChatModel(latency=0.05)
+    engine.vision_llm = FakeChatModel(latency=0.2)
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+CONCEPT_PATTERN = re.compile(r"\bconcept_\d+\b")
+WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z_]{3,}\d*")
+
+
+def _entities(text: str, limit: int = 8) -> List[str]:
+    """Concept names first, then other longer words (deduplicated, in order)."""
+    found = list(dict.fromkeys(CONCEPT_PATTERN.findall(text)))
+    for word in WORD_PATTERN.findall(text):
+        if len(found) >= limit:
+            break
+        if word not in found and not word.startswith("concept_"):
+            found.append(word)
+    return found[:limit]
+
+
+def _after(prompt: str, marker: str, end: Optional[str] = None) -> str:
+    start = prompt.find(marker)
+    if start < 0:
+        return prompt
+    text = prompt[start + len(marker):]
+    if end is not None and end in text:
+        text = text[:text.index(end)]
+    return text.strip()
+
+
+def respond(prompt: str) -> str:
+    """The fake model's answer to a prompt (pure function of the prompt)."""
+    if prompt.startswith("Extract key concepts") and "numbered texts" in prompt:
+        texts = re.findall(r"^\[\d+\] (.*)$", _after(prompt, "Texts:", "JSON List:"), flags=re.M)
+        return json.dumps([_entities(json.loads(t)) for t in texts])
+    if prompt.startswith("Extract key concepts"):
+        return json.dumps(_entities(_after(prompt, "Text:", "JSON List:")))
+    if prompt.startswith("Analyze the following world description"):
+        names = list(dict.fromkeys(CONCEPT_PATTERN.findall(_after(prompt, "Text:", "JSON:"))))
+        nodes = [{"id": n, "label": n.replace("_", " ").title(), "description": f"Synthetic {n}", "type": "concept"}
+                 for n in names]
+        edges = [{"source": a, "target": b, "label": "relates to", "rule": f"{a} shapes {b}"}
+                 for a, b in zip(names, names[1:])]
+        return json.dumps({"nodes": nodes, "edges": edges})
+    if "Describe this image" in prompt:
+        # 画像ごとに異なる説明 (後段の翻訳キャッシュが画像間で当たらないように)
+        image = re.search(r"\[image (\w+)\]", prompt)
+        scene = image.group(1) if image else "0"
+        return f"A quiet harbor at dusk (scene {scene}): concept_1 watches concept_2 unload crates while lanterns flicker."
+    if "Candidate World Laws:" in prompt:
+        original = _after(prompt, "Original Text:", "Candidate World Laws:")
+        numbers = re.findall(r"^\s*\[(\d+)\]", _after(prompt, "Candidate World Laws:"), flags=re.M)
+        return f"LAWS: {', '.join(numbers) or 'none'}\nIn this world, {original}"
+    if "Original Text:" in prompt:
+        original = _after(prompt, "Original Text:", "World Laws:")
+        return "In this world, " + original
+    return "OK"
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, message: str = "429 RESOURCE_EXHAUSTED (fake)", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _usage(prompt: str, text: str) -> dict:
+    # トークン数は 4 文字 = 1 トークンで近似
+    input_tokens, output_tokens = max(1, len(prompt) // 4), max(1, len(text) // 4)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.05  # seconds per call (time to first token when streaming)
+    token_latency: float = 0.0  # additional seconds per streamed word
+    jitter: float = 0.0  # +/- fraction of latency, uniformly distributed
+    seed: int = 0
+    error_rate: float = 0.0  # fraction of calls failing with 429
+    rpm_limit: int = 0  # calls per rolling minute before failing with 429 (0: unlimited)
+    fail_first: int = 0  # the first n calls fail with 429
+
+    _rng: random.Random = PrivateAttr(default=None)
+    _calls: int = PrivateAttr(default=0)
+    _recent: list = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context: Any):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-functor"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _delay(self) -> float:
+        self._calls += 1
+        self._check_limits()
+        return max(0.0, self.latency * (1 + self.jitter * (2 * self._rng.random() - 1)))
+
+    def _check_limits(self):
+        if self._calls <= self.fail_first:
+            raise FakeRateLimitError()
+        if self.rpm_limit:
+            now = time.monotonic()
+            self._recent = [t for t in self._recent if now - t < 60.0]
+            if len(self._recent) >= self.rpm_limit:
+                raise FakeRateLimitError(retry_after=60.0 - (now - self._recent[0]))
+            self._recent.append(now)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise FakeRateLimitError()
+
+    @staticmethod
+    def _prompt(messages: List[BaseMessage]) -> str:
+        parts = []
+        for message in messages:
+            content = message.content
+            if isinstance(content, list):
+                content = " ".join(FakeChatModel._block_text(block) for block in content if isinstance(block, dict))
+            parts.append(content)
+        # Template prompts arrive as one human message; chat prompts as system + user
+        return "\n".join(parts).strip()
+
+    @staticmethod
+    def _block_text(block: dict) -> str:
+        if block.get("type") == "image_url":
+            url = block["image_url"]["url"] if isinstance(block.get("image_url"), dict) else block.get("image_url", "")
+            return f"[image {hashlib.sha1(str(url).encode()).hexdigest()[:8]}]"
+        return block.get("text", "")
+
+    def _result(self, messages) -> ChatResult:
+        prompt = self._prompt(messages)
+        text = respond(prompt)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=_usage(prompt, text)))])
+
+    def _chunks(self, messages) -> Iterator[ChatGenerationChunk]:
+        prompt = self._prompt(messages)
+        text = respond(prompt)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            # 使用量は最後のチャンクにまとめて付ける
+            usage = _usage(prompt, text) if i == len(words) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=(" " if i else "") + word, usage_metadata=usage))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay())
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(messages)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield chunk
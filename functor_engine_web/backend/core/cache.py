@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class TranslationCache:
+    """
+    Translation result cache keyed on (input text, graph fingerprint).
+
+    - In-memory LRU bounded by `max_size` entries and `ttl` seconds
+    - Optional SQLite tier at `disk_path` that survives restarts, bounded by
+      `disk_max_rows` rows. set() only queues the row; a writer thread commits the
+      queue in one transaction every `flush_interval` seconds and then prunes expired
+      rows and the oldest rows over the cap, so the request path never waits on a commit.
+    Any graph mutation changes the fingerprint, so stale entries are never returned.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, disk_path: Optional[str] = None,
+                 disk_max_rows: int = 100_000, flush_interval: float = 1.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.disk_max_rows = disk_max_rows
+        self.flush_interval = flush_interval
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._pending: Dict[str, tuple] = {}  # key -> (expires_at, json) まだディスクに書いていない行
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # SQLite 接続はスレッド間で共有するので直列化する
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_pruned = 0
+
+        self._db = None
+        self._wake = threading.Event()
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+        if disk_path:
+            directory = os.path.dirname(os.path.abspath(disk_path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations "
+                "(key TEXT PRIMARY KEY, expires_at REAL, value TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS translations_expires ON translations (expires_at)")
+            self._prune()
+            self._writer = threading.Thread(target=self._write_loop, name="translation-cache-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def make_key(text: str, fingerprint: str, namespace: str = "translate") -> str:
+        digest = hashlib.sha256()
+        for part in (namespace, fingerprint, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            row = self._pending.get(key)
+
+        if row is None and self._db is not None:
+            # 主キーでの 1 行の読み出し (書き込みはライタースレッドがまとめて行う)
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+        with self._lock:
+            if row is not None and row[0] >= now:
+                value = json.loads(row[1])
+                self._store(key, row[0], value)
+                self.hits += 1
+                self.disk_hits += 1
+                return value
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, expires_at, value)
+            if self._db is not None:
+                self._pending[key] = (expires_at, json.dumps(value, ensure_ascii=False))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def flush(self):
+        """Commits the queued rows in one transaction, then prunes the table."""
+        if self._db is None:
+            return
+        with self._lock:
+            rows, self._pending = self._pending, {}
+        if rows:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO translations (key, expires_at, value) VALUES (?, ?, ?)",
+                    [(key, expires_at, value) for key, (expires_at, value) in rows.items()],
+                )
+                self._db.commit()
+            self._prune()
+
+    def close(self):
+        """Writes the remaining rows and stops the writer thread."""
+        self._closed = True
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_hits": self.disk_hits,
+                "disk_enabled": self._db is not None,
+                "disk_max_rows": self.disk_max_rows,
+                "disk_pending": len(self._pending),
+                "disk_pruned": self.disk_pruned,
+            }
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error writing translation cache: {e}")
+
+    def _prune(self):
+        """Deletes expired rows, then the oldest rows (earliest expiry) over disk_max_rows."""
+        with self._db_lock:
+            pruned = self._db.execute("DELETE FROM translations WHERE expires_at < ?", (time.time(),)).rowcount
+            excess = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()[0] - self.disk_max_rows
+            if excess > 0:
+                pruned += self._db.execute(
+                    "DELETE FROM translations WHERE key IN "
+                    "(SELECT key FROM translations ORDER BY expires_at LIMIT ?)", (excess,)
+                ).rowcount
+            self._db.commit()
+        self.disk_pruned += pruned
+
+    def _store(self, key: str, expires_at: float, value: Dict[str, Any]):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
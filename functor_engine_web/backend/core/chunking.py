@@ -0,0 +1,220 @@
+import hashlib
+import re
+from typing import List, Tuple
+
+HEADING = re.compile(r"^#{1,6}\s")
+FILE_MARKER = re.compile(r"^# File:\s")  # frontend が複数ファイルを結合するときの区切り
+FENCE = re.compile(r"^\s*(```|~~~)")
+BLANK = re.compile(r"^\s*$")
+
+
+def _blocks(text: str) -> List[List]:
+    """Splits text into [is_file_start, text] blocks at Markdown headings (outside code fences)."""
+    blocks: List[List] = []
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        if FENCE.match(line):
+            in_fence = not in_fence
+        if (not in_fence and HEADING.match(line)) or not blocks:
+            blocks.append([bool(FILE_MARKER.match(line)), line])
+        else:
+            blocks[-1][1] += line
+    return blocks
+
+
+def _paragraphs(text: str) -> List[str]:
+    """Splits a block after each run of blank lines (separators stay attached)."""
+    parts = [""]
+    previous_blank = False
+    for line in text.splitlines(keepends=True):
+        blank = bool(BLANK.match(line))
+        if previous_blank and not blank:
+            parts.append("")
+        parts[-1] += line
+        previous_blank = blank
+    return parts
+
+
+def _cut_point(text: str, max_chars: int) -> int:
+    """Prefers a line or sentence end in the second half of the window over a hard cut."""
+    window = text[:max_chars]
+    for sep in ("\n", "。", ". ", "! ", "? ", "、", ", ", " "):
+        i = window.rfind(sep)
+        if i >= max_chars // 2:
+            return i + len(sep)
+    return max_chars
+
+
+def _boundary_rank(level: int, next_unit: str) -> Tuple[int, int]:
+    """
+    Priority of a boundary: section ends before paragraph ends before hard cuts
+    (`level` 2/1/0), ties broken by a hash of the first line after it (usually a
+    heading), so editing the body of a section never moves a boundary.
+    """
+    first_line = next_unit.split("\n", 1)[0]
+    digest = hashlib.sha1(first_line.encode("utf-8")).digest()
+    return level, int.from_bytes(digest[:8], "big")
+
+
+def _split_units(units: List[Tuple[str, int]], max_chars: int) -> List[str]:
+    """
+    Splits a run of (unit, level) pieces: a span over `max_chars` is cut at its highest
+    ranked inner boundary and both halves are split again. Where a boundary falls
+    depends only on the units around it, not on the sizes of earlier chunks.
+    """
+    offsets = [0]
+    for unit, _ in units:
+        offsets.append(offsets[-1] + len(unit))
+    # ranks[i]: the boundary between units[i] and units[i + 1]
+    ranks = [_boundary_rank(level, units[i + 1][0]) for i, (_, level) in enumerate(units[:-1])]
+    chunks: List[str] = []
+    stack = [(0, len(units))]
+    while stack:
+        start, end = stack.pop()
+        if end - start == 1 or offsets[end] - offsets[start] <= max_chars:
+            chunks.append("".join(unit for unit, _ in units[start:end]))
+            continue
+        cut = max(range(start, end - 1), key=ranks.__getitem__) + 1
+        stack.append((cut, end))  # 左半分を先に処理して順序を保つ
+        stack.append((start, cut))
+    return chunks
+
+
+def split_markdown(text: str, max_chars: int = 6000) -> List[str]:
+    """
+    Splits Markdown into chunks of at most `max_chars` characters.
+
+    The units are heading sections; an oversized section is split at paragraph
+    boundaries and an oversized paragraph at a line/sentence end (or hard). Chunks
+    never span two `# File:` sections. A file section over `max_chars` is cut at the
+    boundary ranked highest by (section > paragraph > hard cut, hash of the following
+    heading) and the halves are split the same way, so boundaries are content-defined.
+    Editing the body of one section changes only the chunk that contains it; when the
+    edit moves a span across `max_chars`, that span is split or merged at the same
+    predetermined boundaries. The split is lossless:
+    "".join(split_markdown(text)) == text.
+    """
+    chunks: List[str] = []
+    units: List[Tuple[str, int]] = []
+
+    def flush():
+        if units:
+            chunks.extend(_split_units(units, max_chars))
+            units.clear()
+
+    for is_file_start, block in _blocks(text):
+        if is_file_start:
+            flush()
+        if len(block) <= max_chars:
+            units.append((block, 2))
+            continue
+        paragraphs = _paragraphs(block)
+        for i, piece in enumerate(paragraphs):
+            while len(piece) > max_chars:
+                cut = _cut_point(piece, max_chars)
+                units.append((piece[:cut], 0))
+                piece = piece[cut:]
+            units.append((piece, 2 if i == len(paragraphs) - 1 else 1))
+    flush()
+    return chunks
+
+
+def split_paragraphs(text: str, max_chars: int = 2000) -> List[Tuple[str, bool]]:
+    """
+    Splits Markdown into (segment, translatable) pieces for per-paragraph translation.
+
+    Paragraphs (separated by blank lines) are the units and a heading stays with the
+    paragraph that follows it. Fenced code blocks, `# File:` markers and the whitespace
+    around each unit are passed through; a paragraph over `max_chars` is cut at a
+    line/sentence end. The split is lossless: "".join(s for s, _ in segments) == text.
+    Editing one paragraph changes only that paragraph's segment.
+    """
+    units: List[List] = []  # [text, kind] kind: text | heading | code | other
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        fence = bool(FENCE.match(line))
+        if in_fence or fence:
+            if fence and not in_fence or not units or units[-1][1] != "code":
+                units.append(["", "code"])
+            units[-1][0] += line
+            if fence:
+                in_fence = not in_fence
+            continue
+        if BLANK.match(line):
+            if units and units[-1][1] == "heading":
+                units[-1][0] += line  # 見出しと直後の段落の間の空行
+            elif units and units[-1][1] == "other":
+                units[-1][0] += line
+            else:
+                units.append([line, "other"])
+        elif FILE_MARKER.match(line):
+            units.append([line, "other"])
+        elif HEADING.match(line):
+            units.append([line, "heading"])
+        elif units and units[-1][1] in ("text", "heading"):
+            units[-1][0] += line
+            units[-1][1] = "text"
+        else:
+            units.append([line, "text"])
+
+    segments: List[Tuple[str, bool]] = []
+
+    def emit(piece: str, translatable: bool):
+        if not piece:
+            return
+        if segments and not translatable and not segments[-1][1]:
+            segments[-1] = (segments[-1][0] + piece, False)
+        else:
+            segments.append((piece, translatable))
+
+    for unit, kind in units:
+        if kind in ("code", "other") or not unit.strip():
+            emit(unit, False)
+            continue
+        # 前後の空白 (インデント・改行) は訳文に付け直す
+        core = unit.strip()
+        start = unit.index(core)
+        emit(unit[:start], False)
+        while len(core) > max_chars:
+            cut = _cut_point(core, max_chars)
+            piece, core = core[:cut], core[cut:]
+            stripped = piece.rstrip()
+            emit(stripped, True)
+            emit(piece[len(stripped):], False)
+            # 切れ目の後ろの空白 (改行・インデント) も訳文に含めない
+            rest = core.lstrip()
+            emit(core[:len(core) - len(rest)], False)
+            core = rest
+        emit(core, True)
+        emit(unit[start + len(unit.strip()):], False)
+    return segments
+
+
+def split_documents(text: str, default_doc_id: str = "world") -> List[Tuple[str, str]]:
+    """
+    Splits combined text into (doc_id, text) documents at `# File: <name>` markers.
+    Text before the first marker belongs to `default_doc_id`.
+    """
+    documents: List[Tuple[str, str]] = []
+    seen = {}
+    doc_id, current = default_doc_id, ""
+
+    def emit():
+        if current.strip():
+            # 同名ファイルが複数ある場合は連番を付けて区別する
+            seen[doc_id] = seen.get(doc_id, 0) + 1
+            unique_id = doc_id if seen[doc_id] == 1 else f"{doc_id} ({seen[doc_id]})"
+            documents.append((unique_id, current))
+
+    for line in text.splitlines(keepends=True):
+        if FILE_MARKER.match(line):
+            emit()
+            doc_id, current = line.split(":", 1)[1].strip() or default_doc_id, ""
+        current += line
+    emit()
+    return documents
+
+
+def chunk_key(doc_id: str, chunk: str) -> str:
+    """Provenance key of a chunk: document id + content hash."""
+    return f"{doc_id}#{hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]}"
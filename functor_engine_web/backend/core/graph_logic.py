@@ -1,67 +1,385 @@
-import networkx as nx
-from typing import List, Dict, Any
+import hashlib
+import json
+import threading
+from collections import deque
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from .models import WorldObject, Morphism
+from .matcher import NodeMatcher, normalize
+from .semantic_index import SemanticIndex
+from .graph_store import create_store
+
+EMPTY_FINGERPRINT = hashlib.sha1(b"").hexdigest()
+DEFAULT_BACKEND = "networkx"
+# Number of node/edge changes remembered for delta exports (export_delta)
+CHANGE_LOG_SIZE = 10000
+
+
+class FrozenGraphError(RuntimeError):
+    """Raised when a published (frozen) graph version is mutated; build on graph.copy() instead."""
+
 
 class CategoryGraph:
-    def __init__(self):
-        # MultiDiGraph allows multiple edges between nodes (multiple laws/relationships)
-        self.graph = nx.MultiDiGraph()
+    def __init__(self, backend: str = DEFAULT_BACKEND):
+        # Directed multigraph storage (multiple laws/relationships between two concepts),
+        # see graph_store: "networkx" (nx.MultiDiGraph) or "array" (compact CSR arrays)
+        self.store = create_store(backend)
+        self.backend = backend
+        # Entity -> node lookup index, kept in sync with the nodes
+        self.matcher = NodeMatcher()
+        # Offline embedding index over labels/descriptions for fuzzy (paraphrase) lookup
+        self.semantic_index = SemanticIndex()
+        # version: bumped on every mutation (monotonic, also across clear)
+        # fingerprint: hash chained over the mutations, identical for identically built worlds
+        self.version = 0
+        self.fingerprint = EMPTY_FINGERPRINT
+        # Bounded log of (version, "node", node_id) / (version, "edge", (source, target, key))
+        # for delta exports; versions below _changes_floor are no longer covered
+        self._changes = deque(maxlen=CHANGE_LOG_SIZE)
+        self._changes_floor = 0
+        # (version, serialized full export) of the last export_json call
+        self._export_cache: Tuple[int, bytes] = (-1, b"")
+        # (version, {node_id: (x, y)}) computed by core.layout; kept across versions for warm starts
+        self.layout_state: Optional[Tuple[int, Dict[str, Tuple[float, float]]]] = None
+        # True after load_bulk until the lookup indexes have been built
+        self._indexes_pending = False
+        # Source documents: doc_id -> provenance keys of its chunks ("<doc_id>#<hash>")
+        self.documents: Dict[str, List[str]] = {}
+        # node_id -> formatted laws (get_context); entries are dropped when the node's out-edges change
+        self._context_cache: Dict[str, str] = {}
+        # Published versions are frozen (read-only, shared by concurrent requests without locks).
+        # Writers copy() the current version, mutate the copy and publish it as a new version;
+        # _parent identifies the version a copy was made from (see derived_from)
+        self.frozen = False
+        self._parent: Optional[Tuple[int, str]] = None
+        self._index_lock = threading.Lock()
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.store
+
+    def number_of_nodes(self) -> int:
+        return self.store.number_of_nodes()
+
+    def number_of_edges(self) -> int:
+        return self.store.number_of_edges()
+
+    def freeze(self):
+        """Makes this version read-only (done by WorldRegistry when it is published)."""
+        self.frozen = True
+
+    def copy(self) -> "CategoryGraph":
+        """
+        Writable copy of this version (same version, fingerprint and change log) to build
+        the next version on. Caches are carried over; they are keyed on the version.
+        """
+        clone = CategoryGraph.__new__(CategoryGraph)
+        clone.__dict__.update(self.__dict__)
+        with self._index_lock:
+            clone._indexes_pending = self._indexes_pending
+            clone.matcher = self.matcher.copy()
+            clone.semantic_index = self.semantic_index.copy()
+        clone.store = self.store.copy()
+        clone._changes = deque(self._changes, maxlen=CHANGE_LOG_SIZE)
+        clone.documents = {doc_id: list(keys) for doc_id, keys in self.documents.items()}
+        clone._context_cache = dict(self._context_cache)
+        clone.frozen = False
+        clone._parent = (self.version, self.fingerprint)
+        clone._index_lock = threading.Lock()
+        return clone
+
+    def derived_from(self, other: Optional["CategoryGraph"]) -> bool:
+        """True if this graph is a copy() of `other`'s current version (its change log continues other's)."""
+        return other is not None and self._parent == (other.version, other.fingerprint)
+
+    def _check_writable(self):
+        if self.frozen:
+            raise FrozenGraphError(f"Graph version {self.version} is published and read-only; mutate a copy()")
 
     def add_node(self, node: WorldObject):
-        self.graph.add_node(node.id, data=node)
+        self._check_writable()
+        self.store.add_node(node.id, node)
+        self.matcher.add(node.id, node.label)
+        self.semantic_index.add(node.id, node.label, node.description)
+        self._bump("node", node.model_dump_json())
+        self._record("node", node.id)
 
-    def add_morphism(self, morphism: Morphism):
-        self.graph.add_edge(
+    def add_morphism(self, morphism: Morphism, **attrs: Any):
+        """Adds an edge; extra attrs (e.g. provenance `sources`) are stored on the edge."""
+        self._check_writable()
+        # Endpoints without a WorldObject are created implicitly; index them by id
+        new_endpoints = [n for n in {morphism.source, morphism.target} if n not in self.store]
+        for node_id in new_endpoints:
+            self.matcher.add(node_id)
+        key = self.store.add_edge(
             morphism.source,
             morphism.target,
-            label=morphism.label,
-            rule=morphism.rule
+            {"label": morphism.label, "rule": morphism.rule, **attrs},
         )
+        self._context_cache.pop(morphism.source, None)
+        self._bump("edge", morphism.source, morphism.target, morphism.label, morphism.rule)
+        for node_id in new_endpoints:
+            self._record("node", node_id)
+        self._record("edge", (morphism.source, morphism.target, key))
+
+    def get_node(self, node_id: str) -> WorldObject:
+        """Returns the node's WorldObject (None for unknown ids and bare edge endpoints)."""
+        return self.store.get_data(node_id)
+
+    def nodes(self) -> Iterator[Tuple[str, Optional[WorldObject]]]:
+        """Iterates (node_id, WorldObject or None for bare edge endpoints)."""
+        return self.store.nodes()
+
+    def edges(self) -> Iterator[Tuple[str, str, Any, Dict[str, Any]]]:
+        """Iterates (source, target, key, attrs) over all edges."""
+        return self.store.edges()
+
+    def out_edges(self, node_id: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterates (target, attrs) over a node's outgoing edges."""
+        return self.store.out_edges(node_id)
+
+    def get_edge(self, source: str, target: str, key: Any) -> Dict[str, Any]:
+        """Returns a copy of an edge's attributes."""
+        return self.store.get_edge(source, target, key)
+
+    def degree(self, node_id: str) -> int:
+        return self.store.degree(node_id)
+
+    def lookup(self, name: str) -> str:
+        """Exact (normalized) id/label lookup; prefers nodes that have a WorldObject."""
+        self._ensure_indexes()
+        node_ids = sorted(self.matcher.lookup(name))
+        with_data = [n for n in node_ids if self.get_node(n) is not None]
+        return (with_data or node_ids or [None])[0]
+
+    def find_edge(self, source: str, target: str, label: str):
+        """Returns the key of an edge source -> target whose label matches (normalized), or None."""
+        wanted = normalize(label)
+        for key, attrs in self.store.edges_between(source, target):
+            if normalize(attrs.get('label', '')) == wanted:
+                return key
+        return None
+
+    def update_edge(self, source: str, target: str, key: Any, **attrs: Any):
+        self._check_writable()
+        # The edge's label (not its backend-specific key) goes into the fingerprint
+        label = self.store.get_edge(source, target, key).get('label', '')
+        self.store.update_edge(source, target, key, attrs)
+        self._context_cache.pop(source, None)
+        self._bump("edge-update", source, target, label, repr(sorted(attrs.items())))
+        self._record("edge", (source, target, key))
+
+    def remove_edge(self, source: str, target: str, key: Any):
+        self._check_writable()
+        label = self.store.get_edge(source, target, key).get('label', '')
+        self.store.remove_edge(source, target, key)
+        self._context_cache.pop(source, None)
+        self._bump("edge-remove", source, target, label)
+        self._record("edge", (source, target, key))
+
+    def remove_node(self, node_id: str):
+        """Removes a node and its incident edges."""
+        self._check_writable()
+        for predecessor in self.store.predecessors(node_id):
+            self._context_cache.pop(predecessor, None)
+        self._context_cache.pop(node_id, None)
+        incident = self.store.incident_edges(node_id)
+        self.store.remove_node(node_id)
+        self.matcher.remove(node_id)
+        self.semantic_index.remove(node_id)
+        self._bump("node-remove", node_id)
+        self._record("node", node_id)
+        for edge in incident:
+            self._record("edge", edge)
+
+    def demote_node(self, node_id: str):
+        """Drops a node's WorldObject but keeps it as a bare endpoint of its edges."""
+        self._check_writable()
+        self.store.pop_data(node_id)
+        self.matcher.add(node_id)
+        self.semantic_index.remove(node_id)
+        self._bump("node-demote", node_id)
+        self._record("node", node_id)
+
+    def load_bulk(self, nodes: List[Tuple[str, Dict[str, Any]]], edges: List[Tuple[str, str, Dict[str, Any]]]):
+        """
+        Adds many (node_id, attrs) / (source, target, attrs) records at once, e.g. from a snapshot.
+        Skips per-element bookkeeping; the matcher and semantic indexes are built
+        on first use and version/fingerprint are left for the caller to set.
+        """
+        self._check_writable()
+        self.store.load_bulk(nodes, edges)
+        self._context_cache.clear()
+        self._indexes_pending = True
+        self.reset_history(self.version)
+
+    def _ensure_indexes(self):
+        if not self._indexes_pending:
+            return
+        # Published versions are read from several threads: build once, under the lock
+        with self._index_lock:
+            if not self._indexes_pending:
+                return
+            for node_id, node in self.store.nodes():
+                if node is None:
+                    self.matcher.add(node_id)
+                else:
+                    self.matcher.add(node_id, node.label)
+                    self.semantic_index.add(node_id, node.label, node.description)
+            self._indexes_pending = False
 
     def get_context(self, node_id: str) -> str:
         """Retrieves laws (morphisms) surrounding a concept for RAG."""
-        if node_id not in self.graph:
+        cached = self._context_cache.get(node_id)
+        if cached is not None:
+            return cached
+        if node_id not in self.store:
             return ""
-        
+
         # Get outgoing edges (laws starting from this concept)
-        edges = self.graph.out_edges(node_id, data=True)
         context = []
-        for u, v, data in edges:
+        for v, data in self.store.out_edges(node_id):
             context.append(f"- {data.get('label', 'Relation')}: {data.get('rule', '')} (-> {v})")
-        
+
         # Optionally, we could also look at incoming edges or neighbors
-        return "\n".join(context)
+        formatted = "\n".join(context)
+        self._context_cache[node_id] = formatted
+        return formatted
+
+    @property
+    def etag(self) -> str:
+        """HTTP entity tag of the current state (version + fingerprint)."""
+        return f'"{self.version}-{self.fingerprint[:16]}"'
+
+    @staticmethod
+    def _vis_node(n_id: str, node_data: Optional[WorldObject]) -> Dict[str, Any]:
+        if node_data:
+            return {
+                "id": n_id,
+                "label": node_data.label,
+                "title": node_data.description,
+                "group": node_data.type
+            }
+        # Fallback if data is missing
+        return {
+            "id": n_id,
+            "label": n_id,
+            "group": "unknown"
+        }
+
+    @staticmethod
+    def _vis_edge(u: str, v: str, key: Any, attrs: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": f"{u}->{v}#{key}",
+            "from": u,
+            "to": v,
+            "label": attrs.get('label', ''),
+            "title": attrs.get('rule', '')
+        }
 
     def export_for_vis(self) -> Dict[str, List[Dict[str, Any]]]:
         """Exports the graph in a format suitable for PyVis/Vis.js."""
-        nodes = []
-        for n_id, attrs in self.graph.nodes(data=True):
-            node_data: WorldObject = attrs.get('data')
-            if node_data:
-                nodes.append({
-                    "id": n_id,
-                    "label": node_data.label,
-                    "title": node_data.description,
-                    "group": node_data.type
-                })
+        nodes = [self._vis_node(n_id, node_data) for n_id, node_data in self.store.nodes()]
+        edges = [self._vis_edge(u, v, key, attrs) for u, v, key, attrs in self.store.edges()]
+        return {"nodes": nodes, "edges": edges}
+
+    def export_json(self) -> bytes:
+        """Full export (plus version) serialized as JSON; cached until the next mutation."""
+        version, payload = self._export_cache
+        if version != self.version:
+            data = {"version": self.version, "full": True, **self.export_for_vis()}
+            payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self._export_cache = (self.version, payload)
+        return payload
+
+    def export_delta(self, since: int) -> Optional[Dict[str, Any]]:
+        """
+        Nodes/edges changed after version `since` (current state of each, plus the ids
+        of removed ones). Returns None when the change log no longer covers `since`;
+        the caller should then send a full export.
+        """
+        if since < self._changes_floor or since > self.version:
+            return None
+        node_ids, edge_keys = {}, {}
+        for version, kind, key in self._changes:
+            if version > since:
+                (node_ids if kind == "node" else edge_keys)[key] = None
+        delta = {"version": self.version, "full": False, "nodes": [], "edges": [],
+                 "removed_nodes": [], "removed_edges": []}
+        for n_id in node_ids:
+            if n_id in self.store:
+                delta["nodes"].append(self._vis_node(n_id, self.store.get_data(n_id)))
             else:
-                # Fallback if data is missing
-                nodes.append({
-                    "id": n_id,
-                    "label": n_id,
-                    "group": "unknown"
-                })
-
-        edges = []
-        for u, v, key, attrs in self.graph.edges(keys=True, data=True):
-            edges.append({
-                "from": u,
-                "to": v,
-                "label": attrs.get('label', ''),
-                "title": attrs.get('rule', '')
-            })
+                delta["removed_nodes"].append(n_id)
+        for u, v, key in edge_keys:
+            try:
+                delta["edges"].append(self._vis_edge(u, v, key, self.store.get_edge(u, v, key)))
+            except KeyError:
+                delta["removed_edges"].append(f"{u}->{v}#{key}")
+        return delta
 
-        return {"nodes": nodes, "edges": edges}
+    def find_nodes(self, entity: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Returns ranked (node_id, score) candidates for an entity name."""
+        self._ensure_indexes()
+        return self.matcher.match(entity, limit=limit)
+
+    def scan_entities(self, text: str) -> Tuple[List[Tuple[str, str]], float]:
+        """
+        Finds the graph's concepts mentioned verbatim in a text (multi-pattern scan).
+        Returns ([(mention, node_id)], coverage of the text by those mentions).
+        """
+        self._ensure_indexes()
+        matches, coverage = self.matcher.scan(text)
+        pairs = []
+        seen = set()
+        for mention, node_ids in matches:
+            for node_id in node_ids:
+                if node_id not in seen:
+                    seen.add(node_id)
+                    pairs.append((mention, node_id))
+        return pairs, coverage
+
+    def semantic_search(self, entities: List[str], k: int = 5,
+                        threshold: float = None) -> List[List[Tuple[str, float]]]:
+        """Returns ranked (node_id, similarity) candidates for every entity in one batch."""
+        self._ensure_indexes()
+        return self.semantic_index.search(entities, k=k, threshold=threshold)
+
+    def estimated_memory(self) -> int:
+        """Approximate resident size in bytes (used for the world registry's memory budget)."""
+        return self.store.estimated_memory() + self.semantic_index.nbytes
 
     def clear(self):
-        self.graph.clear()
+        self._check_writable()
+        self._indexes_pending = False
+        self.documents = {}
+        self._context_cache.clear()
+        self.store.clear()
+        self.matcher.clear()
+        self.semantic_index.clear()
+        self.version += 1
+        self.fingerprint = EMPTY_FINGERPRINT
+        self.reset_history(self.version)
+
+    def reset_history(self, version: int, fingerprint: Optional[str] = None):
+        """
+        Sets the version (and optionally the fingerprint), e.g. after a snapshot load,
+        and forgets the change log: exports for older versions become full exports.
+        """
+        self._check_writable()
+        self.version = version
+        if fingerprint is not None:
+            self.fingerprint = fingerprint
+        self._changes.clear()
+        self._changes_floor = version
+
+    def _record(self, kind: str, key: Any):
+        if len(self._changes) == self._changes.maxlen:
+            self._changes_floor = self._changes[0][0]
+        self._changes.append((self.version, kind, key))
+
+    def _bump(self, *parts: str):
+        digest = hashlib.sha1(self.fingerprint.encode("ascii"))
+        for part in parts:
+            digest.update(b"\x1f")
+            digest.update(part.encode("utf-8"))
+        self.fingerprint = digest.hexdigest()
+        self.version += 1
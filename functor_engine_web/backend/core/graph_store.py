@@ -0,0 +1,367 @@
+"""
+Storage backends for CategoryGraph.
+
+Both stores keep a directed multigraph of node ids, optional WorldObjects and
+edge attribute dicts ("label", "rule" and any extra attributes such as
+provenance), and expose the same small set of primitives. Edge keys are opaque:
+callers only pass back what edges_between()/edges() returned.
+
+- NetworkXStore: nx.MultiDiGraph (the original representation).
+- ArrayStore: interned node ids, edges as parallel int32 arrays and CSR-style
+  out/in adjacency. Edges added after the last CSR build sit in small per-node
+  tails until the next rebuild, so mutation stays cheap.
+"""
+import sys
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .models import WorldObject
+
+# Rough per-element costs for memory budgeting (WorldObject + matcher/index entries per node)
+APPROX_NODE_BYTES = 2048
+APPROX_NX_EDGE_BYTES = 1024
+APPROX_EXTRA_ATTRS_BYTES = 256
+
+_CORE_EDGE_ATTRS = ("label", "rule")
+
+
+class NetworkXStore:
+    name = "networkx"
+
+    def __init__(self):
+        import networkx as nx  # 起動を速くするため初回の使用時に読み込む (array バックエンドでは不要)
+
+        # MultiDiGraph allows multiple edges between nodes (multiple laws/relationships)
+        self.graph = nx.MultiDiGraph()
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.graph
+
+    def number_of_nodes(self) -> int:
+        return self.graph.number_of_nodes()
+
+    def number_of_edges(self) -> int:
+        return self.graph.number_of_edges()
+
+    def add_node(self, node_id: str, data: Optional[WorldObject] = None):
+        if data is None:
+            self.graph.add_node(node_id)
+        else:
+            self.graph.add_node(node_id, data=data)
+
+    def get_data(self, node_id: str) -> Optional[WorldObject]:
+        if node_id not in self.graph:
+            return None
+        return self.graph.nodes[node_id].get("data")
+
+    def pop_data(self, node_id: str):
+        self.graph.nodes[node_id].pop("data", None)
+
+    def remove_node(self, node_id: str):
+        self.graph.remove_node(node_id)
+
+    def nodes(self) -> Iterator[Tuple[str, Optional[WorldObject]]]:
+        for node_id, attrs in self.graph.nodes(data=True):
+            yield node_id, attrs.get("data")
+
+    def degree(self, node_id: str) -> int:
+        return self.graph.degree(node_id)
+
+    def predecessors(self, node_id: str) -> Set[str]:
+        return set(self.graph.predecessors(node_id))
+
+    def incident_edges(self, node_id: str) -> List[Tuple[str, str, Any]]:
+        return list(self.graph.out_edges(node_id, keys=True)) + list(self.graph.in_edges(node_id, keys=True))
+
+    def add_edge(self, source: str, target: str, attrs: Dict[str, Any]):
+        return self.graph.add_edge(source, target, **attrs)
+
+    def edges_between(self, source: str, target: str) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        yield from self.graph.get_edge_data(source, target, default={}).items()
+
+    def get_edge(self, source: str, target: str, key: Any) -> Dict[str, Any]:
+        return dict(self.graph.edges[source, target, key])
+
+    def update_edge(self, source: str, target: str, key: Any, attrs: Dict[str, Any]):
+        self.graph.edges[source, target, key].update(attrs)
+
+    def remove_edge(self, source: str, target: str, key: Any):
+        self.graph.remove_edge(source, target, key)
+
+    def out_edges(self, node_id: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for _, target, attrs in self.graph.out_edges(node_id, data=True):
+            yield target, attrs
+
+    def edges(self) -> Iterator[Tuple[str, str, Any, Dict[str, Any]]]:
+        yield from self.graph.edges(keys=True, data=True)
+
+    def load_bulk(self, nodes, edges):
+        self.graph.add_nodes_from(nodes)
+        self.graph.add_edges_from(edges)
+
+    def clear(self):
+        self.graph.clear()
+
+    def copy(self) -> "NetworkXStore":
+        # nx copies every attribute dict (values are shared; they are replaced, never mutated)
+        clone = NetworkXStore.__new__(NetworkXStore)
+        clone.graph = self.graph.copy()
+        return clone
+
+    def estimated_memory(self) -> int:
+        return self.number_of_nodes() * APPROX_NODE_BYTES + self.number_of_edges() * APPROX_NX_EDGE_BYTES
+
+
+class ArrayStore:
+    name = "array"
+
+    # Rebuild the CSR once this many edges live in the tails (amortized O(1) per added edge)
+    MIN_TAIL_EDGES = 4096
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Nodes: interned ids (None marks a removed slot) and their WorldObjects
+        self._index: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._data: List[Optional[WorldObject]] = []
+        # Edge label/rule strings, stored once
+        self._string_index: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self._string_bytes = 0
+        # Edges: parallel arrays indexed by edge id (the edge key)
+        self._src = array("i")
+        self._dst = array("i")
+        self._label = array("i")
+        self._rule = array("i")
+        self._alive = bytearray()
+        self._extra: Dict[int, Dict[str, Any]] = {}
+        self._n_edges = 0
+        # CSR adjacency over the edges present at the last build + tails for newer edges
+        empty = np.zeros(1, dtype=np.int64)
+        self._out_ptr, self._out_idx = empty, np.zeros(0, dtype=np.int32)
+        self._in_ptr, self._in_idx = empty, np.zeros(0, dtype=np.int32)
+        self._out_tail: Dict[int, List[int]] = {}
+        self._in_tail: Dict[int, List[int]] = {}
+        self._tail_edges = 0
+
+    # --- nodes ---
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._index
+
+    def number_of_nodes(self) -> int:
+        return len(self._index)
+
+    def number_of_edges(self) -> int:
+        return self._n_edges
+
+    def _intern_node(self, node_id: str) -> int:
+        i = self._index.get(node_id)
+        if i is None:
+            i = self._index[node_id] = len(self._ids)
+            self._ids.append(node_id)
+            self._data.append(None)
+        return i
+
+    def add_node(self, node_id: str, data: Optional[WorldObject] = None):
+        i = self._intern_node(node_id)
+        if data is not None:
+            self._data[i] = data
+
+    def get_data(self, node_id: str) -> Optional[WorldObject]:
+        i = self._index.get(node_id)
+        return None if i is None else self._data[i]
+
+    def pop_data(self, node_id: str):
+        self._data[self._index[node_id]] = None
+
+    def remove_node(self, node_id: str):
+        i = self._index.pop(node_id)
+        for e in set(self._out(i) + self._in(i)):
+            self._kill_edge(e)
+        self._ids[i] = None
+        self._data[i] = None
+
+    def nodes(self) -> Iterator[Tuple[str, Optional[WorldObject]]]:
+        for node_id, data in zip(self._ids, self._data):
+            if node_id is not None:
+                yield node_id, data
+
+    def degree(self, node_id: str) -> int:
+        i = self._index[node_id]
+        return len(self._out(i)) + len(self._in(i))
+
+    def predecessors(self, node_id: str) -> Set[str]:
+        return {self._ids[self._src[e]] for e in self._in(self._index[node_id])}
+
+    def incident_edges(self, node_id: str) -> List[Tuple[str, str, int]]:
+        i = self._index[node_id]
+        return [(self._ids[self._src[e]], self._ids[self._dst[e]], e) for e in set(self._out(i) + self._in(i))]
+
+    # --- edges ---
+
+    def _intern_string(self, value: str) -> int:
+        i = self._string_index.get(value)
+        if i is None:
+            i = self._string_index[value] = len(self._strings)
+            self._strings.append(value)
+            self._string_bytes += sys.getsizeof(value)
+        return i
+
+    def _append_edge(self, source: str, target: str, attrs: Dict[str, Any]) -> int:
+        e = len(self._src)
+        self._src.append(self._intern_node(source))
+        self._dst.append(self._intern_node(target))
+        self._label.append(self._intern_string(attrs.get("label", "")))
+        self._rule.append(self._intern_string(attrs.get("rule", "")))
+        self._alive.append(1)
+        extra = {k: v for k, v in attrs.items() if k not in _CORE_EDGE_ATTRS}
+        if extra:
+            self._extra[e] = extra
+        self._n_edges += 1
+        return e
+
+    def add_edge(self, source: str, target: str, attrs: Dict[str, Any]) -> int:
+        e = self._append_edge(source, target, attrs)
+        self._out_tail.setdefault(self._src[e], []).append(e)
+        self._in_tail.setdefault(self._dst[e], []).append(e)
+        self._tail_edges += 1
+        if self._tail_edges > max(self.MIN_TAIL_EDGES, self._n_edges // 4):
+            self._build_csr()
+        return e
+
+    def _attrs(self, e: int) -> Dict[str, Any]:
+        attrs = dict(self._extra.get(e, ()))
+        attrs["label"] = self._strings[self._label[e]]
+        attrs["rule"] = self._strings[self._rule[e]]
+        return attrs
+
+    def _check_edge(self, source: str, target: str, key: int):
+        if not (0 <= key < len(self._alive) and self._alive[key]
+                and self._ids[self._src[key]] == source and self._ids[self._dst[key]] == target):
+            raise KeyError((source, target, key))
+
+    def edges_between(self, source: str, target: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        i, j = self._index.get(source), self._index.get(target)
+        if i is None or j is None:
+            return
+        for e in self._out(i):
+            if self._dst[e] == j:
+                yield e, self._attrs(e)
+
+    def get_edge(self, source: str, target: str, key: int) -> Dict[str, Any]:
+        self._check_edge(source, target, key)
+        return self._attrs(key)
+
+    def update_edge(self, source: str, target: str, key: int, attrs: Dict[str, Any]):
+        self._check_edge(source, target, key)
+        for name, value in attrs.items():
+            if name == "label":
+                self._label[key] = self._intern_string(value)
+            elif name == "rule":
+                self._rule[key] = self._intern_string(value)
+            else:
+                self._extra.setdefault(key, {})[name] = value
+
+    def remove_edge(self, source: str, target: str, key: int):
+        self._check_edge(source, target, key)
+        self._kill_edge(key)
+
+    def _kill_edge(self, e: int):
+        # Edge ids stay stable; dead slots are skipped and dropped from the CSR on the next rebuild
+        if self._alive[e]:
+            self._alive[e] = 0
+            self._extra.pop(e, None)
+            self._n_edges -= 1
+
+    def out_edges(self, node_id: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        i = self._index.get(node_id)
+        if i is None:
+            return
+        for e in self._out(i):
+            yield self._ids[self._dst[e]], self._attrs(e)
+
+    def edges(self) -> Iterator[Tuple[str, str, int, Dict[str, Any]]]:
+        for e, alive in enumerate(self._alive):
+            if alive:
+                yield self._ids[self._src[e]], self._ids[self._dst[e]], e, self._attrs(e)
+
+    # --- adjacency ---
+
+    def _out(self, i: int) -> List[int]:
+        return self._adjacent(i, self._out_ptr, self._out_idx, self._out_tail)
+
+    def _in(self, i: int) -> List[int]:
+        return self._adjacent(i, self._in_ptr, self._in_idx, self._in_tail)
+
+    def _adjacent(self, i: int, ptr: np.ndarray, idx: np.ndarray, tail: Dict[int, List[int]]) -> List[int]:
+        edge_ids = idx[ptr[i]:ptr[i + 1]].tolist() if i + 1 < len(ptr) else []
+        edge_ids.extend(tail.get(i, ()))
+        alive = self._alive
+        return [e for e in edge_ids if alive[e]]
+
+    def _build_csr(self):
+        n = len(self._ids)
+        src = np.frombuffer(self._src, dtype=np.int32).copy()
+        dst = np.frombuffer(self._dst, dtype=np.int32).copy()
+        live = np.flatnonzero(np.frombuffer(self._alive, dtype=np.uint8)).astype(np.int32)
+        self._out_ptr, self._out_idx = _csr(src[live], live, n)
+        self._in_ptr, self._in_idx = _csr(dst[live], live, n)
+        self._out_tail, self._in_tail = {}, {}
+        self._tail_edges = 0
+
+    def copy(self) -> "ArrayStore":
+        clone = ArrayStore.__new__(ArrayStore)
+        clone.__dict__.update(self.__dict__)
+        clone._index = dict(self._index)
+        clone._ids = list(self._ids)
+        clone._data = list(self._data)
+        clone._string_index = dict(self._string_index)
+        clone._strings = list(self._strings)
+        for name in ("_src", "_dst", "_label", "_rule"):
+            setattr(clone, name, array("i", getattr(self, name)))
+        clone._alive = bytearray(self._alive)
+        clone._extra = {e: dict(extra) for e, extra in self._extra.items()}
+        # CSR arrays are replaced on rebuild, never written in place: shared
+        clone._out_tail = {i: list(edge_ids) for i, edge_ids in self._out_tail.items()}
+        clone._in_tail = {i: list(edge_ids) for i, edge_ids in self._in_tail.items()}
+        return clone
+
+    def load_bulk(self, nodes, edges):
+        for node_id, attrs in nodes:
+            self.add_node(node_id, attrs.get("data"))
+        for source, target, attrs in edges:
+            self._append_edge(source, target, attrs)
+        self._build_csr()
+
+    def estimated_memory(self) -> int:
+        edge_slots = len(self._src)
+        return (
+            self.number_of_nodes() * APPROX_NODE_BYTES
+            + edge_slots * (4 * self._src.itemsize + 1)
+            + self._out_idx.nbytes + self._in_idx.nbytes + self._out_ptr.nbytes + self._in_ptr.nbytes
+            + self._string_bytes
+            + len(self._extra) * APPROX_EXTRA_ATTRS_BYTES
+        )
+
+
+def _csr(rows: np.ndarray, edge_ids: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Groups edge ids by row (stable, so insertion order is kept within a node)."""
+    order = np.argsort(rows, kind="stable")
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=ptr[1:])
+    return ptr, edge_ids[order]
+
+
+BACKENDS = {NetworkXStore.name: NetworkXStore, ArrayStore.name: ArrayStore}
+
+
+def create_store(backend: str = NetworkXStore.name):
+    try:
+        return BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"Unknown graph backend: {backend!r} (choose from {', '.join(BACKENDS)})")
@@ -0,0 +1,202 @@
+"""
+Image ingestion for /translate/image.
+
+- read_upload: reads the upload in chunks and stops at a size cap (no unbounded read())
+- prepare_image: decodes once, downscales to `max_side` and re-encodes as JPEG, and
+  computes a content digest (sha256 of the prepared bytes) and a 256-bit perceptual
+  hash (dHash) of the picture
+- DescriptionCache: vision model descriptions keyed on the content digest; optionally
+  (max_distance > 0) a perceptual hash within `max_distance` bits is treated as the
+  same image, unless the hash carries too little detail to tell images apart
+"""
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+
+from PIL import Image, ImageOps
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+HASH_SIZE = 16  # dHash grid: 16 x 16 = 256 bits
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_BANDS = 16  # 256-bit hash = 16 x 16-bit bands (near-duplicate lookup index)
+# 近似一致に使うハッシュの最小情報量: 立っているビット数 (勾配の向き) がこれ未満、または
+# HASH_BITS - これ より多いもの (単色・余白の多い画像など) は別の画像と区別できない
+MIN_HASH_BITS = 32
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    digest: str
+    phash: int
+
+
+async def read_upload(file, max_bytes: int, chunk_size: int = UPLOAD_CHUNK_BYTES) -> bytes:
+    """Reads an UploadFile-like object (async read(n)) and raises ImageTooLarge past max_bytes."""
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return bytes(buffer)
+        if len(buffer) + len(chunk) > max_bytes:
+            raise ImageTooLarge(f"Image exceeds the upload limit of {max_bytes} bytes")
+        buffer += chunk
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """256-bit difference hash: brightness gradients of a 17x16 grayscale thumbnail."""
+    width = HASH_SIZE + 1
+    small = image.convert("L").resize((width, HASH_SIZE), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[row * width + col] < pixels[row * width + col + 1])
+    return value
+
+
+def is_informative(phash: int) -> bool:
+    """False for low-entropy hashes (flat or mostly blank images) that must not be matched approximately."""
+    bits = bin(phash).count("1")
+    return MIN_HASH_BITS <= bits <= HASH_BITS - MIN_HASH_BITS
+
+
+def prepare_image(data: bytes, max_side: int = 1024, quality: int = 85) -> PreparedImage:
+    """
+    Downscales the image so its longer side is at most `max_side` and re-encodes it as
+    JPEG. CPU bound, callers should run it in a worker thread. Raises InvalidImage.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG はデコード時に 1/2, 1/4, 1/8 へ縮小できる (フル解像度を展開しない)
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            # 透過部分は白で埋める
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f"Could not read image: {e}") from e
+    data = out.getvalue()
+    return PreparedImage(data, "image/jpeg", image.width, image.height,
+                         hashlib.sha256(data).hexdigest(), perceptual_hash(image))
+
+
+class DescriptionCache:
+    """
+    Vision model descriptions keyed on the prepared image's sha256 (in-memory LRU + TTL).
+
+    Near-duplicate matching is opt-in: with max_distance > 0, an image whose 256-bit
+    perceptual hash is within `max_distance` differing bits of a cached one is a hit
+    (re-encoded, resized or slightly edited copies). Low-entropy hashes (see
+    is_informative) never match approximately. Near lookups use 16-bit bands: with
+    max_distance < HASH_BANDS two such hashes share at least one band exactly.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 86400.0, max_distance: int = 0):
+        if not 0 <= max_distance < HASH_BANDS:
+            raise ValueError(f"max_distance must be between 0 and {HASH_BANDS - 1}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # digest -> (expires_at, description, phash)
+        self._bands: Dict[tuple, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _band_keys(self, phash: Optional[int]):
+        if not self.max_distance or phash is None or not is_informative(phash):
+            return []
+        return [(band, (phash >> (16 * band)) & 0xFFFF) for band in range(HASH_BANDS)]
+
+    def get(self, digest: str, phash: Optional[int] = None) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] < now:
+                self._remove(digest)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+
+            best = None
+            candidates = set()
+            for key in self._band_keys(phash):
+                candidates |= self._bands.get(key, set())
+            for other in candidates:
+                entry = self._entries.get(other)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    self._remove(other)
+                    continue
+                distance = bin(phash ^ entry[2]).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, other)
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best[1])
+            self.hits += 1
+            self.near_hits += 1
+            return self._entries[best[1]][1]
+
+    def set(self, digest: str, description: str, phash: Optional[int] = None):
+        with self._lock:
+            if digest in self._entries:
+                self._remove(digest)
+            for key in self._band_keys(phash):
+                self._bands.setdefault(key, set()).add(digest)
+            self._entries[digest] = (time.time() + self.ttl, description, phash)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, digest: str):
+        _, _, phash = self._entries.pop(digest)
+        for key in self._band_keys(phash):
+            members = self._bands.get(key)
+            if members is not None:
+                members.discard(digest)
+                if not members:
+                    del self._bands[key]
@@ -0,0 +1,125 @@
+"""
+In-process background jobs (world initialization).
+
+Jobs run as asyncio tasks on the server's event loop; at most `max_workers` run at
+once and the rest wait in submission order. A job reports progress by updating its
+fields; the last `max_finished` finished jobs are kept for polling.
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ACTIVE = ("queued", "running")
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    world_id: str
+    status: str = "queued"  # queued | running | succeeded | failed | cancelled
+    stage: str = "queued"
+    chunks_total: int = 0
+    chunks_done: int = 0
+    chunks_failed: int = 0
+    nodes: int = 0
+    edges: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE
+
+    def update(self, **progress: Any):
+        """Progress callback: sets stage / counters (unknown keys are ignored)."""
+        for key, value in progress.items():
+            if key in ("stage", "chunks_total", "chunks_done", "chunks_failed", "nodes", "edges"):
+                setattr(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "world_id": self.world_id,
+            "status": self.status,
+            "stage": self.stage,
+            "chunks_total": self.chunks_total,
+            "chunks_done": self.chunks_done,
+            "chunks_failed": self.chunks_failed,
+            "nodes": self.nodes,
+            "edges": self.edges,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = 2, max_finished: int = 100):
+        self.max_workers = max(1, max_workers)
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def submit(self, kind: str, world_id: str, run: Callable[[Job], Awaitable[Dict[str, Any]]]) -> Job:
+        """Schedules run(job) on the running event loop; its return value becomes job.result."""
+        if self._slots is None:
+            # イベントループ上で最初に使われた時に作る
+            self._slots = asyncio.Semaphore(self.max_workers)
+        job = Job(job_id=uuid.uuid4().hex, kind=kind, world_id=world_id)
+        self._jobs[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        job.task.add_done_callback(lambda task: self._finish(job, task))
+        self._prune()
+        return job
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        async with self._slots:
+            job.status = "running"
+            job.started_at = time.time()
+            return await run(job)
+
+    def _finish(self, job: Job, task: asyncio.Task):
+        # 開始前にキャンセルされたタスクは _run を実行しないため、状態はここで確定させる
+        if task.cancelled():
+            job.status = "cancelled"
+        elif task.exception() is not None:
+            print(f"Job {job.job_id} ({job.kind} {job.world_id}) failed: {task.exception()}")
+            job.status = "failed"
+            job.error = str(task.exception())
+        else:
+            job.result = task.result()
+            job.status = "succeeded"
+            job.stage = "done"
+        job.finished_at = time.time()
+        job.task = None
+        self._prune()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Requests cancellation; returns the job (None if unknown). Finished jobs are left as they are."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.task is not None:
+            job.stage = "cancelling"
+            job.task.cancel()
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
@@ -0,0 +1,193 @@
+"""
+Server-side force-directed layout (Fruchterman-Reingold, vectorized with NumPy).
+
+Repulsion is exact for small graphs. Above EXACT_LIMIT nodes a grid approximation
+(Barnes-Hut style, one level) is used: nodes in the same cell repel each other
+exactly, every other cell acts as a single mass at its centroid. With ~sqrt(N)
+equal-count cells one iteration is O(N^1.5) instead of O(N^2).
+
+Positions are cached per graph version on the graph (CategoryGraph.layout_state) and
+warm-started from the previous positions when the graph changes: known nodes keep
+their place, new nodes start next to their neighbors, and fewer, cooler iterations
+are run.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .graph_logic import CategoryGraph
+
+EXACT_LIMIT = 400
+FULL_ITERATIONS = 150
+WARM_ITERATIONS = 40
+SCALE = 120.0  # layout unit -> pixels (vis.js coordinates)
+_CHUNK = 1024  # nodes per block in the far-field computation
+
+
+def prepare_layout(graph: CategoryGraph):
+    """
+    Copies what the layout needs out of the graph (walks every node and edge).
+    Returns (version, node_ids, edge index array, initial positions or None, warm).
+    """
+    node_ids = [node_id for node_id, _ in graph.nodes()]
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    edges = np.array([(index[u], index[v]) for u, v, _, _ in graph.edges() if u != v],
+                     dtype=np.int64).reshape(-1, 2)
+
+    state = graph.layout_state
+    previous = state[1] if state is not None else {}
+    known = sum(1 for node_id in node_ids if node_id in previous)
+    if known * 2 < len(node_ids):
+        # 大半が新しいノードなら最初から配置し直す
+        return graph.version, node_ids, edges, None, False
+
+    init = np.full((len(node_ids), 2), np.nan)
+    for i, node_id in enumerate(node_ids):
+        if node_id in previous:
+            init[i] = previous[node_id]
+    init /= SCALE
+    return graph.version, node_ids, edges, init, True
+
+
+def layout_graph(graph: CategoryGraph) -> Tuple[int, Dict[str, Tuple[float, float]]]:
+    """prepare_layout + compute_layout; returns (version, positions). Run it in a worker thread."""
+    version, node_ids, edges, init, warm = prepare_layout(graph)
+    return version, compute_layout(node_ids, edges, init, warm)
+
+
+def compute_layout(node_ids: List[str], edges: np.ndarray, init: Optional[np.ndarray] = None,
+                   warm: bool = False, seed: int = 0) -> Dict[str, Tuple[float, float]]:
+    """Runs the layout; CPU bound, callers should run it in a worker thread."""
+    n = len(node_ids)
+    if n == 0:
+        return {}
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(n)
+    pos = rng.uniform(-side / 2, side / 2, size=(n, 2))
+    movable = None
+    if init is not None:
+        known = ~np.isnan(init[:, 0])
+        pos[known] = init[known]
+        _place_new_nodes(pos, known, edges, rng)
+        if warm:
+            # 既存の配置を保つため、新しいノードとその隣接ノードだけを動かす
+            movable = ~known
+            if len(edges):
+                touched = movable[edges[:, 0]] | movable[edges[:, 1]]
+                movable[edges[touched].ravel()] = True
+    pos = force_directed(pos, edges, iterations=WARM_ITERATIONS if warm else FULL_ITERATIONS,
+                         temperature=0.02 * side if warm else 0.1 * side, movable=movable)
+    pos *= SCALE
+    return {node_id: (round(float(x), 1), round(float(y), 1)) for node_id, (x, y) in zip(node_ids, pos)}
+
+
+def _place_new_nodes(pos: np.ndarray, known: np.ndarray, edges: np.ndarray, rng):
+    """New nodes start next to the mean of their already placed neighbors (random if none)."""
+    if known.all() or len(edges) == 0:
+        return
+    n = len(pos)
+    total = np.zeros((n, 2))
+    counts = np.zeros(n)
+    for a, b in ((edges[:, 0], edges[:, 1]), (edges[:, 1], edges[:, 0])):
+        mask = ~known[a] & known[b]
+        counts += np.bincount(a[mask], minlength=n)
+        for dim in range(2):
+            total[:, dim] += np.bincount(a[mask], weights=pos[b[mask], dim], minlength=n)
+    has = counts > 0
+    pos[has] = total[has] / counts[has, None] + rng.normal(scale=0.3, size=(int(has.sum()), 2))
+
+
+def force_directed(pos: np.ndarray, edges: np.ndarray, iterations: int, temperature: float,
+                   movable: Optional[np.ndarray] = None) -> np.ndarray:
+    """Fruchterman-Reingold with k = 1 (area ~ N) and linear cooling; only `movable` nodes move if given."""
+    pos = pos.astype(np.float64, copy=True)
+    n = len(pos)
+    src, dst = (edges[:, 0], edges[:, 1]) if len(edges) else (np.zeros(0, int), np.zeros(0, int))
+    for step in range(iterations):
+        disp = _repulsion(pos) if n > 1 else np.zeros_like(pos)
+
+        # Attraction along edges: f = d^2 / k
+        if len(src):
+            delta = pos[src] - pos[dst]
+            dist = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-9)
+            force = delta * dist[:, None]
+            for dim in range(2):
+                disp[:, dim] -= np.bincount(src, weights=force[:, dim], minlength=n)
+                disp[:, dim] += np.bincount(dst, weights=force[:, dim], minlength=n)
+
+        # Weak gravity keeps disconnected components on screen
+        disp -= 0.01 * pos * np.sqrt(n) / np.maximum(np.linalg.norm(pos, axis=1, keepdims=True), 1e-9)
+
+        t = temperature * (1 - step / iterations)
+        length = np.maximum(np.linalg.norm(disp, axis=1, keepdims=True), 1e-9)
+        step_disp = disp / length * np.minimum(length, t)
+        if movable is not None:
+            step_disp[~movable] = 0.0
+        pos += step_disp
+    return pos
+
+
+def _repulsion(pos: np.ndarray) -> np.ndarray:
+    """Sum of k^2 / d repulsive forces on every node (f = delta / d^2)."""
+    if len(pos) <= EXACT_LIMIT:
+        return _pairwise(pos, pos, exclude_self=True)
+    return _grid_repulsion(pos)
+
+
+def _pairwise(targets: np.ndarray, sources: np.ndarray, exclude_self: bool = False,
+              mass: np.ndarray = None, skip: np.ndarray = None) -> np.ndarray:
+    """
+    Repulsion of `sources` (optionally weighted by `mass`) on `targets`, in blocks of rows.
+    skip[i] is a source index to ignore for target i (e.g. its own grid cell).
+    """
+    out = np.empty_like(targets)
+    sx, sy = sources[:, 0], sources[:, 1]
+    for start in range(0, len(targets), _CHUNK):
+        block = targets[start:start + _CHUNK]
+        dx = block[:, 0:1] - sx
+        dy = block[:, 1:2] - sy
+        inv = dx * dx
+        inv += dy * dy
+        np.maximum(inv, 1e-9, out=inv)
+        np.reciprocal(inv, out=inv)
+        if mass is not None:
+            inv *= mass
+        rows = np.arange(len(block))
+        if exclude_self:
+            inv[rows, start + rows] = 0.0
+        if skip is not None:
+            inv[rows, skip[start:start + _CHUNK]] = 0.0
+        out[start:start + _CHUNK, 0] = np.einsum("ij,ij->i", dx, inv)
+        out[start:start + _CHUNK, 1] = np.einsum("ij,ij->i", dy, inv)
+    return out
+
+
+def _grid_repulsion(pos: np.ndarray) -> np.ndarray:
+    n = len(pos)
+    # ~sqrt(N) cells of ~sqrt(N) nodes: far and near field are both O(N^1.5).
+    # Cells hold equal numbers of nodes (strips by x rank, split by y rank), so a few
+    # far-away outliers cannot squeeze everything else into one cell.
+    grid = max(4, int(round(n ** 0.25)))
+    strip = np.empty(n, dtype=np.int64)
+    strip[np.argsort(pos[:, 0], kind="stable")] = np.arange(n) * grid // n
+    order = np.lexsort((pos[:, 1], strip))
+    strip_size = np.bincount(strip, minlength=grid)
+    strip_start = np.concatenate([[0], np.cumsum(strip_size)[:-1]])
+    rank_in_strip = np.arange(n) - strip_start[strip[order]]
+    cell = np.empty(n, dtype=np.int64)
+    cell[order] = strip[order] * grid + rank_in_strip * grid // strip_size[strip[order]]
+
+    # Far field: every cell as one mass at its centroid (own cell excluded)
+    _, cell_of, mass = np.unique(cell, return_inverse=True, return_counts=True)
+    centroid = np.stack([np.bincount(cell_of, weights=pos[:, d]) / mass for d in range(2)], axis=1)
+    disp = _pairwise(pos, centroid, mass=mass.astype(pos.dtype), skip=cell_of)
+
+    # Near field: exact forces between the members of each cell
+    order = np.argsort(cell_of, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(mass)])
+    for c in range(len(mass)):
+        members = order[bounds[c]:bounds[c + 1]]
+        if len(members) > 1:
+            local = pos[members]
+            disp[members] += _pairwise(local, local, exclude_self=True)
+    return disp
@@ -0,0 +1,71 @@
+"""
+langchain callback recording model calls into core.metrics (latency, outcome, tokens, retries).
+"""
+import time
+from typing import Dict, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .metrics import LLM_CALLS, LLM_SECONDS, LLM_TOKENS, current_timings, record_retry
+
+
+def _usage(response) -> Tuple[int, int]:
+    """(prompt, completion) tokens from the usage_metadata of an LLMResult's messages."""
+    prompt = completion = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt += usage.get("input_tokens", 0) or 0
+                completion += usage.get("output_tokens", 0) or 0
+    return prompt, completion
+
+
+class LLMUsageCallback(BaseCallbackHandler):
+    """
+    Records every model call made with callbacks=[this]: latency, outcome, token usage
+    and retries, labelled with `model` (a role such as "text" or "vision").
+    """
+
+    run_inline = True  # 呼び出し元のコンテキストで実行する (RequestTimings に記録するため)
+
+    def __init__(self, model: str):
+        self.model = model
+        self._started: Dict[object, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def _finish(self, run_id, outcome: str) -> float:
+        start = self._started.pop(run_id, None)
+        elapsed = time.perf_counter() - start if start is not None else 0.0
+        LLM_SECONDS.observe(elapsed, (self.model,))
+        LLM_CALLS.inc(labels=(self.model, outcome))
+        return elapsed
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        elapsed = self._finish(run_id, "ok")
+        prompt, completion = _usage(response)
+        if prompt:
+            LLM_TOKENS.inc(prompt, (self.model, "prompt"))
+        if completion:
+            LLM_TOKENS.inc(completion, (self.model, "completion"))
+        timings = current_timings()
+        if timings is not None:
+            timings.llm_seconds += elapsed
+            timings.llm_calls += 1
+            timings.tokens_in += prompt
+            timings.tokens_out += completion
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        elapsed = self._finish(run_id, "error")
+        timings = current_timings()
+        if timings is not None:
+            timings.llm_seconds += elapsed
+            timings.llm_calls += 1
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        record_retry(self.model)
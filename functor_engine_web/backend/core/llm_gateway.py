@@ -0,0 +1,290 @@
+"""
+Client-side admission control for model calls (one gateway per model).
+
+- at most `max_concurrency` calls in flight; callers beyond that wait in FIFO order,
+  and past `max_queue` waiting callers new calls are rejected right away
+- requests-per-minute / tokens-per-minute token buckets (token cost is estimated
+  before the call and corrected with the reported usage afterwards)
+- retryable errors (429, 5xx, timeouts) are retried with exponential backoff and full
+  jitter, honouring a Retry-After hint when the error carries one
+- a circuit breaker opens after `failure_threshold` consecutive retryable failures and
+  rejects calls for `reset_timeout` seconds, then lets one probe call through
+
+Rejections and exhausted retries raise LLMUnavailable (HTTP 503 with Retry-After).
+"""
+import asyncio
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_MARKERS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED")
+
+
+class LLMUnavailable(RuntimeError):
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _status(error: BaseException) -> Optional[int]:
+    """HTTP status of an error or of one of its causes (SDK errors are often wrapped)."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for attr in ("status_code", "code", "status"):
+            value = getattr(error, attr, None)
+            if isinstance(value, int):
+                return value
+        response = getattr(error, "response", None)
+        if isinstance(getattr(response, "status_code", None), int):
+            return response.status_code
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    message = str(error)
+    return any(marker in message for marker in RETRYABLE_MARKERS)
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """`rate` units per second up to `capacity`; the level may go negative (debt) after corrections."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"  # closed | open | half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.retry_after() > 0:
+                return False
+            self.state = "half_open"
+            self.probe_started = None
+        if self.state == "half_open":
+            # 半開: 1 件だけ試し、結果で閉じるか再び開く (試行が戻らなければ reset_timeout 後に次を通す)
+            now = time.monotonic()
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return False
+            self.probe_started = now
+        return True
+
+    def release_probe(self):
+        """Frees the half-open probe slot taken by a call that was never sent."""
+        if self.state == "half_open":
+            self.probe_started = None
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probe_started = None
+
+    def failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+
+
+class LLMGateway:
+    def __init__(self, model: str, max_concurrency: int = 8, rpm: Optional[float] = None,
+                 tpm: Optional[float] = None, max_retries: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 8.0, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_queue: int = 100):
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.in_flight = 0
+        self.queued = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._rate_lock: Optional[asyncio.Lock] = None
+
+    def _reject(self, reason: str, retry_after: float):
+        # 待たずに失敗させる (負荷を上流へ押し返す)
+        metrics.LLM_REJECTED.inc(labels=(self.model, reason))
+        raise LLMUnavailable(f"Model '{self.model}' unavailable ({reason.replace('_', ' ')})",
+                             retry_after=max(1.0, retry_after))
+
+    async def _admit(self, tokens: int):
+        """Waits for the rate limits and a concurrency slot (the caller must release the slot)."""
+        if self._slots is None:
+            # イベントループ上で最初に使われた時に作る
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._rate_lock = asyncio.Lock()
+        # 待ち行列の確認を先に行う (半開時の試行枠を、送らない呼び出しで使わないように)
+        if self.queued >= self.max_queue:
+            self._reject("queue_full", self.base_delay)
+        if not self.breaker.allow():
+            self._reject("circuit_open", self.breaker.retry_after())
+        probe = self.breaker.state == "half_open"
+        self.queued += 1
+        try:
+            # 待ち順を保つため、レート制限の待機は 1 件ずつ行う
+            async with self._rate_lock:
+                for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                    if bucket is not None:
+                        delay = bucket.delay(amount)
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        bucket.take(amount)
+            await self._slots.acquire()
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()  # 待機中にキャンセルされた試行
+            raise
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def _settle(self, estimated: int, result: Any):
+        """Charges the difference between the estimate and the reported usage to the token bucket."""
+        usage = getattr(result, "usage_metadata", None)
+        if self.tokens is not None and usage:
+            self.tokens.take(usage.get("total_tokens", estimated) - estimated)
+
+    async def _backoff(self, attempt: int, error: BaseException) -> bool:
+        """Records a retryable failure; sleeps and returns True if the call should be retried."""
+        self.breaker.failure()
+        if attempt >= self.max_retries or self.breaker.state == "open":
+            return False
+        metrics.record_retry(self.model)
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = _retry_after(error)
+        if hint is not None:
+            delay = max(delay, min(hint, self.max_delay))
+        print(f"LLM '{self.model}' call failed ({error.__class__.__name__}: {error}); retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+        return True
+
+    def _unavailable(self, error: BaseException) -> LLMUnavailable:
+        retry_after = max(_retry_after(error) or 0.0, self.breaker.retry_after())
+        return LLMUnavailable(f"Model '{self.model}' call failed: {error}", retry_after=max(1.0, retry_after))
+
+    async def call(self, invoke: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Runs invoke() under the limits, retrying retryable errors."""
+        attempt = 0
+        while True:
+            await self._admit(tokens)
+            error = None
+            try:
+                result = await invoke()
+            except Exception as e:
+                error = e
+            finally:
+                # バックオフ中は枠を空けておく
+                self._release()
+            if error is None:
+                self.breaker.success()
+                self._settle(tokens, result)
+                return result
+            if not is_retryable(error):
+                self.breaker.success()  # 応答自体は返ってきている
+                raise error
+            if not await self._backoff(attempt, error):
+                raise self._unavailable(error) from error
+            attempt += 1
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[T]], tokens: int = 0) -> AsyncIterator[T]:
+        """
+        Streams open_stream() under the limits. Retries only until the first chunk has
+        been received (after that an error is passed on as it is).
+        """
+        attempt = 0
+        while True:
+            await self._admit(tokens)
+            received = False
+            error = None
+            try:
+                async for chunk in open_stream():
+                    received = True
+                    yield chunk
+            except Exception as e:
+                error = e
+            finally:
+                self._release()
+            if error is None:
+                self.breaker.success()
+                return
+            if received or not is_retryable(error):
+                if is_retryable(error):
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+                raise error
+            if not await self._backoff(attempt, error):
+                raise self._unavailable(error) from error
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rpm_available": round(self.requests.level, 1) if self.requests else None,
+            "tpm_available": round(self.tokens.level, 1) if self.tokens else None,
+        }
@@ -1,33 +1,168 @@
 import os
+import re
+import copy
 import json
-from typing import List, Dict, Any
-from langchain_google_genai import ChatGoogleGenerativeAI
+import asyncio
+import threading
+import time
+from typing import List, Dict, Any, Tuple, AsyncIterator, Callable
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers import JsonOutputParser
 import base64
+from .cache import TranslationCache
+from .image_pipeline import DescriptionCache, prepare_image
+from .llm_callbacks import LLMUsageCallback
+from .llm_gateway import LLMGateway, LLMUnavailable
+from . import metrics
+from .chunking import chunk_key, split_documents, split_markdown, split_paragraphs
 from .graph_logic import CategoryGraph
-from .models import WorldObject, Morphism
+from .matcher import normalize
+from .retrieval import RETRIEVAL_MODES, estimate_tokens, retrieve_laws
+from .world_builder import apply_extractions, retract_sources
+
+# fused モードの応答の 1 行目: 適用した候補の番号 ("LAWS: 1, 3" / "LAWS: none")
+FUSED_HEADER = re.compile(r"\s*LAWS:[ \t]*([^\n]*)\n?", re.IGNORECASE)
+# 画像 1 枚あたりの入力トークン数の見積もり (TPM 制限用)
+IMAGE_TOKENS = 258
+# 用途 -> Gemini モデル名
+MODELS = {
+    "text": "gemini-3-pro-preview",  # テキスト処理・推論用 (最新のテキスト/マルチモーダルモデルを指定)
+    # 画像解析用: ユーザー指定の 'gemini-3-pro-image-preview' を設定
+    # ※ Gemini 3 Pro がマルチモーダル対応であれば、ここも "gemini-3-pro-preview" で動作する可能性があります
+    "vision": "gemini-3-pro-image-preview",
+}
 
 class FunctorEngine:
-    def __init__(self, graph: CategoryGraph, api_key: str):
+    def __init__(self, graph: CategoryGraph, api_key: str, semantic_threshold: float = None,
+                 cache: TranslationCache = None, local_extraction: bool = False,
+                 local_coverage_threshold: float = 0.2, init_concurrency: int = 4,
+                 init_chunk_chars: int = 6000, retrieval_mode: str = "direct",
+                 retrieval_max_hops: int = 2, retrieval_token_budget: int = 1200,
+                 image_max_side: int = 1024, image_quality: int = 85,
+                 image_cache: DescriptionCache = None, fused: bool = False,
+                 fused_max_candidates: int = 12, text_gateway: LLMGateway = None,
+                 vision_gateway: LLMGateway = None):
         self.graph = graph
-        
-        # テキスト処理・推論用モデル
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-3-pro-preview",  # 最新のテキスト/マルチモーダルモデルを指定
-            google_api_key=api_key,
-            temperature=0.7
-        )
-        
-        # 画像解析用モデル
-        # ユーザー指定の 'gemini-3-pro-image-preview' を設定
-        # ※ Gemini 3 Pro がマルチモーダル対応であれば、ここも "gemini-3-pro-preview" で動作する可能性があります
-        self.vision_llm = ChatGoogleGenerativeAI(
-            model="gemini-3-pro-image-preview",  # 指定の画像用モデル
-            google_api_key=api_key,
-            temperature=0.7
-        )
+        # 法則の検索方式: direct = 一致した概念の 1-hop の法則をすべて列挙
+        # graph = 一致した概念すべてから複数 hop を同時に探索し、トークン予算内で関連度順に採用
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode!r} (choose from {', '.join(RETRIEVAL_MODES)})")
+        self.retrieval_mode = retrieval_mode
+        self.retrieval_max_hops = retrieval_max_hops
+        self.retrieval_token_budget = retrieval_token_budget
+        # World 初期化: 入力をチャンクに分割し、最大 init_concurrency 件を並列に抽出する
+        self.init_concurrency = init_concurrency
+        self.init_chunk_chars = init_chunk_chars
+        # 翻訳結果キャッシュ (キーは入力テキスト + グラフの fingerprint)
+        self.cache = cache
+        # 画像は長辺 image_max_side に縮小して送る。説明文は知覚ハッシュでキャッシュ (グラフに依存しない)
+        self.image_max_side = image_max_side
+        self.image_quality = image_quality
+        self.image_cache = image_cache
+        # ローカル抽出: グラフの既知ラベルで本文を直接走査し、十分に覆えていれば
+        # extract_entities の LLM 呼び出しを省略する
+        self.local_extraction = local_extraction
+        self.local_coverage_threshold = local_coverage_threshold
+        # 表記揺れ・言い換え検索の類似度しきい値 (None ならインデックスの既定値)
+        self.semantic_threshold = semantic_threshold
+        # fused モード: 候補の法則をグラフからローカルに選び、概念の選択と書き換えを 1 回の LLM 呼び出しで行う
+        self.fused = fused
+        self.fused_max_candidates = fused_max_candidates
+        # 実行中の翻訳 (キーは翻訳キャッシュと同じ)。同じテキストの同時リクエストは 1 つの計算を共有する
+        # for_graph のコピーとも共有する
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # モデルごとの呼び出し制御 (同時実行数・RPM/TPM・再試行・サーキットブレーカー)
+        self.text_gateway = text_gateway or LLMGateway("text")
+        self.vision_gateway = vision_gateway or LLMGateway("vision")
+
+        # モデルのクライアント (用途 -> client) は最初の使用時か warm_up() で作る
+        # (Gemini SDK の import に 1 秒以上かかるため)。for_graph のコピーとも共有する
+        self._api_key = api_key
+        self._clients: Dict[str, Any] = {}
+        self._clients_lock = threading.Lock()
+        # モデル呼び出しごとの所要時間・トークン数を /metrics に記録する
+        self._llm_config = {"callbacks": [LLMUsageCallback("text")]}
+        self._vision_config = {"callbacks": [LLMUsageCallback("vision")]}
+
+    def _client(self, role: str):
+        client = self._clients.get(role)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(role)
+                if client is None:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+
+                    # 再試行はゲートウェイで行うため SDK 側の再試行は無効 (max_retries=1 は初回の送信のみ)
+                    client = self._clients[role] = ChatGoogleGenerativeAI(
+                        model=MODELS[role],
+                        google_api_key=self._api_key,
+                        temperature=0.7,
+                        max_retries=1
+                    )
+        return client
+
+    async def _aclient(self, role: str):
+        """Like _client, but creates a missing client in a worker thread (keeps the event loop responsive)."""
+        client = self._clients.get(role)
+        return client if client is not None else await asyncio.to_thread(self._client, role)
+
+    @property
+    def llm(self):
+        """Text model client."""
+        return self._client("text")
+
+    @llm.setter
+    def llm(self, client):
+        self._clients["text"] = client
+
+    @property
+    def vision_llm(self):
+        """Vision model client."""
+        return self._client("vision")
+
+    @vision_llm.setter
+    def vision_llm(self, client):
+        self._clients["vision"] = client
+
+    def warm_up(self):
+        """Creates the model clients ahead of the first request (blocking; run it in a thread)."""
+        for role in MODELS:
+            self._client(role)
+
+    def for_graph(self, graph: CategoryGraph) -> "FunctorEngine":
+        """Returns an engine bound to another world's graph, sharing the LLM clients and caches."""
+        engine = copy.copy(self)
+        engine.graph = graph
+        return engine
+
+    @staticmethod
+    def _prompt_tokens(messages: List[Any]) -> int:
+        """Estimated input tokens of a message list (the output is charged after the call)."""
+        total = 0
+        for message in messages:
+            content = message[1] if isinstance(message, tuple) else message.content
+            for block in content if isinstance(content, list) else [content]:
+                if isinstance(block, dict):
+                    total += IMAGE_TOKENS if block.get("type") == "image_url" else estimate_tokens(block.get("text", ""))
+                else:
+                    total += estimate_tokens(str(block))
+        return total
+
+    async def _ainvoke(self, messages: List[Any], vision: bool = False):
+        """Calls the text (or vision) model through its gateway; returns the AI message."""
+        if vision:
+            llm, gateway, config = await self._aclient("vision"), self.vision_gateway, self._vision_config
+        else:
+            llm, gateway, config = await self._aclient("text"), self.text_gateway, self._llm_config
+        return await gateway.call(lambda: llm.ainvoke(messages, config=config), tokens=self._prompt_tokens(messages))
+
+    async def _astream(self, messages: List[Any]) -> AsyncIterator[Any]:
+        """Streams the text model's answer through its gateway."""
+        llm = await self._aclient("text")
+        async for chunk in self.text_gateway.stream(lambda: llm.astream(messages, config=self._llm_config),
+                                                    tokens=self._prompt_tokens(messages)):
+            yield chunk
 
     async def extract_entities(self, text: str) -> List[str]:
         """Extracts key concepts/entities from the input text."""
@@ -36,45 +171,171 @@ class FunctorEngine:
             "Text: {text}\n"
             "JSON List:"
         )
-        chain = prompt | self.llm | JsonOutputParser()
         try:
-            return await chain.ainvoke({"text": text})
+            return JsonOutputParser().invoke(await self._ainvoke(prompt.format_messages(text=text)))
+        except LLMUnavailable:
+            # 空の抽出結果で黙って品質を落とさず、呼び出し元に伝える
+            raise
         except Exception as e:
             print(f"Error extracting entities: {e}")
             return []
 
+    async def extract_entities_batch(self, texts: List[str]) -> List[List[str]]:
+        """
+        Extracts entities for several texts with one LLM call.
+        Falls back to per-text extraction if the grouped answer does not line up.
+        """
+        if not texts:
+            return []
+        prompt = ChatPromptTemplate.from_template(
+            "Extract key concepts (nouns, entities) from each of the following numbered texts.\n"
+            "Return a JSON list with exactly one JSON list of strings per text, in the same order.\n"
+            "Texts:\n{texts}\n"
+            "JSON List:"
+        )
+        numbered = "\n".join(f"[{i}] {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts))
+        try:
+            data = JsonOutputParser().invoke(await self._ainvoke(prompt.format_messages(texts=numbered)))
+            if isinstance(data, list) and len(data) == len(texts) and all(isinstance(d, list) for d in data):
+                return data
+            print(f"Grouped entity extraction returned {len(data) if isinstance(data, list) else type(data)} "
+                  f"results for {len(texts)} texts; falling back to per-text extraction")
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            print(f"Error extracting entities (batch): {e}")
+        metrics.record_batch_fallback("extract_entities")
+        return list(await asyncio.gather(*(self.extract_entities(text) for text in texts)))
+
     def _find_nearest_node(self, entity: str) -> str:
         """
         Finds the most relevant node in the graph for a given entity.
-        For now, this is a simple string match or fuzzy match.
-        In a real production system, we would use vector embeddings.
+        Uses the graph's matcher index (exact / contained / containing id or label),
+        so the cost does not depend on the number of nodes.
+        Paraphrases are handled by the semantic fallback in _resolve_entities.
         """
-        # Simple exact match or substring match for this prototype
-        for node_id in self.graph.graph.nodes:
-            if entity.lower() in node_id.lower() or node_id.lower() in entity.lower():
-                return node_id
-        return None
+        candidates = self.graph.find_nodes(entity, limit=1)
+        return candidates[0][0] if candidates else None
+
+    def _resolve_entities(self, entities: List[str]) -> List[Tuple[str, str]]:
+        """
+        Maps each entity to a node: lexical match first, then one batched
+        semantic search for the entities that found nothing.
+        Returns (entity, node_id) pairs; node_id is None when nothing is close enough.
+        """
+        resolved = [(entity, self._find_nearest_node(entity)) for entity in entities]
+        missing = [i for i, (_, node_id) in enumerate(resolved) if node_id is None]
+        if missing:
+            hits = self.graph.semantic_search(
+                [entities[i] for i in missing], k=1, threshold=self.semantic_threshold
+            )
+            for i, candidates in zip(missing, hits):
+                if candidates:
+                    resolved[i] = (entities[i], candidates[0][0])
+        return resolved
+
+    async def _match_entities(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Returns (entity, node_id) pairs for the text.
+        In local extraction mode the graph dictionary is scanned first and the LLM
+        extractor is only called when the local coverage is below the threshold.
+        """
+        local_pairs = []
+        with metrics.stage("translate", "extract"):
+            if self.local_extraction:
+                local_pairs, coverage = self.graph.scan_entities(text)
+                if local_pairs and coverage >= self.local_coverage_threshold:
+                    return local_pairs
+            entities = await self.extract_entities(text)
+
+        with metrics.stage("translate", "resolve"):
+            pairs = self._resolve_entities(entities)
+        if local_pairs:
+            found = {node_id for _, node_id in pairs}
+            pairs += [(entity, node_id) for entity, node_id in local_pairs if node_id not in found]
+        return pairs
+
+    @staticmethod
+    def _content_to_text(content: Any) -> str:
+        """Flattens a model response/chunk `content` into plain text."""
+        if isinstance(content, str):
+            # 文字列ならそのまま使用
+            return content
+        if isinstance(content, list):
+            # リスト(Gemini 3のマルチモーダル形式)なら、テキスト部分を結合
+            # 例: [{'type': 'text', 'text': 'こんにちは'}] -> 'こんにちは'
+            parts = []
+            for block in content:
+                if isinstance(block, dict) and "text" in block:
+                    parts.append(block["text"])
+                elif isinstance(block, str):
+                    parts.append(block)
+            return "".join(parts)
+        # それ以外は文字列化
+        return str(content)
+
+    def _translation_key(self, text: str) -> str:
+        """Key of a translation (text, world fingerprint and the settings that change the result)."""
+        # 抽出・検索設定が変わると法則 (=翻訳結果) も変わるため、キーの名前空間に含める
+        namespace = f"translate:{self.semantic_threshold}"
+        if self.local_extraction:
+            namespace += f":local:{self.local_coverage_threshold}"
+        if self.retrieval_mode != "direct":
+            namespace += f":{self.retrieval_mode}:{self.retrieval_max_hops}:{self.retrieval_token_budget}"
+        if self.fused:
+            namespace += f":fused:{self.fused_max_candidates}"
+        return TranslationCache.make_key(text, self.graph.fingerprint, namespace=namespace)
+
+    def _cached_translation(self, text: str):
+        """Returns (translation key, cached result or None)."""
+        cache_key = self._translation_key(text)
+        if self.cache is None:
+            return cache_key, None
+        with metrics.stage("translate", "cache"):
+            cached = self.cache.get(cache_key)
+        metrics.record_cache("translation", cached is not None)
+        if cached is not None:
+            cached = {**cached, "applied_laws": list(cached["applied_laws"])}
+        return cache_key, cached
+
+    def _store_translation(self, cache_key: str, result: Dict[str, Any]):
+        if self.cache is not None:
+            self.cache.set(cache_key, {**result, "applied_laws": list(result["applied_laws"])})
+
+    async def _prepare_translation(self, text: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """Runs extraction and retrieval; returns (applied_laws, generation messages)."""
+
+        # 1. Extract entities and map them to nodes
+        pairs = await self._match_entities(text)
+        with metrics.stage("translate", "retrieve"):
+            return self._build_prompt(text, pairs)
+
+    def _collect_laws(self, text: str, pairs: List[Tuple[str, str]]) -> List[str]:
+        """Laws of the matched nodes, one applied_laws entry per concept."""
+        if self.retrieval_mode == "graph":
+            applied_laws = retrieve_laws(
+                self.graph, pairs, text,
+                max_hops=self.retrieval_max_hops, token_budget=self.retrieval_token_budget,
+            )
+        else:
+            applied_laws = []
+            seen = set()  # 複数のエンティティが同じノードに対応しても法則は一度だけ
+            for entity, node_id in pairs:
+                if node_id and node_id not in seen:
+                    seen.add(node_id)
+                    laws = self.graph.get_context(node_id)
+                    if laws:
+                        applied_laws.append(f"Concept '{entity}' maps to '{node_id}' with laws:\n{laws}")
+        return applied_laws
+
+    def _build_prompt(self, text: str, pairs: List[Tuple[str, str]]) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """Collects the laws of the matched nodes; returns (applied_laws, generation messages)."""
 
-    async def translate_text(self, text: str) -> Dict[str, Any]:
-        """Translates text based on the world graph."""
-        
-        # 1. Extract entities
-        entities = await self.extract_entities(text)
-        
         # 2. Retrieve context (laws)
-        applied_laws = []
-        context_str = ""
-        
-        for entity in entities:
-            node_id = self._find_nearest_node(entity)
-            if node_id:
-                laws = self.graph.get_context(node_id)
-                if laws:
-                    law_entry = f"Concept '{entity}' maps to '{node_id}' with laws:\n{laws}"
-                    applied_laws.append(law_entry)
-                    context_str += law_entry + "\n"
-
-        # 3. Generate translation
+        applied_laws = self._collect_laws(text, pairs)
+        context_str = "".join(law_entry + "\n" for law_entry in applied_laws)
+
+        # 3. Build the generation prompt
         system_prompt = (
             "You are a 'Functor Engine', a system that translates reality into a specific worldview.\n"
             "Rewrite the input text according to the provided World Laws.\n"
@@ -93,83 +354,535 @@ class FunctorEngine:
             ("system", system_prompt),
             ("user", user_prompt)
         ]
+        return applied_laws, messages
+
+    def _fused_candidates(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Locally preselected (mention, node_id) candidates for fused mode: concepts named
+        verbatim in the text first, then the closest concept of each word not part of
+        such a mention (one batched semantic search). At most `fused_max_candidates`.
+        """
+        pairs, _ = self.graph.scan_entities(text)
+        if len(pairs) < self.fused_max_candidates:
+            found = {node_id for _, node_id in pairs}
+            mentioned = {word for mention, _ in pairs for word in normalize(mention).split()}
+            words = list(dict.fromkeys(w for w in normalize(text).split() if len(w) >= 3 and w not in mentioned))[:64]
+            hits = self.graph.semantic_search(words, k=1, threshold=self.semantic_threshold) if words else []
+            ranked = sorted(((found_nodes[0][1], word, found_nodes[0][0])
+                             for word, found_nodes in zip(words, hits) if found_nodes), reverse=True)
+            for _, word, node_id in ranked:
+                if node_id not in found:
+                    found.add(node_id)
+                    pairs.append((word, node_id))
+        return pairs[:self.fused_max_candidates]
+
+    def _prepare_fused(self, text: str) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """Returns (candidate applied_laws entries, messages) for the single fused call."""
+        candidates = self._collect_laws(text, self._fused_candidates(text))
+        numbered = "".join(f"[{i}] {entry}\n" for i, entry in enumerate(candidates, 1))
+
+        system_prompt = (
+            "You are a 'Functor Engine', a system that translates reality into a specific worldview.\n"
+            "You are given numbered candidate World Laws preselected from the world; some may not concern the text.\n"
+            "First decide which candidates apply to the concepts the input text mentions or implies.\n"
+            "Then rewrite the input text according to those laws.\n"
+            "If no specific laws apply to a part of the text, try to adapt it to the general tone implied by the laws.\n"
+            "Answer in exactly this format:\n"
+            "LAWS: <comma separated numbers of the applied candidates, or none>\n"
+            "<the translated text only>"
+        )
+
+        user_prompt = f"""
+        Original Text: {text}
         
-        response = await self.llm.ainvoke(messages)
-        
-        content = response.content
-        translated_text = ""
+        Candidate World Laws:
+        {numbered if numbered else "No candidate laws found. Apply a general fantasy/SF filter."}
+        """
 
-        if isinstance(content, str):
-            # 文字列ならそのまま使用
-            translated_text = content
-        elif isinstance(content, list):
-            # リスト(Gemini 3のマルチモーダル形式)なら、テキスト部分を結合
-            # 例: [{'type': 'text', 'text': 'こんにちは'}] -> 'こんにちは'
-            parts = []
-            for block in content:
-                if isinstance(block, dict) and "text" in block:
-                    parts.append(block["text"])
-                elif isinstance(block, str):
-                    parts.append(block)
-            translated_text = "".join(parts)
+        messages = [
+            ("system", system_prompt),
+            ("user", user_prompt)
+        ]
+        return candidates, messages
+
+    @staticmethod
+    def _split_fused(answer: str, candidates: List[str]) -> Tuple[List[str], str]:
+        """Splits a fused answer into (applied laws, translated text)."""
+        match = FUSED_HEADER.match(answer)
+        if match is None:
+            # 形式どおりでない応答: 全文を翻訳とみなし、候補をすべて適用したものとして扱う
+            return list(candidates), answer
+        numbers = dict.fromkeys(int(n) for n in re.findall(r"\d+", match.group(1)))
+        return [candidates[n - 1] for n in numbers if 1 <= n <= len(candidates)], answer[match.end():]
+
+    async def _translate_uncached(self, text: str, cache_key: str) -> Dict[str, Any]:
+        if self.fused:
+            with metrics.stage("translate", "retrieve"):
+                candidates, messages = self._prepare_fused(text)
+            with metrics.stage("translate", "generate"):
+                response = await self._ainvoke(messages)
+            applied_laws, translated = self._split_fused(self._content_to_text(response.content), candidates)
         else:
-            # それ以外は文字列化
-            translated_text = str(content)
+            applied_laws, messages = await self._prepare_translation(text)
+            with metrics.stage("translate", "generate"):
+                response = await self._ainvoke(messages)
+            translated = self._content_to_text(response.content)
 
-        return {
+        result = {
             "original_text": text,
-            "translated_text": translated_text,
+            "translated_text": translated,
             "applied_laws": applied_laws
         }
+        self._store_translation(cache_key, result)
+        return result
+
+    async def _join_flight(self, flight: asyncio.Future) -> Dict[str, Any]:
+        metrics.record_cache("single_flight", True)
+        with metrics.stage("translate", "single_flight"):
+            return await asyncio.shield(flight)
+
+    def _land(self, cache_key: str, flight: asyncio.Future):
+        if self._in_flight.get(cache_key) is flight:
+            del self._in_flight[cache_key]
+        if not flight.cancelled():
+            flight.exception()  # 待ち手が全員キャンセルされても「未取得の例外」の警告を出さない
+
+    async def translate_text(self, text: str) -> Dict[str, Any]:
+        """
+        Translates text based on the world graph.
+        Concurrent calls for the same text and world version share one computation
+        (it keeps running if the caller that started it goes away).
+        """
+
+        # Cache lookup (a hit skips both LLM calls)
+        cache_key, cached = self._cached_translation(text)
+        if cached is not None:
+            return cached
+
+        flight = self._in_flight.get(cache_key)
+        if flight is None:
+            metrics.record_cache("single_flight", False)
+            flight = asyncio.ensure_future(self._translate_uncached(text, cache_key))
+            self._in_flight[cache_key] = flight
+            flight.add_done_callback(lambda done: self._land(cache_key, done))
+            result = await asyncio.shield(flight)
+        else:
+            result = await self._join_flight(flight)
+        return {**result, "applied_laws": list(result["applied_laws"])}
+
+    async def translate_text_stream(self, text: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of translate_text.
+        Yields {"event": "laws"} first, then {"event": "chunk"} per generated piece,
+        and finally {"event": "done"} with the full translated text.
+        A translation of the same text already in flight is awaited instead of started again.
+        """
+        cache_key, cached = self._cached_translation(text)
+        if cached is None and cache_key in self._in_flight:
+            result = await self._join_flight(self._in_flight[cache_key])
+            cached = {**result, "applied_laws": list(result["applied_laws"])}
+        if cached is not None:
+            yield {"event": "laws", "applied_laws": cached["applied_laws"]}
+            yield {"event": "chunk", "text": cached["translated_text"]}
+            yield {"event": "done", **cached}
+            return
+
+        if self.fused:
+            with metrics.stage("translate", "retrieve"):
+                candidates, messages = self._prepare_fused(text)
+            applied_laws = None  # 応答の 1 行目 (LAWS:) を受け取るまで確定しない
+        else:
+            applied_laws, messages = await self._prepare_translation(text)
+            yield {"event": "laws", "applied_laws": applied_laws}
+
+        parts = []
+        head = ""
+        start = time.perf_counter()
+        async for chunk in self._astream(messages):
+            piece = self._content_to_text(chunk.content)
+            if piece and applied_laws is None:
+                head += piece
+                if "\n" not in head.lstrip():
+                    continue
+                applied_laws, piece = self._split_fused(head, candidates)
+                yield {"event": "laws", "applied_laws": applied_laws}
+            if piece:
+                if not parts:
+                    metrics.record_stage("translate", "first_token", time.perf_counter() - start)
+                parts.append(piece)
+                yield {"event": "chunk", "text": piece}
+        if applied_laws is None:
+            # 改行を含まない応答 (見出し行のみ、または形式外)
+            applied_laws, piece = self._split_fused(head, candidates)
+            yield {"event": "laws", "applied_laws": applied_laws}
+            if piece:
+                parts.append(piece)
+                yield {"event": "chunk", "text": piece}
+        metrics.record_stage("translate", "generate", time.perf_counter() - start)
+
+        result = {
+            "original_text": text,
+            "translated_text": "".join(parts),
+            "applied_laws": applied_laws
+        }
+        self._store_translation(cache_key, result)
+        yield {"event": "done", **result}
+
+    async def translate_batch(self, texts: List[str], concurrency: int = 4,
+                              extraction_group_size: int = 32) -> AsyncIterator[Tuple[int, Dict[str, Any], str]]:
+        """
+        Translates many texts against the current world.
+        Identical texts are translated once, entity extraction is grouped into one LLM
+        call per `extraction_group_size` texts, retrieval resolves every distinct entity
+        in one pass, and generations run with at most `concurrency` calls in flight.
+        In fused mode each text takes a single call (no extraction step).
+        Texts already being translated (by translate_text or another batch) are awaited,
+        and this batch's own texts are shared with concurrent callers the same way.
+        Yields (index, result, error) as items finish; exactly one of result/error is set.
+        """
+        positions: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            positions.setdefault(text, []).append(i)
+
+        # 0. Cache lookup / in-flight translations
+        pending = []
+        joined = {}
+        cache_keys = {}
+        for text, indices in positions.items():
+            cache_key, cached = self._cached_translation(text)
+            if cached is not None:
+                for i in indices:
+                    yield i, {**cached, "applied_laws": list(cached["applied_laws"])}, None
+            elif cache_key in self._in_flight:
+                joined[text] = self._in_flight[cache_key]
+            else:
+                cache_keys[text] = cache_key
+                pending.append(text)
+        if not pending and not joined:
+            return
+
+        flights: Dict[str, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        for text in pending:
+            flight = flights[text] = loop.create_future()
+            self._in_flight[cache_keys[text]] = flight
+            flight.add_done_callback(lambda done, key=cache_keys[text]: self._land(key, done))
+        try:
+            async for item in self._translate_pending(pending, joined, positions, cache_keys, flights,
+                                                      concurrency, extraction_group_size):
+                yield item
+        except BaseException as e:
+            # 中断・失敗時も、このバッチを待っている他の呼び出しを待たせたままにしない
+            error = e if isinstance(e, Exception) else RuntimeError("Batch translation was abandoned")
+            for flight in flights.values():
+                if not flight.done():
+                    flight.set_exception(error)
+            raise
+
+    async def _translate_pending(self, pending: List[str], joined: Dict[str, asyncio.Future],
+                                 positions: Dict[str, List[int]], cache_keys: Dict[str, str],
+                                 flights: Dict[str, asyncio.Future], concurrency: int,
+                                 extraction_group_size: int) -> AsyncIterator[Tuple[int, Dict[str, Any], str]]:
+        """Steps 1-3 of translate_batch; resolves each text's flight as it finishes."""
+        # 1-2. Entity extraction and retrieval (fused mode selects candidates per text instead)
+        pairs_by_text = {} if self.fused or not pending else await self._match_batch(pending, extraction_group_size)
+
+        # 3. Generation fan-out
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def generate(text: str):
+            async with semaphore:
+                try:
+                    with metrics.stage("batch", "retrieve"):
+                        if self.fused:
+                            candidates, messages = self._prepare_fused(text)
+                        else:
+                            applied_laws, messages = self._build_prompt(text, pairs_by_text[text])
+                    with metrics.stage("batch", "generate"):
+                        response = await self._ainvoke(messages)
+                except Exception as e:
+                    if not flights[text].done():
+                        flights[text].set_exception(e)
+                    return text, None, str(e) or e.__class__.__name__
+            translated = self._content_to_text(response.content)
+            if self.fused:
+                applied_laws, translated = self._split_fused(translated, candidates)
+            result = {
+                "original_text": text,
+                "translated_text": translated,
+                "applied_laws": applied_laws
+            }
+            self._store_translation(cache_keys[text], result)
+            if not flights[text].done():  # 呼び出し元が先に中断した場合は解決済み
+                flights[text].set_result(result)
+            return text, result, None
+
+        async def join(text: str):
+            try:
+                return text, await self._join_flight(joined[text]), None
+            except Exception as e:
+                return text, None, str(e) or e.__class__.__name__
+
+        tasks = [generate(text) for text in pending] + [join(text) for text in joined]
+        for future in asyncio.as_completed(tasks):
+            text, result, error = await future
+            for i in positions[text]:
+                if result is None:
+                    yield i, None, error
+                else:
+                    yield i, {**result, "applied_laws": list(result["applied_laws"])}, None
+
+    async def translate_document(self, text: str, concurrency: int = 4,
+                                 max_chars: int = 2000) -> Dict[str, Any]:
+        """
+        Translates a long Markdown document paragraph by paragraph.
+        Paragraphs go through translate_batch (own cache entry and retrieval each, grouped
+        extraction, at most `concurrency` generations in flight) and are put back in their
+        original order; headings stay with their paragraph, code blocks and the whitespace
+        between paragraphs are kept as they are. A paragraph that fails keeps its original
+        text and is listed in `failed_chunks`.
+        """
+        with metrics.stage("document", "split"):
+            segments = split_paragraphs(text, max_chars)
+        chunks = [i for i, (_, translatable) in enumerate(segments) if translatable]
+        parts = [segment for segment, _ in segments]
+        laws_by_chunk: Dict[int, List[str]] = {}
+        failed = []
+        with metrics.stage("document", "translate"):
+            async for i, result, error in self.translate_batch([segments[c][0] for c in chunks], concurrency=concurrency):
+                if result is None:
+                    failed.append({"index": i, "error": error})
+                else:
+                    parts[chunks[i]] = result["translated_text"].strip()
+                    laws_by_chunk[i] = result["applied_laws"]
+        applied_laws = dict.fromkeys(law for i in sorted(laws_by_chunk) for law in laws_by_chunk[i])
+        return {
+            "original_text": text,
+            "translated_text": "".join(parts),
+            "applied_laws": list(applied_laws),
+            "chunks": len(chunks),
+            "failed_chunks": sorted(failed, key=lambda f: f["index"]),
+        }
+
+    async def _match_batch(self, pending: List[str], extraction_group_size: int) -> Dict[str, List[Tuple[str, str]]]:
+        """(entity, node_id) pairs for every text of a batch (steps 1 and 2 of translate_batch)."""
+        # 1. Entity extraction (local scan first, grouped LLM calls for the rest)
+        pairs_by_text: Dict[str, List[Tuple[str, str]]] = {}
+        entities_by_text: Dict[str, List[str]] = {}
+        local_by_text: Dict[str, List[Tuple[str, str]]] = {}
+        for text in pending:
+            if self.local_extraction:
+                local_pairs, coverage = self.graph.scan_entities(text)
+                if local_pairs and coverage >= self.local_coverage_threshold:
+                    pairs_by_text[text] = local_pairs
+                    continue
+                local_by_text[text] = local_pairs
+        to_extract = [text for text in pending if text not in pairs_by_text]
+        groups = [to_extract[i:i + extraction_group_size] for i in range(0, len(to_extract), extraction_group_size)]
+        with metrics.stage("batch", "extract"):
+            extracted_groups = await asyncio.gather(*(self.extract_entities_batch(g) for g in groups))
+        for group, extracted in zip(groups, extracted_groups):
+            entities_by_text.update(zip(group, extracted))
+
+        # 2. Retrieval: resolve every distinct entity of the batch once
+        distinct = list(dict.fromkeys(e for entities in entities_by_text.values() for e in entities))
+        with metrics.stage("batch", "resolve"):
+            node_of = dict(self._resolve_entities(distinct))
+        for text, entities in entities_by_text.items():
+            pairs = [(entity, node_of.get(entity)) for entity in entities]
+            found = {node_id for _, node_id in pairs}
+            pairs += [p for p in local_by_text.get(text, []) if p[1] not in found]
+            pairs_by_text[text] = pairs
+        return pairs_by_text
+
+    async def describe_image(self, image_data: bytes) -> str:
+        """
+        Returns the vision model's description of an image. The image is downscaled
+        and re-encoded first; the same image (or, if enabled, a near-identical one)
+        reuses a cached description.
+        Raises image_pipeline.InvalidImage for undecodable data.
+        """
+        with metrics.stage("image", "prepare"):
+            image = await asyncio.to_thread(prepare_image, image_data, self.image_max_side, self.image_quality)
+        if self.image_cache is not None:
+            description = self.image_cache.get(image.digest, image.phash)
+            metrics.record_cache("image", description is not None)
+            if description is not None:
+                return description
 
-    async def translate_image(self, image_data: bytes, mime_type: str) -> Dict[str, Any]:
-        """Translates/Analyzes an image based on the world graph."""
-        
-        # 1. Analyze image to get description/entities
         # We use the vision model for this
-        image_b64 = base64.b64encode(image_data).decode("utf-8")
+        image_b64 = base64.b64encode(image.data).decode("utf-8")
         
         message = HumanMessage(
             content=[
                 {"type": "text", "text": "Describe this image in detail, focusing on key objects, actions, and atmosphere. Return a text description."},
-                {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_b64}"}}
+                {"type": "image_url", "image_url": {"url": f"data:{image.mime_type};base64,{image_b64}"}}
             ]
         )
         
-        # First, get the description
-        description_response = await self.vision_llm.ainvoke([message])
-        description = description_response.content
+        with metrics.stage("image", "describe"):
+            description_response = await self._ainvoke([message], vision=True)
+        description = self._content_to_text(description_response.content)
+        if self.image_cache is not None and description.strip():
+            self.image_cache.set(image.digest, description, image.phash)
+        return description
+
+    async def translate_image(self, image_data: bytes, mime_type: str = None) -> Dict[str, Any]:
+        """Translates/Analyzes an image based on the world graph."""
+        
+        # 1. Analyze image to get description/entities
+        # (mime_type is kept for compatibility: the image is always re-encoded as JPEG)
+        description = await self.describe_image(image_data)
         
         # 2. Now use the standard translation flow with this description
         # This reuses the logic of mapping entities to laws
         return await self.translate_text(description)
 
-    async def initialize_world_from_text(self, world_text: str):
-        """Parses a world description text and populates the graph."""
-        self.graph.clear()
-        
+    async def extract_world_chunk(self, chunk: str) -> Dict[str, Any]:
+        """Extracts {"nodes": [...], "edges": [...]} from one chunk of a world description."""
         prompt = ChatPromptTemplate.from_template(
             "Analyze the following world description and extract 'Concepts' (Nodes) and 'Laws/Relationships' (Edges).\n"
+            "The text may be one part of a larger document; use short, stable ids (e.g. the concept name in snake_case)\n"
+            "so that the same concept gets the same id in every part.\n"
             "Return a JSON object with two keys: 'nodes' and 'edges'.\n"
             "Each 'node' should have: id, label, description, type.\n"
             "Each 'edge' should have: source (id), target (id), label, rule.\n"
             "Text:\n{text}\n"
             "JSON:"
         )
-        
-        chain = prompt | self.llm | JsonOutputParser()
-        try:
-            data = await chain.ainvoke({"text": world_text})
-            
-            for node_data in data.get("nodes", []):
-                node = WorldObject(**node_data)
-                self.graph.add_node(node)
-                
-            for edge_data in data.get("edges", []):
-                morphism = Morphism(**edge_data)
-                self.graph.add_morphism(morphism)
-                
-            return len(self.graph.graph.nodes)
-        except Exception as e:
-            print(f"Error initializing world: {e}")
-            raise e
+        data = JsonOutputParser().invoke(await self._ainvoke(prompt.format_messages(text=chunk)))
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        return data
+
+    async def update_documents(self, documents: List[Tuple[str, str]], mode: str = "replace",
+                               progress: Callable[..., None] = None) -> Dict[str, Any]:
+        """
+        Adds or patches source documents of the world without rebuilding it.
+
+        Each (doc_id, text) is split into chunks keyed by content hash. Only chunks the
+        graph has not seen for that document are sent to the LLM (at most
+        `init_concurrency` at a time). In "replace" mode, chunks that disappeared from a
+        document are retracted together with the nodes/edges only they contributed;
+        "append" keeps the document's existing chunks.
+        Failed chunks are left out (and retried on the next update); the call fails
+        without touching the graph only if every new chunk fails.
+        `progress(**fields)` is called with stage / chunk / node and edge counts
+        (while extracting, nodes/edges count what the finished chunks returned).
+        """
+        report = progress or (lambda **fields: None)
+        if mode not in ("replace", "append"):
+            raise ValueError(f"Unknown mode: {mode}")
+
+        split_start = time.perf_counter()
+        new_chunks: Dict[str, str] = {}
+        removed = set()
+        doc_keys: Dict[str, List[str]] = {}
+        reused = 0
+        for doc_id, text in documents:
+            old_keys = self.graph.documents.get(doc_id, [])
+            keys = []
+            for chunk in split_markdown(text, self.init_chunk_chars):
+                if not chunk.strip():
+                    continue
+                key = chunk_key(doc_id, chunk)
+                if key in keys:
+                    continue
+                keys.append(key)
+                if key in old_keys:
+                    reused += 1
+                else:
+                    new_chunks[key] = chunk
+            if mode == "append":
+                keys = old_keys + [k for k in keys if k not in old_keys]
+            else:
+                removed.update(k for k in old_keys if k not in keys)
+            doc_keys[doc_id] = keys
+        metrics.record_stage("world", "split", time.perf_counter() - split_start)
+
+        semaphore = asyncio.Semaphore(max(1, self.init_concurrency))
+        counts = {"chunks_done": 0, "chunks_failed": 0, "nodes": 0, "edges": 0}
+        report(stage="extracting", chunks_total=len(new_chunks), **counts)
+
+        async def extract(chunk: str):
+            async with semaphore:
+                try:
+                    result = await self.extract_world_chunk(chunk)
+                except Exception:
+                    counts["chunks_failed"] += 1
+                    raise
+                finally:
+                    counts["chunks_done"] += 1
+                    report(**counts)
+            counts["nodes"] += len(result.get("nodes", []))
+            counts["edges"] += len(result.get("edges", []))
+            report(**counts)
+            return result
+
+        with metrics.stage("world", "extract"):
+            results = await asyncio.gather(*(extract(c) for c in new_chunks.values()), return_exceptions=True)
+        extracted = []
+        failed = set()
+        for key, result in zip(new_chunks, results):
+            if isinstance(result, BaseException):
+                print(f"Error extracting world chunk {key} (skipped): {result}")
+                failed.add(key)
+            else:
+                extracted.append((key, result))
+        if new_chunks and not extracted:
+            raise next(r for r in results if isinstance(r, BaseException))
+
+        def merge():
+            with metrics.stage("world", "merge"):
+                retracted = retract_sources(self.graph, removed)
+                apply_extractions(self.graph, extracted)
+                for doc_id, keys in doc_keys.items():
+                    self.graph.documents[doc_id] = [k for k in keys if k not in failed]
+            return retracted
+
+        report(stage="merging")
+        # マージは大きな World で秒単位になるのでループの外で行う (このグラフはまだ公開されていない)
+        retracted = await asyncio.to_thread(merge)
+
+        summary = {
+            "chunks_extracted": len(extracted),
+            "chunks_failed": len(failed),
+            "chunks_reused": reused,
+            "chunks_removed": len(removed),
+            **retracted,
+            "nodes": self.graph.number_of_nodes(),
+            "edges": self.graph.number_of_edges(),
+            "version": self.graph.version,
+        }
+        report(stage="merged", nodes=summary["nodes"], edges=summary["edges"])
+        return summary
+
+    def delete_document(self, doc_id: str) -> Dict[str, Any]:
+        """Removes a source document and everything only it contributed."""
+        keys = self.graph.documents.pop(doc_id, None)
+        if keys is None:
+            raise KeyError(doc_id)
+        retracted = retract_sources(self.graph, keys)
+        return {
+            "chunks_removed": len(keys),
+            **retracted,
+            "nodes": self.graph.number_of_nodes(),
+            "edges": self.graph.number_of_edges(),
+            "version": self.graph.version,
+        }
+
+    async def initialize_world_from_text(self, world_text: str, progress: Callable[..., None] = None):
+        """
+        Parses a world description text and populates the graph.
+        The text is split into documents at `# File:` markers and into chunks at
+        heading boundaries; chunks are extracted concurrently (at most
+        `init_concurrency` LLM calls in flight) and merged with provenance, so the
+        world can later be patched with update_documents.
+        `progress` is passed on to update_documents.
+        """
+        documents = split_documents(world_text)
+        if not documents:
+            raise ValueError("World description is empty")
+        self.graph.clear()
+        await self.update_documents(documents, mode="replace", progress=progress)
+        return self.graph.number_of_nodes()
@@ -0,0 +1,257 @@
+import heapq
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_NON_WORD = re.compile(r"[\W_]+")
+# 「エンティティを含むキー」の探索で調べるキー数の上限 (よくある単語でも探索量を一定にする)
+CONTAINING_CANDIDATES = 256
+
+
+def normalize(text: str) -> str:
+    """Normalizes a label/id/entity for matching (NFKC, casefold, separators -> space)."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def tokenize(normalized: str) -> List[str]:
+    """
+    Splits normalized text into index tokens.
+    ASCII words are kept whole; other scripts (日本語など空白で区切られない文字) are
+    split into character bigrams so that partial matches still share tokens.
+    """
+    tokens = []
+    for word in normalized.split():
+        if word.isascii() or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+class NodeMatcher:
+    """
+    Index from node ids/labels to node ids used to resolve extracted entities.
+
+    - exact lookup on the normalized key
+    - Aho-Corasick automaton to find keys contained in the entity
+    - token inverted index (postings bucketed by key length) to find keys containing
+      the entity, shortest keys first and at most CONTAINING_CANDIDATES of them
+    Lookups do not scan the node set, so their cost does not grow with the graph.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, Set[str]] = {}        # normalized key -> node ids
+        self._node_keys: Dict[str, List[str]] = {}  # node id -> normalized keys
+        self._postings: Dict[str, Dict[int, Set[str]]] = {}  # token -> key length -> normalized keys
+        self._automaton = None
+
+    def __len__(self) -> int:
+        return len(self._node_keys)
+
+    def add(self, node_id: str, label: Optional[str] = None):
+        """Indexes a node under its id and label. Re-adding a node replaces its keys."""
+        if node_id in self._node_keys:
+            self.remove(node_id)
+
+        keys = []
+        for raw in (node_id, label):
+            key = normalize(raw) if raw else ""
+            if key and key not in keys:
+                keys.append(key)
+
+        for key in keys:
+            owners = self._keys.get(key)
+            if owners is None:
+                owners = self._keys[key] = set()
+                for token in tokenize(key):
+                    self._postings.setdefault(token, {}).setdefault(len(key), set()).add(key)
+                self._automaton = None
+            owners.add(node_id)
+        self._node_keys[node_id] = keys
+
+    def remove(self, node_id: str):
+        for key in self._node_keys.pop(node_id, []):
+            owners = self._keys[key]
+            owners.discard(node_id)
+            if owners:
+                continue
+            del self._keys[key]
+            for token in tokenize(key):
+                posting = self._postings.get(token)
+                if posting is not None and len(key) in posting:
+                    bucket = posting[len(key)]
+                    bucket.discard(key)
+                    if not bucket:
+                        del posting[len(key)]
+                    if not posting:
+                        del self._postings[token]
+            self._automaton = None
+
+    def clear(self):
+        self._keys.clear()
+        self._node_keys.clear()
+        self._postings.clear()
+        self._automaton = None
+
+    def copy(self) -> "NodeMatcher":
+        clone = NodeMatcher()
+        clone._keys = {key: set(owners) for key, owners in self._keys.items()}
+        clone._node_keys = {node_id: list(keys) for node_id, keys in self._node_keys.items()}
+        clone._postings = {token: {length: set(keys) for length, keys in posting.items()}
+                           for token, posting in self._postings.items()}
+        # The automaton is rebuilt (not modified) when keys change, so it can be shared
+        clone._automaton = self._automaton
+        return clone
+
+    def match(self, entity: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Returns up to `limit` (node_id, score) candidates for an entity, best first.
+        Score is 1.0 for an exact id/label match, otherwise the length ratio
+        between the shorter and the longer of the entity and the matched key.
+        """
+        query = normalize(entity)
+        if not query:
+            return []
+
+        scores: Dict[str, float] = {}
+
+        def offer(key: str, score: float):
+            for node_id in self._keys.get(key, ()):
+                if score > scores.get(node_id, 0.0):
+                    scores[node_id] = score
+
+        if query in self._keys:
+            offer(query, 1.0)
+
+        # Keys contained in the entity ("crystal spire" in "the crystal spire of aether")
+        for _, _, key in self._find_keys(query):
+            if key != query:
+                offer(key, len(key) / len(query))
+
+        # Keys containing the entity ("spire" -> "crystal spire")
+        for key in self._keys_containing(query, limit):
+            offer(key, len(query) / len(key))
+
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def lookup(self, name: str) -> Set[str]:
+        """Node ids whose normalized id or label equals the normalized name."""
+        return set(self._keys.get(normalize(name), ()))
+
+    def best(self, entity: str) -> Optional[str]:
+        candidates = self.match(entity, limit=1)
+        return candidates[0][0] if candidates else None
+
+    def scan(self, text: str) -> Tuple[List[Tuple[str, List[str]]], float]:
+        """
+        Finds every known id/label mentioned in a text in one pass.
+        Overlapping mentions are resolved leftmost-longest.
+        Returns ([(matched key, node ids)], coverage) where coverage is the share of
+        the text's non-space characters covered by the matches.
+        """
+        query = normalize(text)
+        total = len(query) - query.count(" ")
+        if not total:
+            return [], 0.0
+
+        hits = sorted(self._find_keys(query), key=lambda hit: (hit[0], hit[0] - hit[1]))
+        matches = []
+        covered = 0
+        last_end = 0
+        for start, end, key in hits:
+            if start < last_end:
+                continue
+            matches.append((key, sorted(self._keys[key])))
+            covered += len(key) - key.count(" ")
+            last_end = end
+        return matches, covered / total
+
+    # --- internals ---
+
+    def _keys_containing(self, query: str, limit: int) -> List[str]:
+        """
+        Keys longer than the query that contain it, shortest (best scoring) first.
+        Walks the rarest token's posting by key length and stops after the first length
+        that yields `limit` keys, or after CONTAINING_CANDIDATES keys have been examined.
+        """
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        postings = []
+        for token in tokens:
+            posting = self._postings.get(token)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=lambda posting: sum(map(len, posting.values())))
+        rarest, others = postings[0], postings[1:]
+        found = []
+        examined = 0
+        for length in sorted(length for length in rarest if length > len(query)):
+            for key in rarest[length]:
+                if query in key and all(key in other.get(length, ()) for other in others):
+                    found.append(key)
+                examined += 1
+                if examined >= CONTAINING_CANDIDATES:
+                    return found
+            if len(found) >= limit:
+                break
+        return found
+
+    def _find_keys(self, text: str) -> Iterable[Tuple[int, int, str]]:
+        """Yields (start, end, key) for every key occurring in text on word boundaries."""
+        if not self._keys:
+            return
+        if self._automaton is None:
+            self._automaton = _build_automaton(self._keys)
+        goto, fail, output = self._automaton
+
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for key in output[state]:
+                start = i - len(key) + 1
+                end = i + 1
+                # ASCII の単語は語境界でのみ一致させる ("king" が "thinking" に一致しないように)
+                if _is_word_char(key[0]) and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if _is_word_char(key[-1]) and end < len(text) and _is_word_char(text[end]):
+                    continue
+                yield start, end, key
+
+
+def _build_automaton(keys: Iterable[str]):
+    goto: List[Dict[str, int]] = [{}]
+    output: List[List[str]] = [[]]
+    for key in keys:
+        state = 0
+        for ch in key:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                output.append([])
+            state = nxt
+        output[state].append(key)
+
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for ch, nxt in goto[state].items():
+            queue.append(nxt)
+            f = fail[state]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[nxt] = goto[f].get(ch, 0)
+            output[nxt] = output[nxt] + output[fail[nxt]]
+    return goto, fail, output
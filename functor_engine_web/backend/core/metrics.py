@@ -0,0 +1,267 @@
+"""
+In-process metrics (Prometheus text format) and per-request timing breakdowns.
+
+- Counter / Histogram: label sets are created on first use; an update is a dict lookup
+  and a few additions under a lock (no background thread, no client library)
+- stage(operation, name): times a block into functor_stage_duration_seconds and into the
+  current request's RequestTimings
+- llm_callbacks.LLMUsageCallback records model calls into the metrics defined here
+  (kept separate so that importing this module does not pull in langchain)
+- MetricsMiddleware: request latency per route, optional Server-Timing response header
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, labels: tuple = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}  # labels -> [bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, ([*entry[0]], entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], Iterable[Tuple[str, str, str, Samples]]]):
+        """Registers collect() -> [(name, kind, help, [(labels, value), ...])], evaluated per scrape."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "functor_http_request_duration_seconds", "HTTP request latency until the response is complete.",
+    ("method", "route", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "functor_stage_duration_seconds", "Time spent per pipeline stage.", ("operation", "stage"))
+LLM_SECONDS = REGISTRY.histogram(
+    "functor_llm_call_duration_seconds", "Model call latency (streaming calls: until the last chunk).", ("model",))
+LLM_CALLS = REGISTRY.counter("functor_llm_calls_total", "Model calls by outcome.", ("model", "outcome"))
+LLM_TOKENS = REGISTRY.counter("functor_llm_tokens_total", "Tokens reported by the model.", ("model", "kind"))
+LLM_RETRIES = REGISTRY.counter("functor_llm_retries_total", "Model calls that were attempted again.", ("model",))
+LLM_REJECTED = REGISTRY.counter(
+    "functor_llm_rejected_total", "Model calls rejected without being sent (open circuit, full queue).",
+    ("model", "reason"))
+BATCH_FALLBACKS = REGISTRY.counter(
+    "functor_batch_fallbacks_total", "Grouped model calls redone as one call per item.", ("operation",))
+CACHE_LOOKUPS = REGISTRY.counter("functor_cache_lookups_total", "Cache lookups by result.", ("cache", "result"))
+
+
+class RequestTimings:
+    """Stage durations (summed per stage name) and model usage of one request."""
+
+    __slots__ = ("stages", "llm_seconds", "llm_calls", "tokens_in", "tokens_out", "retries", "cache")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.retries = 0
+        self.cache: Dict[str, str] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value (durations in milliseconds)."""
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        if self.llm_calls:
+            entries.append(f'llm;dur={self.llm_seconds * 1000:.1f};desc="calls={self.llm_calls} '
+                           f'tokens_in={self.tokens_in} tokens_out={self.tokens_out} retries={self.retries}"')
+        for cache, result in self.cache.items():
+            entries.append(f'cache-{cache};desc="{result}"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("functor_request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def record_stage(operation: str, name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, (operation, name))
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(operation: str, name: str):
+    """Times the block (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(operation, name, time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    result = "hit" if hit else "miss"
+    CACHE_LOOKUPS.inc(labels=(cache, result))
+    timings = _current.get()
+    if timings is not None:
+        timings.cache[cache] = result
+
+
+def record_retry(model: str):
+    LLM_RETRIES.inc(labels=(model,))
+    timings = _current.get()
+    if timings is not None:
+        timings.retries += 1
+
+
+def record_batch_fallback(operation: str):
+    BATCH_FALLBACKS.inc(labels=(operation,))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request latency per route template into functor_http_request_duration_seconds,
+    and with server_timing=True a Server-Timing header listing the stages that ran before
+    the response started (streamed responses only include what happened before the first byte).
+    """
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    value = timings.server_timing(time.perf_counter() - start)
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, (scope["method"], route, str(status)))
@@ -29,7 +29,75 @@ class TranslationResponse(BaseModel):
     translated_text: str
     applied_laws: List[str]
 
+class BatchTranslationRequest(BaseModel):
+    items: List[TranslationRequest]
+    concurrency: Optional[int] = None  # max generations in flight (None: server default)
+    stream: bool = False  # True: NDJSON, one BatchTranslationItem per line as items finish
+
+class BatchTranslationItem(BaseModel):
+    index: int
+    result: Optional[TranslationResponse] = None
+    error: Optional[str] = None
+
+class BatchTranslationResponse(BaseModel):
+    results: List[BatchTranslationItem]
+
+class DocumentTranslationRequest(BaseModel):
+    text: str
+    world_id: str = "default"
+    concurrency: Optional[int] = None  # max paragraph generations in flight (None: server default)
+
+class DocumentChunkError(BaseModel):
+    index: int  # paragraph number (0-based, counting translated paragraphs only)
+    error: str
+
+class DocumentTranslationResponse(TranslationResponse):
+    chunks: int
+    failed_chunks: List[DocumentChunkError] = []
+
+class WorldDocument(BaseModel):
+    doc_id: str
+    text: str
+
+class DocumentUpdateRequest(BaseModel):
+    documents: List[WorldDocument]
+    mode: str = "replace"  # replace: document text replaces its previous version / append: add chunks
+
+class WorldStatusResponse(BaseModel):
+    world_id: str
+    initialized: bool
+    nodes: int
+    edges: int
+    version: int
+    etag: str  # same value as the ETag of /world/graph
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str  # "initialize"
+    world_id: str
+    status: str  # queued | running | succeeded | failed | cancelled
+    stage: str  # queued | waiting | extracting | merging | merged | saving | done | cancelling
+    chunks_total: int = 0
+    chunks_done: int = 0  # finished chunks, including failed ones
+    chunks_failed: int = 0
+    nodes: int = 0  # while extracting: nodes returned by finished chunks (before deduplication)
+    edges: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class LayoutResponse(BaseModel):
+    version: int
+    positions: Dict[str, List[float]]  # node_id -> [x, y] (vis.js coordinates)
+
 class GraphDataResponse(BaseModel):
     """Data format for PyVis/Vis.js"""
     nodes: List[Dict[str, Any]]
     edges: List[Dict[str, Any]]
+    version: int = 0
+    # full=False: delta since the requested version (changed nodes/edges + removed ids)
+    full: bool = True
+    removed_nodes: List[str] = []
+    removed_edges: List[str] = []
@@ -0,0 +1,101 @@
+import heapq
+from itertools import islice
+from typing import Dict, List, Optional, Set, Tuple
+
+from .graph_logic import CategoryGraph
+from .matcher import normalize, tokenize
+
+RETRIEVAL_MODES = ("direct", "graph")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: ~4 ASCII characters per token, one token per other character (日本語など)."""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def _law_line(label: str, rule: str, target: str) -> str:
+    # get_context と同じ書式
+    return f"- {label}: {rule} (-> {target})"
+
+
+def retrieve_laws(graph: CategoryGraph, pairs: List[Tuple[str, str]], query: str,
+                  max_hops: int = 2, token_budget: int = 1200, decay: float = 0.5,
+                  max_nodes: int = 256, max_edges_per_node: int = 64,
+                  max_laws: Optional[int] = None) -> List[str]:
+    """
+    Collects the laws around all matched concepts at once, within a token budget.
+
+    A breadth-first expansion over outgoing morphisms starts from every matched node
+    simultaneously (so a law reachable from several entities is seen once) and
+    visits at most `max_nodes` nodes up to `max_hops` hops away; of a related (not
+    matched) node only the first `max_edges_per_node` morphisms are read. Each law is
+    scored decay**distance * (1 + share of its words that also appear in the query);
+    only the `max_laws` best are kept (default: as many as could fit the budget) and
+    packed greedily until `token_budget` (estimate_tokens) is spent.
+
+    Returns applied_laws entries grouped by source concept: matched concepts first
+    (in match order), then related concepts by distance.
+    """
+    seeds: Dict[str, str] = {}
+    for entity, node_id in pairs:
+        if node_id and node_id in graph and node_id not in seeds:
+            seeds[node_id] = entity
+
+    query_tokens = set(tokenize(normalize(query)))
+    distance: Dict[str, int] = {node_id: 0 for node_id in seeds}
+    frontier = list(seeds)
+    if max_laws is None:
+        max_laws = max(1, token_budget // 4)  # 1 行は最低でも約 4 トークン
+    best = []  # min-heap of the best max_laws: (score, -discovery order, source, line)
+    discovered = 0
+    seen_lines: Set[Tuple[str, str]] = set()
+    for hop in range(max_hops):
+        next_frontier = []
+        for source in frontier:
+            # 関連ノード (ハブ) の射は上限までしか読まない (密なグラフでも走査量を一定にする)
+            edges = graph.out_edges(source) if source in seeds else islice(graph.out_edges(source), max_edges_per_node)
+            for target, attrs in edges:
+                line = _law_line(attrs.get('label', 'Relation'), attrs.get('rule', ''), target)
+                if (source, line) not in seen_lines:
+                    seen_lines.add((source, line))
+                    words = set(tokenize(normalize(f"{attrs.get('label', '')} {attrs.get('rule', '')} {target}")))
+                    relevance = len(words & query_tokens) / len(words) if words else 0.0
+                    item = ((decay ** hop) * (1 + relevance), -discovered, source, line)
+                    discovered += 1
+                    if len(best) < max_laws:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+                if target not in distance and len(distance) < max_nodes:
+                    distance[target] = hop + 1
+                    next_frontier.append(target)
+        frontier = next_frontier
+
+    # 予算内に収まる法則をスコア順に採用する (見出しのトークンは最初の法則の採用時に計上)
+    selected: Dict[str, List[Tuple[int, str]]] = {}
+    remaining = token_budget
+    for _, negative_order, source, line in sorted(best, reverse=True):
+        order = -negative_order
+        cost = estimate_tokens(line) + 1
+        if source not in selected:
+            cost += estimate_tokens(_header(source, seeds, distance))
+        if cost > remaining:
+            continue
+        remaining -= cost
+        selected.setdefault(source, []).append((order, line))
+
+    sources = [s for s in seeds if s in selected]
+    sources += sorted((s for s in selected if s not in seeds), key=lambda s: (distance[s], selected[s][0][0]))
+    entries = []
+    for source in sources:
+        lines = [line for _, line in sorted(selected[source])]
+        entries.append(_header(source, seeds, distance) + "\n" + "\n".join(lines))
+    return entries
+
+
+def _header(source: str, seeds: Dict[str, str], distance: Dict[str, int]) -> str:
+    if source in seeds:
+        return f"Concept '{seeds[source]}' maps to '{source}' with laws:"
+    hops = distance[source]
+    return f"Related concept '{source}' ({hops} hop{'s' if hops > 1 else ''} away) with laws:"
@@ -0,0 +1,153 @@
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .matcher import normalize
+
+
+class SemanticIndex:
+    """
+    Offline embedding index over node labels and descriptions.
+
+    Each node is embedded as a hashed character n-gram vector (sublinear TF) and stored
+    as one row of a contiguous float32 matrix. IDF weights are applied at query time,
+    so adding a node only writes its own row and updates the document frequencies.
+    All queries of a call are scored with a single matrix product.
+    """
+
+    def __init__(self, dim: int = 1024, ngram_range: Tuple[int, int] = (2, 4),
+                 threshold: float = 0.3, label_weight: int = 2):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.threshold = threshold
+        self.label_weight = label_weight
+        self.clear()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes + self._df.nbytes
+
+    def clear(self):
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._df = np.zeros(self.dim, dtype=np.float32)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._doc_norms = None
+
+    def copy(self) -> "SemanticIndex":
+        clone = SemanticIndex.__new__(SemanticIndex)
+        clone.__dict__.update(self.__dict__)
+        clone._matrix = self._matrix.copy()
+        clone._df = self._df.copy()
+        clone._ids = list(self._ids)
+        clone._rows = dict(self._rows)
+        clone._free = list(self._free)
+        return clone
+
+    def add(self, node_id: str, label: str, description: str = ""):
+        """Embeds a node; re-adding an id overwrites its row in place."""
+        vec = self._embed(label, description)
+        row = self._rows.get(node_id)
+        if row is None:
+            row = self._free.pop() if self._free else self._append_row()
+            self._rows[node_id] = row
+            self._ids[row] = node_id
+        else:
+            self._df -= self._matrix[row] > 0
+        self._matrix[row] = vec
+        self._df += vec > 0
+        self._doc_norms = None
+
+    def remove(self, node_id: str):
+        row = self._rows.pop(node_id, None)
+        if row is None:
+            return
+        self._df -= self._matrix[row] > 0
+        self._matrix[row] = 0.0
+        self._ids[row] = None
+        self._free.append(row)
+        self._doc_norms = None
+
+    def search(self, queries: Sequence[str], k: int = 5,
+               threshold: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """Returns the top-k (node_id, cosine score) above threshold for every query."""
+        threshold = self.threshold if threshold is None else threshold
+        if not queries:
+            return []
+        n = len(self._ids)
+        if not self._rows:
+            return [[] for _ in queries]
+
+        idf = self._idf()
+        if self._doc_norms is None:
+            docs = self._matrix[:n]
+            # 完成してから代入する (同じ版を読む他のスレッドに途中の値を見せない)
+            doc_norms = np.sqrt(np.square(docs) @ np.square(idf))
+            doc_norms[doc_norms == 0] = 1.0
+            self._doc_norms = doc_norms
+
+        q = np.stack([self._vectorize(normalize(text)) for text in queries]) * idf
+        q_norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q_norms[q_norms == 0] = 1.0
+        # (queries x dim) @ (dim x nodes): one product for the whole batch
+        scores = ((q * idf) / q_norms) @ self._matrix[:n].T / self._doc_norms
+
+        k = min(max(k, 1), n)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for i, cols in enumerate(top):
+            cols = cols[np.argsort(-scores[i, cols])]
+            results.append([
+                (self._ids[c], float(scores[i, c]))
+                for c in cols
+                if scores[i, c] >= threshold and self._ids[c] is not None
+            ])
+        return results
+
+    # --- internals ---
+
+    def _append_row(self) -> int:
+        row = len(self._ids)
+        if row >= self._matrix.shape[0]:
+            # 容量を倍々で確保し、行列を連続領域のまま保つ
+            grown = np.zeros((max(64, row * 2), self.dim), dtype=np.float32)
+            grown[:row] = self._matrix[:row]
+            self._matrix = grown
+        self._ids.append(None)
+        return row
+
+    def _idf(self) -> np.ndarray:
+        n = len(self._rows)
+        return (np.log((1.0 + n) / (1.0 + self._df)) + 1.0).astype(np.float32)
+
+    def _embed(self, label: str, description: str) -> np.ndarray:
+        counts = self._counts(normalize(label or "")) * self.label_weight
+        counts += self._counts(normalize(description or ""))
+        return self._sublinear(counts)
+
+    def _vectorize(self, text: str) -> np.ndarray:
+        return self._sublinear(self._counts(text))
+
+    def _counts(self, text: str) -> np.ndarray:
+        if not text:
+            return np.zeros(self.dim, dtype=np.float32)
+        padded = f" {text} "
+        lo, hi = self.ngram_range
+        buckets = [
+            zlib.crc32(padded[i:i + n].encode("utf-8")) % self.dim
+            for n in range(lo, hi + 1)
+            for i in range(len(padded) - n + 1)
+        ]
+        return np.bincount(buckets, minlength=self.dim).astype(np.float32)
+
+    @staticmethod
+    def _sublinear(counts: np.ndarray) -> np.ndarray:
+        out = np.zeros_like(counts)
+        mask = counts > 0
+        out[mask] = 1.0 + np.log(counts[mask])
+        return out
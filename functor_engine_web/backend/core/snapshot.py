@@ -0,0 +1,166 @@
+"""
+Compact binary snapshot format for CategoryGraph (*.fgs).
+
+Layout (little endian, every array section aligned to 8 bytes):
+
+    header      magic "FGS1", format version, string/node/edge counts,
+                graph version, graph fingerprint, graph meta (string index of a JSON
+                object with the source documents, or -1)
+    strings     uint64 offsets[n_strings + 1] + one UTF-8 blob (every string stored once)
+    nodes       int32 columns id, label, description, type, meta  (string indices;
+                label == -1 marks an endpoint node without a WorldObject)
+    edges       int32 columns source, target, label, rule, attrs  (attrs: JSON of
+                extra edge attributes or -1)
+
+Loading memory-maps the file, reads the columns as NumPy views and rebuilds the
+graph in bulk without per-field Pydantic validation.
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Dict, List
+
+import numpy as np
+
+from .graph_logic import CategoryGraph, DEFAULT_BACKEND
+from .models import WorldObject
+
+MAGIC = b"FGS1"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct("<4sHHIIIQ40si")
+_NODE_COLUMNS = 5
+_EDGE_COLUMNS = 5
+_CORE_EDGE_ATTRS = ("label", "rule")
+
+
+def _pad(size: int) -> int:
+    return (-size) % 8
+
+
+class _StringTable:
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def intern(self, value: str) -> int:
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+
+def save_snapshot(graph: CategoryGraph, path: str):
+    """Writes the graph to `path` atomically (tmp file + rename)."""
+    table = _StringTable()
+    intern = table.intern
+
+    nodes = np.full((graph.number_of_nodes(), _NODE_COLUMNS), -1, dtype=np.int32)
+    for i, (node_id, obj) in enumerate(graph.nodes()):
+        nodes[i, 0] = intern(node_id)
+        if obj is not None:
+            nodes[i, 1] = intern(obj.label)
+            nodes[i, 2] = intern(obj.description)
+            nodes[i, 3] = intern(obj.type)
+            if obj.meta:
+                nodes[i, 4] = intern(json.dumps(obj.meta, ensure_ascii=False, sort_keys=True))
+
+    edges = np.full((graph.number_of_edges(), _EDGE_COLUMNS), -1, dtype=np.int32)
+    for i, (u, v, _, attrs) in enumerate(graph.edges()):
+        edges[i, 0] = intern(u)
+        edges[i, 1] = intern(v)
+        edges[i, 2] = intern(attrs.get("label", ""))
+        edges[i, 3] = intern(attrs.get("rule", ""))
+        extra = {k: val for k, val in attrs.items() if k not in _CORE_EDGE_ATTRS}
+        if extra:
+            edges[i, 4] = intern(json.dumps(extra, ensure_ascii=False, sort_keys=True))
+
+    graph_meta = intern(json.dumps({"documents": graph.documents}, ensure_ascii=False)) if graph.documents else -1
+
+    encoded = [s.encode("utf-8") for s in table.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    if encoded:
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    blob = b"".join(encoded)
+
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, 0, len(encoded), len(nodes), len(edges),
+        graph.version, graph.fingerprint.encode("ascii"), graph_meta,
+    )
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        for chunk in (header, offsets.tobytes(), blob):
+            f.write(chunk)
+            f.write(b"\0" * _pad(len(chunk)))
+        f.write(nodes.tobytes())
+        f.write(edges.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot_version(path: str) -> int:
+    """Reads only the graph version from a snapshot's header."""
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+    magic, fmt, _, _, _, _, version, _, _ = _HEADER.unpack(header)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        raise ValueError(f"Not a Functor Engine snapshot (v{FORMAT_VERSION}): {path}")
+    return version
+
+
+def load_snapshot(path: str, backend: str = DEFAULT_BACKEND) -> CategoryGraph:
+    """Reads a snapshot written by save_snapshot into a graph with the given storage backend."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Empty snapshot: {path}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return _load_from_buffer(buf, path, backend)
+
+
+def _load_from_buffer(buf, path: str, backend: str) -> CategoryGraph:
+    magic, fmt, _, n_strings, n_nodes, n_edges, version, fingerprint, graph_meta = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or fmt != FORMAT_VERSION:
+        raise ValueError(f"Not a Functor Engine snapshot (v{FORMAT_VERSION}): {path}")
+
+    pos = _HEADER.size + _pad(_HEADER.size)
+    offsets = np.frombuffer(buf, dtype=np.uint64, count=n_strings + 1, offset=pos)
+    pos += offsets.nbytes + _pad(offsets.nbytes)
+    blob_size = int(offsets[-1])
+    blob = buf[pos:pos + blob_size]
+    pos += blob_size + _pad(blob_size)
+    nodes = np.frombuffer(buf, dtype=np.int32, count=n_nodes * _NODE_COLUMNS, offset=pos)
+    nodes = nodes.reshape(n_nodes, _NODE_COLUMNS)
+    pos += nodes.nbytes
+    edges = np.frombuffer(buf, dtype=np.int32, count=n_edges * _EDGE_COLUMNS, offset=pos)
+    edges = edges.reshape(n_edges, _EDGE_COLUMNS)
+
+    bounds = offsets.tolist()
+    strings = [blob[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(n_strings)]
+    load_json = lambda i: json.loads(strings[i])
+
+    node_records = []
+    for node_id, label, description, node_type, meta in nodes.tolist():
+        if label < 0:
+            node_records.append((strings[node_id], {}))
+            continue
+        node_records.append((strings[node_id], {"data": WorldObject.model_construct(
+            id=strings[node_id],
+            label=strings[label],
+            description=strings[description],
+            type=strings[node_type],
+            meta=load_json(meta) if meta >= 0 else {},
+        )}))
+
+    edge_records = []
+    for source, target, label, rule, extra in edges.tolist():
+        attrs = load_json(extra) if extra >= 0 else {}
+        attrs["label"] = strings[label]
+        attrs["rule"] = strings[rule]
+        edge_records.append((strings[source], strings[target], attrs))
+
+    graph = CategoryGraph(backend)
+    graph.load_bulk(node_records, edge_records)
+    graph.reset_history(version, fingerprint.decode("ascii"))
+    if graph_meta >= 0:
+        graph.documents = load_json(graph_meta).get("documents", {})
+    return graph
@@ -0,0 +1,122 @@
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from .graph_logic import CategoryGraph
+from .models import WorldObject, Morphism
+
+SOURCES = "sources"  # provenance: WorldObject.meta["sources"] / edge attribute "sources"
+
+
+def parse_node(node_data: Dict[str, Any]) -> WorldObject:
+    """Builds a WorldObject from LLM output, filling the optional fields it often omits."""
+    node_id = str(node_data["id"])
+    return WorldObject(
+        id=node_id,
+        label=node_data.get("label") or node_id,
+        description=node_data.get("description") or "",
+        type=node_data.get("type") or "concept",
+        meta=node_data.get("meta") or {},
+    )
+
+
+def _with_sources(node: WorldObject, sources: List[str], description: str = None) -> WorldObject:
+    update = {"meta": {**node.meta, SOURCES: sources}}
+    if description is not None:
+        update["description"] = description
+    return node.model_copy(update=update)
+
+
+def apply_extractions(graph: CategoryGraph, items: List[Tuple[str, Dict[str, Any]]]):
+    """
+    Merges per-chunk {"nodes": [...], "edges": [...]} extractions into the graph.
+
+    `items` are (provenance key, extraction) pairs. Nodes are deduplicated against the
+    graph by normalized id or label (the existing id wins, the longest description
+    wins); edges are deduplicated on (source, target, normalized label). Every node
+    and edge records the keys of the chunks it came from, so retract_sources can
+    remove exactly what a chunk contributed.
+    All nodes are applied before any edge so edges may refer to nodes of other chunks.
+    """
+    for key, extraction in items:
+        for node_data in extraction.get("nodes", []):
+            try:
+                node = parse_node(node_data)
+            except Exception as e:
+                print(f"Skipping invalid node {node_data!r}: {e}")
+                continue
+            existing_id = graph.lookup(node.id) or graph.lookup(node.label)
+            existing = graph.get_node(existing_id) if existing_id else None
+            if existing is None:
+                # 新規ノード (エッジ端点としてだけ存在していた場合は WorldObject を付与)
+                if existing_id:
+                    node = node.model_copy(update={"id": existing_id})
+                graph.add_node(_with_sources(node, [key]))
+                continue
+            sources = list(existing.meta.get(SOURCES, []))
+            description = node.description if len(node.description) > len(existing.description) else None
+            if key not in sources or description is not None:
+                if key not in sources:
+                    sources.append(key)
+                graph.add_node(_with_sources(existing, sources, description))
+
+    for key, extraction in items:
+        for edge_data in extraction.get("edges", []):
+            try:
+                edge = Morphism(**edge_data)
+            except Exception as e:
+                print(f"Skipping invalid edge {edge_data!r}: {e}")
+                continue
+            source = graph.lookup(edge.source) or edge.source
+            target = graph.lookup(edge.target) or edge.target
+            edge_key = graph.find_edge(source, target, edge.label) if source in graph else None
+            if edge_key is None:
+                graph.add_morphism(edge.model_copy(update={"source": source, "target": target}), **{SOURCES: [key]})
+                continue
+            sources = list(graph.get_edge(source, target, edge_key).get(SOURCES, []))
+            if key not in sources:
+                graph.update_edge(source, target, edge_key, **{SOURCES: sources + [key]})
+
+
+def retract_sources(graph: CategoryGraph, keys: Iterable[str]) -> Dict[str, int]:
+    """
+    Removes the contribution of the given chunk keys.
+    Elements whose provenance becomes empty are removed; a node that lost all its
+    sources but is still referenced by remaining edges is kept as a bare endpoint.
+    Elements without provenance (e.g. from older snapshots) are never touched.
+    """
+    keys: Set[str] = set(keys)
+    stats = {"nodes_removed": 0, "edges_removed": 0}
+    if not keys:
+        return stats
+
+    touched_endpoints = set()
+    for u, v, edge_key, attrs in list(graph.edges()):
+        sources = attrs.get(SOURCES)
+        if not sources or keys.isdisjoint(sources):
+            continue
+        remaining = [s for s in sources if s not in keys]
+        if remaining:
+            graph.update_edge(u, v, edge_key, **{SOURCES: remaining})
+        else:
+            graph.remove_edge(u, v, edge_key)
+            touched_endpoints.update((u, v))
+            stats["edges_removed"] += 1
+
+    for node_id, node in list(graph.nodes()):
+        sources = node.meta.get(SOURCES) if node is not None else None
+        if not sources or keys.isdisjoint(sources):
+            continue
+        remaining = [s for s in sources if s not in keys]
+        if remaining:
+            graph.add_node(_with_sources(node, remaining))
+        elif graph.degree(node_id):
+            graph.demote_node(node_id)
+        else:
+            graph.remove_node(node_id)
+            stats["nodes_removed"] += 1
+
+    # 削除したエッジの端点で、WorldObject も他のエッジも持たないものを掃除する
+    for node_id in touched_endpoints:
+        if node_id in graph and graph.get_node(node_id) is None and not graph.degree(node_id):
+            graph.remove_node(node_id)
+            stats["nodes_removed"] += 1
+    return stats
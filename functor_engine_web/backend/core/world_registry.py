@@ -0,0 +1,241 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from .graph_logic import CategoryGraph, DEFAULT_BACKEND
+from .snapshot import load_snapshot, read_snapshot_version, save_snapshot
+
+WORLD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+SNAPSHOT_EXT = ".fgs"
+
+
+class WorldRegistry:
+    """
+    Maps world ids to CategoryGraph instances.
+
+    Worlds are kept in LRU order. When the estimated memory of the loaded worlds
+    exceeds `memory_budget_bytes`, the least recently used ones are written to
+    `snapshot_dir` and dropped from memory; they are loaded back lazily on the next get().
+    Without a snapshot directory nothing is evicted (there would be nowhere to put it).
+    Snapshots are read and written outside the registry lock, and an evicted world whose
+    version is already on disk is dropped without writing it again.
+    Graphs created or loaded by the registry use the `backend` storage (see graph_store).
+
+    Registered graphs are immutable snapshots (CategoryGraph.freeze): readers use the
+    graph get() returned for a whole request without locking, writers build a new
+    version on graph.copy() and put() it. An old version is freed by the garbage
+    collector once no request holds it anymore.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None, memory_budget_bytes: Optional[int] = None,
+                 backend: str = DEFAULT_BACKEND):
+        self.snapshot_dir = snapshot_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.backend = backend
+        self._worlds: "OrderedDict[str, CategoryGraph]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._evicting: Dict[str, CategoryGraph] = {}  # 追い出し中 (スナップショット書き込み待ち)
+        self._on_disk: Dict[str, int] = {}  # world_id -> スナップショットに書かれている版
+        self._io_locks: Dict[str, threading.Lock] = {}  # world ごとのスナップショット書き込み
+        self.evictions = 0
+        self.loads = 0
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    @staticmethod
+    def validate_id(world_id: str) -> str:
+        if not WORLD_ID_PATTERN.match(world_id or ""):
+            raise ValueError(f"Invalid world id: {world_id!r} (use 1-64 of A-Z a-z 0-9 _ -)")
+        return world_id
+
+    def get(self, world_id: str, create: bool = False) -> Optional[CategoryGraph]:
+        """Returns the world's graph, loading it from its snapshot if it was evicted."""
+        graph = self.peek(world_id)
+        if graph is not None:
+            return graph
+
+        # スナップショットの読み込みはロックの外で行う (他の World の読み手を待たせない)
+        path = self._snapshot_path(world_id)
+        if path and os.path.exists(path):
+            graph = load_snapshot(path, self.backend)
+            loaded = True
+        elif create:
+            graph = CategoryGraph(self.backend)
+            loaded = False
+        else:
+            return None
+        graph.freeze()
+
+        with self._lock:
+            current = self.peek(world_id)
+            if current is not None:
+                return current  # 並行して読み込まれた (または put された) 版を使う
+            if loaded:
+                self.loads += 1
+                self._on_disk[world_id] = graph.version
+            self._worlds[world_id] = graph
+            victims = self._select_victims(keep=world_id)
+        self._evict(victims)
+        return graph
+
+    def peek(self, world_id: str) -> Optional[CategoryGraph]:
+        """Returns the world's graph if it is in memory (never touches the disk)."""
+        self.validate_id(world_id)
+        with self._lock:
+            graph = self._worlds.get(world_id)
+            if graph is None:
+                # 追い出し中ならそのまま戻す (書き込み前のスナップショットを読まないように)
+                graph = self._evicting.pop(world_id, None)
+                if graph is None:
+                    return None
+                self._worlds[world_id] = graph
+            self._worlds.move_to_end(world_id)
+            return graph
+
+    def put(self, world_id: str, graph: CategoryGraph, persist: bool = True):
+        """
+        Publishes `graph` as the world's current version (freezing it) and, by default,
+        writes its snapshot. Concurrent put() calls for the same world must be
+        serialized by the caller.
+        """
+        self.validate_id(world_id)
+        with self._lock:
+            previous = self._previous_version(world_id, graph)
+            current = self._worlds.get(world_id)
+            evicting = self._evicting.pop(world_id, None)  # 書き込み待ちの古い版は捨てる
+            if current is None:
+                current = evicting
+        if not graph.frozen:
+            # A copy() of the current version continues its change log. Any other
+            # replacement continues after the old version, so a client's
+            # ?since=<old version> gets a full export instead of a wrong delta
+            if previous is not None and not graph.derived_from(current):
+                graph.reset_history(max(graph.version, previous + 1))
+            if current is not None and current is not graph and graph.layout_state is None:
+                # 置き換え前の配置を引き継ぎ、レイアウトをウォームスタートできるようにする
+                graph.layout_state = current.layout_state
+            graph.freeze()
+        # スナップショットは公開前にロックの外で書く (書き込み中も他の World の読み手を待たせない)
+        if persist and self.snapshot_dir:
+            with self._io_lock(world_id):
+                save_snapshot(graph, self._snapshot_path(world_id))
+                with self._lock:
+                    self._on_disk[world_id] = graph.version
+        with self._lock:
+            self._evicting.pop(world_id, None)
+            self._worlds[world_id] = graph
+            self._worlds.move_to_end(world_id)
+            victims = self._select_victims(keep=world_id)
+        self._evict(victims)
+
+    def preload(self, world_ids: Optional[List[str]] = None) -> List[str]:
+        """Loads snapshots into memory ahead of the first request (all of them when world_ids is None)."""
+        if world_ids is None:
+            world_ids = [w["world_id"] for w in self.list_worlds() if not w["loaded"]]
+        loaded = []
+        for world_id in world_ids:
+            if self.get(world_id) is not None:
+                loaded.append(world_id)
+        return loaded
+
+    def delete(self, world_id: str) -> bool:
+        self.validate_id(world_id)
+        with self._io_lock(world_id), self._lock:
+            found = self._worlds.pop(world_id, None) is not None
+            found = self._evicting.pop(world_id, None) is not None or found
+            self._on_disk.pop(world_id, None)
+            path = self._snapshot_path(world_id)
+            if path and os.path.exists(path):
+                os.remove(path)
+                found = True
+            return found
+
+    def list_worlds(self) -> List[Dict[str, object]]:
+        with self._lock:
+            worlds = {
+                world_id: {"world_id": world_id, "loaded": True,
+                           "nodes": graph.number_of_nodes(),
+                           "edges": graph.number_of_edges()}
+                for world_id, graph in [*self._worlds.items(), *self._evicting.items()]
+            }
+            if self.snapshot_dir:
+                for name in os.listdir(self.snapshot_dir):
+                    world_id, ext = os.path.splitext(name)
+                    if ext == SNAPSHOT_EXT and world_id not in worlds and WORLD_ID_PATTERN.match(world_id):
+                        worlds[world_id] = {"world_id": world_id, "loaded": False}
+            return sorted(worlds.values(), key=lambda w: w["world_id"])
+
+    def memory_usage(self) -> int:
+        with self._lock:
+            return sum(graph.estimated_memory() for graph in self._worlds.values())
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "loaded_worlds": len(self._worlds),
+                "estimated_bytes": self.memory_usage(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "evictions": self.evictions,
+                "loads": self.loads,
+            }
+
+    # --- internals ---
+
+    def _select_victims(self, keep: str) -> List[str]:
+        """Moves least recently used worlds over the budget to _evicting (call with the lock held)."""
+        if not self.memory_budget_bytes or not self.snapshot_dir:
+            return []
+        usage = self.memory_usage()
+        victims = []
+        for world_id in list(self._worlds):
+            if usage <= self.memory_budget_bytes:
+                break
+            if world_id == keep:
+                continue
+            graph = self._worlds.pop(world_id)
+            self._evicting[world_id] = graph
+            usage -= graph.estimated_memory()
+            victims.append(world_id)
+        return victims
+
+    def _evict(self, victims: List[str]):
+        """Writes the snapshots of the selected worlds (outside the lock) and drops them."""
+        for world_id in victims:
+            with self._io_lock(world_id):
+                with self._lock:
+                    graph = self._evicting.get(world_id)
+                    if graph is None:
+                        continue  # その間に get / put で戻された
+                    saved = self._on_disk.get(world_id) == graph.version
+                if not saved:
+                    save_snapshot(graph, self._snapshot_path(world_id))
+                with self._lock:
+                    if self._evicting.get(world_id) is graph:
+                        del self._evicting[world_id]
+                        self._on_disk[world_id] = graph.version
+                        self.evictions += 1
+
+    def _io_lock(self, world_id: str) -> threading.Lock:
+        with self._lock:
+            return self._io_locks.setdefault(world_id, threading.Lock())
+
+    def _previous_version(self, world_id: str, graph: CategoryGraph) -> Optional[int]:
+        current = self._worlds.get(world_id, self._evicting.get(world_id))
+        if current is graph:
+            return None
+        if current is not None:
+            return current.version
+        path = self._snapshot_path(world_id)
+        if path and os.path.exists(path):
+            try:
+                return read_snapshot_version(path)
+            except (OSError, ValueError):
+                return None
+        return None
+
+    def _snapshot_path(self, world_id: str) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        return os.path.join(self.snapshot_dir, f"{world_id}{SNAPSHOT_EXT}")
@@ -1,12 +1,41 @@
 import os
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+from collections import defaultdict
 from dotenv import load_dotenv
 
+from core import metrics
+from core.cache import TranslationCache
 from core.graph_logic import CategoryGraph
-from core.llm_service import FunctorEngine
-from core.models import TranslationRequest, TranslationResponse, GraphDataResponse
+from core.jobs import Job, JobManager
+from core.image_pipeline import DescriptionCache, ImageTooLarge, InvalidImage, read_upload
+from core.layout import layout_graph
+from core.llm_gateway import LLMGateway, LLMUnavailable
+from core.world_registry import WorldRegistry
+# core.llm_service (langchain / Gemini SDK) は重いため、エンジンを作るときに読み込む
+if TYPE_CHECKING:
+    from core.llm_service import FunctorEngine
+from core.models import (
+    TranslationRequest,
+    TranslationResponse,
+    GraphDataResponse,
+    BatchTranslationRequest,
+    BatchTranslationItem,
+    BatchTranslationResponse,
+    DocumentTranslationRequest,
+    DocumentTranslationResponse,
+    DocumentUpdateRequest,
+    WorldStatusResponse,
+    LayoutResponse,
+    JobResponse,
+)
 
 # Load environment variables
 # Load environment variables
@@ -31,56 +60,564 @@ else:
     print("WARNING: Gemini.env not found, using default .env or system variables.")
 
 API_KEY = os.getenv("GEMINI_API_KEY")
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_THRESHOLD", "0.3"))
+CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "3600"))
+CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH")  # e.g. ./cache/translations.sqlite3
+CACHE_DISK_ROWS = int(os.getenv("TRANSLATION_CACHE_DISK_ROWS", "100000"))
+LOCAL_EXTRACTION = os.getenv("LOCAL_EXTRACTION", "0").lower() in ("1", "true", "yes")
+LOCAL_COVERAGE_THRESHOLD = float(os.getenv("LOCAL_COVERAGE_THRESHOLD", "0.2"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+DOCUMENT_CHUNK_CHARS = int(os.getenv("DOCUMENT_CHUNK_CHARS", "2000"))
+WORLD_SNAPSHOT_DIR = os.getenv("WORLD_SNAPSHOT_DIR", "worlds")
+WORLD_MEMORY_BUDGET_MB = os.getenv("WORLD_MEMORY_BUDGET_MB")  # unset: no eviction
+INIT_CONCURRENCY = int(os.getenv("INIT_CONCURRENCY", "4"))
+INIT_CHUNK_CHARS = int(os.getenv("INIT_CHUNK_CHARS", "6000"))
+INIT_JOB_WORKERS = int(os.getenv("INIT_JOB_WORKERS", "2"))
+PRELOAD_WORLDS = os.getenv("PRELOAD_WORLDS", "")  # "*" or comma separated world ids
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "networkx")  # networkx | array
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "direct")  # direct | graph
+RETRIEVAL_MAX_HOPS = int(os.getenv("RETRIEVAL_MAX_HOPS", "2"))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "1200"))
+IMAGE_MAX_UPLOAD_BYTES = int(float(os.getenv("IMAGE_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+IMAGE_HASH_DISTANCE = int(os.getenv("IMAGE_HASH_DISTANCE", "0"))  # 0: exact (same prepared bytes) only
+FUSED_TRANSLATION = os.getenv("FUSED_TRANSLATION", "0").lower() in ("1", "true", "yes")
+FUSED_MAX_CANDIDATES = int(os.getenv("FUSED_MAX_CANDIDATES", "12"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RPM = os.getenv("LLM_RPM")  # unset: no client-side limit
+LLM_TPM = os.getenv("LLM_TPM")  # unset: no client-side limit
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "100"))
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()  # background | blocking | off
 
-app = FastAPI(title="Functor Engine API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # スナップショットを起動時に読み込む (未指定のものは最初のリクエスト時に遅延ロード)
+    if PRELOAD_WORLDS.strip():
+        world_ids = None if PRELOAD_WORLDS.strip() == "*" else [w.strip() for w in PRELOAD_WORLDS.split(",") if w.strip()]
+        loaded = await asyncio.to_thread(world_registry.preload, world_ids)
+        print(f"Preloaded worlds: {', '.join(loaded) or '(none)'}")
+    # エンジン (LLM クライアント) の準備: background は受け付けを始めてから別スレッドで行う
+    if API_KEY and STARTUP_WARMUP in ("background", "blocking"):
+        warm_up = asyncio.ensure_future(asyncio.to_thread(_warm_up))
+        if STARTUP_WARMUP == "blocking":
+            await warm_up
+    yield
+    # 書き込み待ちのディスクキャッシュを保存する
+    await asyncio.to_thread(translation_cache.close)
+
+app = FastAPI(title="Functor Engine API", lifespan=lifespan)
+# リクエストごとの所要時間 (/metrics) と、SERVER_TIMING 有効時は Server-Timing ヘッダーで内訳を返す
+app.add_middleware(metrics.MetricsMiddleware, server_timing=SERVER_TIMING)
+
+DEFAULT_WORLD_ID = "default"
 
 # Global State
-graph = CategoryGraph()
-engine = None
+world_registry = WorldRegistry(
+    snapshot_dir=WORLD_SNAPSHOT_DIR,
+    memory_budget_bytes=int(float(WORLD_MEMORY_BUDGET_MB) * 1024 * 1024) if WORLD_MEMORY_BUDGET_MB else None,
+    backend=GRAPH_BACKEND,
+)
+# World ごとの書き込みロック (初期化・文書更新を直列化する。翻訳は待たない)
+world_write_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# World ごとのレイアウト計算ロック (同じ版を重複して計算しない)
+layout_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# World 初期化ジョブ (同時実行は INIT_JOB_WORKERS 件まで、残りは順番待ち)
+jobs = JobManager(max_workers=INIT_JOB_WORKERS)
+translation_cache = TranslationCache(max_size=CACHE_SIZE, ttl=CACHE_TTL, disk_path=CACHE_PATH,
+                                     disk_max_rows=CACHE_DISK_ROWS)
+image_cache = DescriptionCache(max_size=IMAGE_CACHE_SIZE, max_distance=IMAGE_HASH_DISTANCE)
 
-if API_KEY:
-    engine = FunctorEngine(graph, API_KEY)
-else:
+def _gateway(model: str) -> LLMGateway:
+    # テキスト用・画像用で枠を分ける (画像の遅い呼び出しで翻訳が詰まらないように)
+    return LLMGateway(
+        model,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        rpm=float(LLM_RPM) if LLM_RPM else None,
+        tpm=float(LLM_TPM) if LLM_TPM else None,
+        max_retries=LLM_MAX_RETRIES,
+        failure_threshold=LLM_BREAKER_THRESHOLD,
+        reset_timeout=LLM_BREAKER_RESET,
+        max_queue=LLM_MAX_QUEUE,
+    )
+
+llm_gateways = {"text": _gateway("text"), "vision": _gateway("vision")}
+# 最初に必要になった時 (または起動時のウォームアップ) に作る。load_engine() を参照
+engine: Optional["FunctorEngine"] = None
+_engine_lock = threading.Lock()
+
+if not API_KEY:
     print("WARNING: GEMINI_API_KEY not found. Engine will not work.")
 
+def load_engine() -> Optional["FunctorEngine"]:
+    """Returns the engine, creating it on first use (None without an API key)."""
+    global engine
+    if engine is not None or not API_KEY:
+        return engine
+    with _engine_lock:
+        if engine is None:
+            from core.llm_service import FunctorEngine
+            engine = FunctorEngine(
+                world_registry.get(DEFAULT_WORLD_ID, create=True),
+                API_KEY,
+                semantic_threshold=SEMANTIC_THRESHOLD,
+                cache=translation_cache,
+                local_extraction=LOCAL_EXTRACTION,
+                local_coverage_threshold=LOCAL_COVERAGE_THRESHOLD,
+                init_concurrency=INIT_CONCURRENCY,
+                init_chunk_chars=INIT_CHUNK_CHARS,
+                retrieval_mode=RETRIEVAL_MODE,
+                retrieval_max_hops=RETRIEVAL_MAX_HOPS,
+                retrieval_token_budget=RETRIEVAL_TOKEN_BUDGET,
+                image_max_side=IMAGE_MAX_SIDE,
+                image_quality=IMAGE_JPEG_QUALITY,
+                image_cache=image_cache,
+                fused=FUSED_TRANSLATION,
+                fused_max_candidates=FUSED_MAX_CANDIDATES,
+                text_gateway=llm_gateways["text"],
+                vision_gateway=llm_gateways["vision"],
+            )
+    return engine
+
+def _warm_up():
+    start = time.perf_counter()
+    try:
+        load_engine().warm_up()
+        print(f"Engine warmed up in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        # 失敗しても最初のリクエスト時に改めて作る
+        print(f"Error warming up engine: {e}")
+
+async def _load_engine() -> "FunctorEngine":
+    # import・初期化はスレッドで行い、その間もイベントループを止めない
+    base_engine = engine if engine is not None else await asyncio.to_thread(load_engine)
+    if base_engine is None:
+        raise HTTPException(status_code=500, detail="Engine not initialized (Missing API Key)")
+    return base_engine
+
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    # モデル側の過負荷・障害は 503 + Retry-After で返す (クライアントが待って再送できるように)
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
+
 class WorldInitRequest(BaseModel):
     config_text: str
 
+def get_world(world_id: str) -> CategoryGraph:
+    """Looks up a world (the default world always exists)."""
+    try:
+        world = world_registry.get(world_id, create=(world_id == DEFAULT_WORLD_ID))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if world is None:
+        raise HTTPException(status_code=404, detail=f"World not found: {world_id}")
+    return world
+
+async def _load_world(world_id: str) -> CategoryGraph:
+    """get_world for async handlers: snapshot loads (and the evictions they trigger) run in a thread."""
+    try:
+        world = world_registry.peek(world_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return world if world is not None else await asyncio.to_thread(get_world, world_id)
+
+async def get_engine(world_id: str) -> "FunctorEngine":
+    base_engine = await _load_engine()
+    return base_engine.for_graph(await _load_world(world_id))
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to Functor Engine API"}
 
-@app.post("/world/initialize")
-async def initialize_world(request: WorldInitRequest):
-    if not engine:
-        raise HTTPException(status_code=500, detail="Engine not initialized (Missing API Key)")
-    
+@app.get("/worlds")
+def list_worlds():
+    return {"worlds": world_registry.list_worlds(), "stats": world_registry.stats()}
+
+async def _initialize(world_id: str, config_text: str, wait: bool):
+    """
+    Starts an initialization job and returns its id (202) right away; poll GET /jobs/{id}.
+    With ?wait=true the request blocks until the job finishes (previous behaviour).
+    """
+    base_engine = await _load_engine()
     try:
-        node_count = await engine.initialize_world_from_text(request.config_text)
-        return {"status": "initialized", "nodes": node_count}
+        WorldRegistry.validate_id(world_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def run(job: Job):
+        # 新しいグラフを別に構築し、完成してから差し替える (構築中も旧 World で翻訳できる)
+        world = CategoryGraph(GRAPH_BACKEND)
+        job.update(stage="waiting")  # 同じ World の書き込み (初期化・文書更新) の完了待ち
+        async with world_write_locks[world_id]:
+            node_count = await base_engine.for_graph(world).initialize_world_from_text(config_text, progress=job.update)
+            job.update(stage="saving")
+            # 公開 (スナップショット保存を含む) もループの外で行う
+            await asyncio.to_thread(world_registry.put, world_id, world)
+        return {"status": "initialized", "world_id": world_id, "nodes": node_count}
+
+    job = jobs.submit("initialize", world_id, run)
+    if not wait:
+        return JSONResponse(
+            {"status": "queued", "job_id": job.job_id, "world_id": world_id},
+            status_code=202,
+            headers={"Location": f"/jobs/{job.job_id}"},
+        )
+    # クライアントが切断してもジョブは続ける
+    try:
+        return await asyncio.shield(job.task)
+    except asyncio.CancelledError:
+        if job.status == "cancelled":
+            raise HTTPException(status_code=409, detail=f"Job cancelled: {job.job_id}")
+        raise
+    except LLMUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/world/initialize")
+async def initialize_world(request: WorldInitRequest, wait: bool = False):
+    return await _initialize(DEFAULT_WORLD_ID, request.config_text, wait)
+
+@app.post("/world/{world_id}/initialize")
+async def initialize_world_by_id(world_id: str, request: WorldInitRequest, wait: bool = False):
+    return await _initialize(world_id, request.config_text, wait)
+
+def _get_job(job_id: str) -> Job:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/jobs", response_model=List[JobResponse])
+def list_jobs():
+    return [job.to_dict() for job in jobs.list()]
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+# async: ジョブのタスクはイベントループ上のものなので、キャンセルもループ上で行う (スレッドプールからは安全でない)
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    if job.finished:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}: {job_id}")
+    jobs.cancel(job_id)
+    return job.to_dict()
+
+async def _update_documents(world_id: str, request: DocumentUpdateRequest):
+    base_engine = await get_engine(world_id)
+    async with world_write_locks[world_id]:
+        # 公開中の版はそのままにコピーを更新し、完成後に差し替える (翻訳は常に完成した版を読む)
+        # 公開中の版は読み取り専用なので、コピーは別スレッドで作れる (大きなグラフでもループを止めない)
+        world_engine = base_engine.for_graph(await asyncio.to_thread((await _load_world(world_id)).copy))
+        try:
+            result = await world_engine.update_documents(
+                [(doc.doc_id, doc.text) for doc in request.documents], mode=request.mode
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        await asyncio.to_thread(world_registry.put, world_id, world_engine.graph)
+    return {"status": "updated", "world_id": world_id, **result}
+
+async def _delete_document(world_id: str, doc_id: str):
+    base_engine = await get_engine(world_id)
+    async with world_write_locks[world_id]:
+        world = await _load_world(world_id)
+        if doc_id not in world.documents:
+            raise HTTPException(status_code=404, detail=f"Document not found: {doc_id}")
+        world_engine = base_engine.for_graph(await asyncio.to_thread(world.copy))
+        result = await asyncio.to_thread(world_engine.delete_document, doc_id)
+        await asyncio.to_thread(world_registry.put, world_id, world_engine.graph)
+    return {"status": "deleted", "world_id": world_id, "doc_id": doc_id, **result}
+
+def _list_documents(world_id: str):
+    world = get_world(world_id)
+    return {
+        "world_id": world_id,
+        "documents": [{"doc_id": doc_id, "chunks": len(keys)} for doc_id, keys in world.documents.items()],
+    }
+
+@app.get("/world/documents")
+def list_documents():
+    return _list_documents(DEFAULT_WORLD_ID)
+
+@app.post("/world/documents")
+async def update_documents(request: DocumentUpdateRequest):
+    return await _update_documents(DEFAULT_WORLD_ID, request)
+
+@app.delete("/world/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    return await _delete_document(DEFAULT_WORLD_ID, doc_id)
+
+@app.get("/world/{world_id}/documents")
+def list_documents_by_id(world_id: str):
+    return _list_documents(world_id)
+
+@app.post("/world/{world_id}/documents")
+async def update_documents_by_id(world_id: str, request: DocumentUpdateRequest):
+    return await _update_documents(world_id, request)
+
+@app.delete("/world/{world_id}/documents/{doc_id}")
+async def delete_document_by_id(world_id: str, doc_id: str):
+    return await _delete_document(world_id, doc_id)
+
+@app.delete("/world/{world_id}")
+def delete_world(world_id: str):
+    try:
+        found = world_registry.delete(world_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail=f"World not found: {world_id}")
+    return {"status": "deleted", "world_id": world_id}
+
 @app.post("/translate", response_model=TranslationResponse)
 async def translate(request: TranslationRequest):
-    if not engine:
-        raise HTTPException(status_code=500, detail="Engine not initialized")
-    
-    result = await engine.translate_text(request.text)
+    world_engine = await get_engine(request.world_id)
+    result = await world_engine.translate_text(request.text)
     return TranslationResponse(**result)
 
+@app.post("/translate/stream")
+async def translate_stream(request: TranslationRequest):
+    """Server-Sent Events: `laws` first, then `chunk` events as the model generates, then `done`."""
+    world_engine = await get_engine(request.world_id)
+
+    async def event_source():
+        try:
+            async for event in world_engine.translate_text_stream(request.text):
+                name = event.pop("event")
+                yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _run_batch(request: BatchTranslationRequest, concurrency: int):
+    """Runs a batch (possibly spanning several worlds) and yields (index, result, error) as items finish."""
+    groups: Dict[str, List[int]] = {}
+    for i, item in enumerate(request.items):
+        groups.setdefault(item.world_id, []).append(i)
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run(world_id: str, indices: List[int]):
+        done = set()
+        try:
+            world_engine = await get_engine(world_id)
+            texts = [request.items[i].text for i in indices]
+            async for i, result, error in world_engine.translate_batch(texts, concurrency=concurrency):
+                done.add(indices[i])
+                await queue.put((indices[i], result, error))
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            for i in indices:
+                if i not in done:
+                    await queue.put((i, None, detail))
+        finally:
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(run(world_id, indices)) for world_id, indices in groups.items()]
+    remaining = len(tasks)
+    while remaining:
+        item = await queue.get()
+        if item is None:
+            remaining -= 1
+        else:
+            yield item
+
+@app.post("/translate/batch", response_model=BatchTranslationResponse)
+async def translate_batch(request: BatchTranslationRequest):
+    """Translates many texts; results keep input order (or stream as NDJSON when `stream` is set)."""
+    await _load_engine()
+
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+
+    def to_item(index, result, error):
+        return BatchTranslationItem(
+            index=index,
+            result=TranslationResponse(**result) if result is not None else None,
+            error=error,
+        )
+
+    if request.stream:
+        async def ndjson():
+            async for index, result, error in _run_batch(request, concurrency):
+                yield to_item(index, result, error).model_dump_json() + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results = [None] * len(request.items)
+    async for index, result, error in _run_batch(request, concurrency):
+        results[index] = to_item(index, result, error)
+    return BatchTranslationResponse(results=results)
+
+@app.post("/translate/document", response_model=DocumentTranslationResponse)
+async def translate_document(request: DocumentTranslationRequest):
+    """
+    Long documents: translated per paragraph in parallel and reassembled in order.
+    Paragraphs are cached separately, so after an edit only the changed ones are translated again.
+    """
+    world_engine = await get_engine(request.world_id)
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    result = await world_engine.translate_document(request.text, concurrency=concurrency,
+                                                   max_chars=DOCUMENT_CHUNK_CHARS)
+    if result["chunks"] and len(result["failed_chunks"]) == result["chunks"]:
+        # 全段落が失敗: 部分的な結果がないのでエラーとして返す
+        raise HTTPException(status_code=502, detail=result["failed_chunks"][0]["error"])
+    return DocumentTranslationResponse(**result)
+
 @app.post("/translate/image", response_model=TranslationResponse)
-async def translate_image(file: UploadFile = File(...)):
-    if not engine:
-        raise HTTPException(status_code=500, detail="Engine not initialized")
+async def translate_image(file: UploadFile = File(...), world_id: str = Form(DEFAULT_WORLD_ID)):
+    world_engine = await get_engine(world_id)
     
+    # サイズが分かる場合は読む前に拒否し、それ以外はチャンク単位で読みながら上限を確認する
+    if file.size is not None and file.size > IMAGE_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds the upload limit of {IMAGE_MAX_UPLOAD_BYTES} bytes")
     try:
-        contents = await file.read()
-        result = await engine.translate_image(contents, file.content_type)
+        contents = await read_upload(file, IMAGE_MAX_UPLOAD_BYTES)
+        result = await world_engine.translate_image(contents, file.content_type)
         return TranslationResponse(**result)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LLMUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _world_status(world_id: str) -> WorldStatusResponse:
+    world = get_world(world_id)
+    return WorldStatusResponse(
+        world_id=world_id,
+        initialized=world.number_of_nodes() > 0,
+        nodes=world.number_of_nodes(),
+        edges=world.number_of_edges(),
+        version=world.version,
+        etag=world.etag,
+    )
+
+# グラフ本体を取得せずに状態を確認するための軽量エンドポイント
+@app.get("/world/status", response_model=WorldStatusResponse)
+def get_world_status():
+    return _world_status(DEFAULT_WORLD_ID)
+
+@app.get("/world/{world_id}/status", response_model=WorldStatusResponse)
+def get_world_status_by_id(world_id: str):
+    return _world_status(world_id)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def _graph_response(world_id: str, request: Request, since: Optional[int]) -> Response:
+    """
+    Full export (cached bytes per version) or, with ?since=<version>, only the changes
+    after that version. ETag/If-None-Match lets clients skip unchanged graphs entirely.
+    """
+    world = await _load_world(world_id)
+    headers = {"ETag": world.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), world.etag):
+        return Response(status_code=304, headers=headers)
+    # 公開済みの版は凍結されているので、シリアライズはスレッドで行える (大きな World でもループを止めない)
+    if since is not None:
+        delta = await asyncio.to_thread(world.export_delta, since)
+        if delta is not None:
+            return JSONResponse(delta, headers=headers)
+    content = await asyncio.to_thread(world.export_json)
+    return Response(content=content, media_type="application/json", headers=headers)
+
 @app.get("/world/graph", response_model=GraphDataResponse)
-def get_graph():
-    return graph.export_for_vis()
+async def get_graph(request: Request, since: Optional[int] = None):
+    return await _graph_response(DEFAULT_WORLD_ID, request, since)
+
+@app.get("/world/{world_id}/graph", response_model=GraphDataResponse)
+async def get_graph_by_id(world_id: str, request: Request, since: Optional[int] = None):
+    return await _graph_response(world_id, request, since)
+
+async def _layout_response(world_id: str, request: Request) -> Response:
+    """
+    Node positions for the current graph version (computed once per version in a
+    worker thread, warm-started from the previous version's positions).
+    """
+    world = await _load_world(world_id)
+    if _etag_matches(request.headers.get("if-none-match"), world.etag):
+        return Response(status_code=304, headers={"ETag": world.etag, "Cache-Control": "no-cache"})
+    async with layout_locks[world_id]:
+        state = world.layout_state
+        if state is None or state[0] != world.version:
+            # 凍結された版なので、ノード・エッジの走査も含めてスレッドで行う
+            state = await asyncio.to_thread(layout_graph, world)
+            world.layout_state = state
+    headers = {"Cache-Control": "no-cache"}
+    if state[0] == world.version:
+        headers["ETag"] = world.etag
+    return JSONResponse({"version": state[0], "positions": state[1]}, headers=headers)
+
+@app.get("/world/layout", response_model=LayoutResponse)
+async def get_layout(request: Request):
+    return await _layout_response(DEFAULT_WORLD_ID, request)
+
+@app.get("/world/{world_id}/layout", response_model=LayoutResponse)
+async def get_layout_by_id(world_id: str, request: Request):
+    return await _layout_response(world_id, request)
+
+@app.get("/llm/stats")
+def get_llm_stats():
+    return {name: gateway.stats() for name, gateway in llm_gateways.items()}
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {**translation_cache.stats(), "images": image_cache.stats()}
+
+def _collect_state():
+    """Gauges read at scrape time (caches, loaded worlds, jobs)."""
+    yield ("functor_cache_entries", "gauge", "Entries held in memory per cache.",
+           [({"cache": "translation"}, translation_cache.stats()["size"]),
+            ({"cache": "image"}, image_cache.stats()["size"])])
+    stats = world_registry.stats()
+    yield ("functor_worlds_loaded", "gauge", "Worlds held in memory.", [({}, stats["loaded_worlds"])])
+    yield ("functor_worlds_estimated_bytes", "gauge", "Estimated memory used by loaded worlds.",
+           [({}, stats["estimated_bytes"])])
+    statuses = defaultdict(int)
+    for job in jobs.list():
+        statuses[job.status] += 1
+    yield ("functor_jobs", "gauge", "Background jobs by status (finished jobs still kept for polling).",
+           [({"status": status}, count) for status, count in sorted(statuses.items())])
+    gateways = [gateway.stats() for gateway in llm_gateways.values()]
+    yield ("functor_llm_in_flight", "gauge", "Model calls currently running.",
+           [({"model": g["model"]}, g["in_flight"]) for g in gateways])
+    yield ("functor_llm_queued", "gauge", "Model calls waiting for a slot or the rate limit.",
+           [({"model": g["model"]}, g["queued"]) for g in gateways])
+    yield ("functor_llm_circuit_state", "gauge", "Circuit breaker state per model (1 for the current state).",
+           [({"model": g["model"], "state": state}, int(g["circuit"] == state))
+            for g in gateways for state in ("closed", "open", "half_open")])
+
+metrics.REGISTRY.collector(_collect_state)
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text format: request / stage / model call latency histograms, token and cache counters."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
@@ -1,7 +1,8 @@
 import streamlit as st
-from utils.api_client import APIClient
-from utils.viz_helper import render_graph
+from utils.api_client import APIClient, make_session
+from utils.viz_helper import DEFAULT_MAX_NODES, graph_clusters, render_graph
 import io
+import time
 
 # Page Config
 st.set_page_config(
@@ -80,7 +81,109 @@ st.markdown("""
 
 # Initialize API Client
 # Assuming backend is running on localhost:8000
-api = APIClient(base_url="http://localhost:8000")
+# cache_resource: コネクションプールは全セッションで共有する
+@st.cache_resource
+def get_http_session():
+    return make_session()
+
+# グラフ・レイアウトのキャッシュは書き換えられるので、クライアントはセッションごとに作る
+def get_api_client():
+    if "api_client" not in st.session_state:
+        st.session_state.api_client = APIClient(base_url="http://localhost:8000", session=get_http_session())
+    return st.session_state.api_client
+
+api = get_api_client()
+
+# World の状態は rerun ごとに一度だけ取得する (World を変更した後は取り直す)
+_world_status = {}
+
+def world_status(refresh=False):
+    if refresh or "value" not in _world_status:
+        _world_status["value"] = api.get_status()
+    return _world_status["value"]
+
+def world_ready():
+    status = world_status()
+    return "error" not in status and status.get("initialized", False)
+
+def load_graph_data():
+    """Downloads the graph only when its ETag changed since the last rerun of this session."""
+    status = world_status()
+    if "error" in status:
+        return status
+    cached = st.session_state.get("graph_data")
+    if cached is None or st.session_state.get("graph_etag") != status["etag"]:
+        cached = api.get_graph_data()
+        if "error" not in cached:
+            # ETag は取得したグラフ自身のものを使う (/world/status の後に更新されていることがある)
+            st.session_state.graph_data = cached
+            st.session_state.graph_etag = cached["etag"]
+    return cached
+
+INIT_STAGES = {
+    "queued": "順番待ち", "waiting": "他の更新の完了待ち", "extracting": "概念を抽出中",
+    "merging": "統合中", "merged": "統合中", "saving": "保存中", "cancelling": "キャンセル中",
+}
+JOB_DONE = ("succeeded", "failed", "cancelled")
+JOB_RETRY_INTERVAL = 3.0  # 接続エラー・タイムアウト後にポーリングを再開するまでの秒数
+
+def start_initialize(config_text):
+    job = api.initialize_world(config_text)
+    if "error" in job:
+        st.error(f"失敗: {job['error']}")
+    else:
+        st.session_state.init_job = job["job_id"]
+
+def follow_init_job():
+    """
+    Shows the progress of the running initialization job until it finishes.
+    The job keeps running on the server across reruns; the button cancels it.
+    Connection errors and timeouts keep polling; the job is forgotten only once it
+    reached a final status (or the server no longer knows it).
+    """
+    job_id = st.session_state.init_job
+    if st.button("初期化をキャンセル", key="cancel_init"):
+        api.cancel_job(job_id)
+    bar = st.progress(0.0, text="Worldを初期化中...")
+
+    def on_progress(job):
+        stage = INIT_STAGES.get(job["stage"], job["stage"])
+        total = job["chunks_total"]
+        text = f"{stage}: {job['chunks_done']}/{total} チャンク, {job['nodes']} 概念, {job['edges']} 法則"
+        bar.progress(min(job["chunks_done"] / total, 1.0) if total else 0.0, text=text)
+
+    while True:
+        job = api.wait_for_job(job_id, on_progress)
+        if "error" in job and job["error"].startswith("404"):
+            break  # サーバーが再起動した等でジョブが存在しない
+        if "error" not in job and job["status"] in JOB_DONE:
+            break
+        # 一時的なエラー: ジョブはサーバーで続いているので追跡をやめない
+        bar.progress(0.0, text=f"進捗を取得できません。再試行します... ({job.get('error', job.get('status'))})")
+        time.sleep(JOB_RETRY_INTERVAL)
+    bar.empty()
+    del st.session_state.init_job
+    if "error" in job:
+        st.error(f"失敗: ジョブが見つかりません ({job['error']})")
+    elif job["status"] == "succeeded":
+        st.success(f"Worldを初期化しました! ({job['result'].get('nodes', 0)}概念を生成しました)")
+        world_status(refresh=True)
+    elif job["status"] == "cancelled":
+        st.warning("初期化をキャンセルしました。World は変更されていません。")
+    else:
+        st.error(f"失敗: {job.get('error')}")
+
+def load_layout(graph_data):
+    """Server-computed node positions for the graph shown (fetched once per graph version)."""
+    if "error" in graph_data or not graph_data.get("nodes"):
+        return {}
+    cached = st.session_state.get("graph_layout")
+    if cached is None or cached.get("version") != graph_data.get("version"):
+        with st.spinner("グラフの配置を計算中..."):
+            cached = api.get_layout()
+        if "error" not in cached:
+            st.session_state.graph_layout = cached
+    return cached
 
 # --- Sidebar: World Management ---
 st.sidebar.title("🔮 Functor Engine Info")
@@ -90,19 +193,19 @@ st.sidebar.subheader("初期情報")
 if st.sidebar.button("初期化"):
     # Reset logic if needed, for now just a placeholder or re-init graph
     st.sidebar.info("Initialization requested...")
-st.sidebar.info("Initialized Status: " + ("Ready" if "error" not in api.get_graph_data() else "Not Ready"))
+st.sidebar.info("Initialized Status: " + ("Ready" if world_ready() else "Not Ready"))
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("疎通確認")
 if st.sidebar.button("実行"):
-    graph_data = api.get_graph_data()
-    if "error" in graph_data:
+    status = world_status(refresh=True)
+    if "error" in status:
         st.sidebar.error("Connection Failed")
         st.sidebar.info(f"Categorize Test: Failed")
         st.sidebar.info(f"Generated Test: Failed")
     else:
         st.sidebar.success("Connection OK")
-        st.sidebar.info(f"Categorize Test: OK ({len(graph_data.get('nodes', []))} nodes)")
+        st.sidebar.info(f"Categorize Test: OK ({status.get('nodes', 0)} nodes)")
         st.sidebar.info(f"Generated Test: OK")
 
 st.sidebar.markdown("---")
@@ -130,12 +233,7 @@ with col1:
             if not world_def_input.strip():
                 st.warning("Worldを定義する文章を入力してください。")
             else:
-                with st.spinner("Worldを初期化中..."):
-                    result = api.initialize_world(world_def_input)
-                    if "error" in result:
-                        st.error(f"失敗: {result['error']}")
-                    else:
-                        st.success(f"Worldを初期化しました! ({result.get('nodes', 0)}概念を生成しました)")
+                start_initialize(world_def_input)
 
     with col1tab2:
         uploaded_files = st.file_uploader("Markdownファイルをアップロード", type="md", accept_multiple_files=True, key="world_files")
@@ -149,14 +247,12 @@ with col1:
             st.text_area("Preview (Combined)", combined_text, height=150, disabled=True)
             
             if st.button("Worldを初期化", key="init_world_file"):
-                with st.spinner("Worldを初期化中..."):
-                    result = api.initialize_world(combined_text)
-                    if "error" in result:
-                        st.error(f"失敗: {result['error']}")
-                    else:
-                        st.success(f"Worldを初期化しました! ({result.get('nodes', 0)}概念を生成しました)")
+                start_initialize(combined_text)
+
+    if st.session_state.get("init_job"):
+        follow_init_job()
 
-    st.info("File Status: " + ("Loaded" if "error" not in api.get_graph_data() else "Empty"))
+    st.info("File Status: " + ("Loaded" if world_ready() else "Empty"))
 
 # --- Column 2: Transformation Target ---
 with col2:
@@ -164,6 +260,7 @@ with col2:
     col2tab1, col2tab2, col2tab3 = st.tabs(["文章" ,"ファイル" ,"画像"])
     
     target_text = ""
+    target_is_document = False
     
     with col2tab1:
         input_text_area = st.text_area("文章を入力してください:", height=150, placeholder="例:\nご飯を買いにコンビニへ行った。")
@@ -176,6 +273,7 @@ with col2:
             for input_file in input_files:
                 stringio = io.StringIO(input_file.getvalue().decode("utf-8"))
                 target_text += stringio.read() + "\n\n"
+            target_is_document = True
             st.text_area("Preview", target_text, height=100, disabled=True)
         st.info("File Status: " + ("Ready" if target_text else "Waiting"))
 
@@ -199,12 +297,10 @@ with col3:
         if not target_text.strip() and not image_file:
             st.warning("文章を入力するか、画像をアップロードしてください。")
         else:
-            with st.spinner("生成中..."):
-                if image_file:
-                     # Prioritize image if uploaded
-                     result = api.translate_image(image_file)
-                else:
-                    result = api.translate(target_text)
+            if image_file:
+                with st.spinner("生成中..."):
+                    # Prioritize image if uploaded
+                    result = api.translate_image(image_file)
                 
                 if "error" in result:
                     st.error(f"文章生成に失敗しました: {result['error']}")
@@ -216,13 +312,75 @@ with col3:
                     with st.expander("適用された法則を表示"):
                         for law in result.get('applied_laws', []):
                             st.text(law)
+            elif target_is_document:
+                # ファイルは段落ごとに並列で翻訳する (編集後の再実行では変更した段落だけが再翻訳される)
+                with st.spinner("生成中..."):
+                    result = api.translate_document(target_text)
+
+                if "error" in result:
+                    st.error(f"文章生成に失敗しました: {result['error']}")
+                else:
+                    failed = result.get("failed_chunks", [])
+                    if failed:
+                        st.warning(f"{len(failed)} / {result['chunks']} 段落の生成に失敗しました（原文のまま表示しています）")
+                    else:
+                        st.success("文章生成に成功しました!")
+                    st.markdown("### 生成結果")
+                    st.markdown(result["translated_text"])
+
+                    with st.expander("適用された法則を表示"):
+                        for law in result.get('applied_laws', []):
+                            st.text(law)
+            else:
+                # テキストはストリーミングで受信し、生成されたそばから表示する
+                st.markdown("### 生成結果")
+                output = st.empty()
+                output.markdown("> 生成中...")
+                translated_text = ""
+                applied_laws = []
+                error = None
+                for event, data in api.translate_stream(target_text):
+                    if event == "laws":
+                        applied_laws = data.get("applied_laws", [])
+                    elif event == "chunk":
+                        translated_text += data.get("text", "")
+                        output.markdown(f"> {translated_text}")
+                    elif event == "done":
+                        translated_text = data.get("translated_text", translated_text)
+                        output.markdown(f"> {translated_text}")
+                    elif event == "error":
+                        error = data.get("detail", "unknown error")
+                
+                if error:
+                    st.error(f"文章生成に失敗しました: {error}")
+                else:
+                    st.success("文章生成に成功しました!")
+                    
+                with st.expander("適用された法則を表示"):
+                    for law in applied_laws:
+                        st.text(law)
                             
     st.markdown("---")
     st.subheader("World Graph")
     if st.button("Refresh Graph"):
         st.rerun()
         
-    graph_data = api.get_graph_data()
-    error_msg = render_graph(graph_data)
+    graph_data = load_graph_data()
+    graph_key = graph_data.get("etag")
+    expanded = []
+    clusters = graph_clusters(graph_data, graph_key) if "error" not in graph_data else {}
+    if clusters:
+        # 大きな World は次数上位のノードだけを表示し、残りはクラスタにまとめる
+        st.caption(f"{len(graph_data['nodes'])}概念のうち、つながりの多い{DEFAULT_MAX_NODES}概念を表示しています")
+        expanded = st.multiselect(
+            "展開するクラスタ",
+            options=sorted(clusters, key=lambda c: -len(clusters[c]["members"])),
+            format_func=lambda c: f"{clusters[c]['label']} ({len(clusters[c]['members'])})",
+        )
+    layout = load_layout(graph_data)
+    positions = layout.get("positions") if "error" not in layout else None
+    # 配置はグラフと別に取得するので、描画のキャッシュキーには配置の版も含める
+    render_key = f"{graph_key}:{layout.get('version')}" if positions and graph_key else graph_key
+    error_msg = render_graph(graph_data, cache_key=render_key, expanded=expanded, positions=positions)
     if error_msg:
         st.error(error_msg)
@@ -1,13 +1,35 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import time
+
+# (接続, 読み取り) タイムアウト秒。初期化は LLM 抽出を含むため長めにする
+DEFAULT_TIMEOUT = (3.05, 120)
+INITIALIZE_TIMEOUT = (3.05, 900)
+STATUS_TIMEOUT = (3.05, 10)
+
+def make_session(pool_size=10):
+    """requests.Session with a keep-alive connection pool (can be shared by several APIClients)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 class APIClient:
-    def __init__(self, base_url="http://localhost:8000"):
+    def __init__(self, base_url="http://localhost:8000", pool_size=10, session=None):
         self.base_url = base_url
+        # Keep-alive 付きのコネクションプールを全リクエストで共有する
+        self.session = session if session is not None else make_session(pool_size)
+        # world_id -> last graph export (see get_graph_data) / last layout (see get_layout)
+        # キャッシュはクライアントごと (= 画面のセッションごと) に持つ。共有するのはコネクションプールだけ
+        self._graph_cache = {}
+        self._layout_cache = {}
 
     def _handle_request(self, method, url, **kwargs):
         try:
-            response = requests.request(method, url, **kwargs)
+            kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+            response = self.session.request(method, url, **kwargs)
             # ステータスコードが4xx, 5xxの場合でも、サーバーからのレスポンス(detail)を取得して表示する
             if not response.ok:
                 try:
@@ -19,32 +41,166 @@ class APIClient:
         except requests.exceptions.RequestException as e:
             return {"error": str(e)}
 
-    def initialize_world(self, config_text: str):
+    def _world_url(self, world_id, path):
+        # world_id 未指定時は従来の default World 用エンドポイントを使う
+        if world_id:
+            return f"{self.base_url}/world/{world_id}/{path}"
+        return f"{self.base_url}/world/{path}"
+
+    def initialize_world(self, config_text: str, world_id=None):
+        """Starts an initialization job; returns {"job_id", ...} (see wait_for_job)."""
         return self._handle_request(
             "POST",
-            f"{self.base_url}/world/initialize",
+            self._world_url(world_id, "initialize"),
             json={"config_text": config_text}
         )
 
-    def translate(self, text: str):
+    def get_job(self, job_id):
+        return self._handle_request("GET", f"{self.base_url}/jobs/{job_id}", timeout=STATUS_TIMEOUT)
+
+    def cancel_job(self, job_id):
+        return self._handle_request("DELETE", f"{self.base_url}/jobs/{job_id}", timeout=STATUS_TIMEOUT)
+
+    def wait_for_job(self, job_id, on_progress=None, poll_interval=1.0, timeout=INITIALIZE_TIMEOUT[1]):
+        """Polls a job until it finishes; calls on_progress(job) after every poll and returns the last state."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if on_progress is not None and "error" not in job:
+                on_progress(job)
+            if "error" in job or job["status"] not in ("queued", "running"):
+                return job
+            if time.monotonic() > deadline:
+                return {"error": f"Timed out waiting for job {job_id}"}
+            time.sleep(poll_interval)
+
+    def translate(self, text: str, world_id="default"):
         return self._handle_request(
             "POST",
             f"{self.base_url}/translate",
-            json={"text": text}
+            json={"text": text, "world_id": world_id}
+        )
+
+    def translate_batch(self, texts, concurrency=None, world_id="default"):
+        return self._handle_request(
+            "POST",
+            f"{self.base_url}/translate/batch",
+            json={"items": [{"text": text, "world_id": world_id} for text in texts], "concurrency": concurrency}
+        )
+
+    def translate_document(self, text: str, concurrency=None, world_id="default"):
+        """Long documents: translated per paragraph on the server and returned in order."""
+        return self._handle_request(
+            "POST",
+            f"{self.base_url}/translate/document",
+            json={"text": text, "world_id": world_id, "concurrency": concurrency},
+            timeout=INITIALIZE_TIMEOUT,
         )
 
-    def translate_image(self, image_file):
+    def translate_stream(self, text: str, world_id="default"):
+        """
+        Calls /translate/stream and yields (event, data) tuples as they arrive.
+        Events: "laws", "chunk", "done", "error".
+        """
+        try:
+            with self.session.post(f"{self.base_url}/translate/stream", json={"text": text, "world_id": world_id},
+                                   stream=True, timeout=DEFAULT_TIMEOUT) as response:
+                if not response.ok:
+                    try:
+                        error_detail = response.json().get("detail", response.text)
+                    except:
+                        error_detail = response.reason
+                    yield "error", {"detail": f"{response.status_code} Error: {error_detail}"}
+                    return
+
+                response.encoding = "utf-8"
+                event, data_lines = "message", []
+                # chunk_size=None: 受信したチャンクをそのまま処理し、バッファリングで遅延させない
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        data_lines.append(line[len("data:"):].strip())
+                    elif not line and data_lines:
+                        # 空行でイベントが確定する (SSE)
+                        yield event, json.loads("\n".join(data_lines))
+                        event, data_lines = "message", []
+        except requests.exceptions.RequestException as e:
+            yield "error", {"detail": str(e)}
+
+    def translate_image(self, image_file, world_id="default"):
         files = {"file": image_file}
         return self._handle_request(
             "POST",
             f"{self.base_url}/translate/image",
-            files=files
+            files=files,
+            data={"world_id": world_id}
         )
 
-    def get_graph_data(self):
+    def get_status(self, world_id=None):
+        """Node/edge counts, version and ETag of a world without downloading the graph."""
+        return self._handle_request("GET", self._world_url(world_id, "status"), timeout=STATUS_TIMEOUT)
+
+    def get_graph_data(self, world_id=None):
+        """
+        Returns {"nodes", "edges", "version", "etag"} of a world (version and ETag of this payload).
+        The last result is kept per world: unchanged graphs are revalidated with
+        If-None-Match (304, no body) and changed ones fetched as a delta (?since=).
+        """
+        cached = self._graph_cache.get(world_id)
+        headers, params = {}, {}
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+            params["since"] = cached["version"]
         try:
-            response = requests.get(f"{self.base_url}/world/graph")
+            response = self.session.get(self._world_url(world_id, "graph"), headers=headers, params=params,
+                                        timeout=DEFAULT_TIMEOUT)
+            if response.status_code == 304 and cached:
+                return self._graph_view(cached)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
         except requests.exceptions.RequestException as e:
             return {"error": str(e)}
+
+        if data.get("full", True) or not cached:
+            state = {
+                "nodes": {n["id"]: n for n in data.get("nodes", [])},
+                "edges": {e.get("id", i): e for i, e in enumerate(data.get("edges", []))},
+            }
+        else:
+            state = cached
+            for node_id in data.get("removed_nodes", []):
+                state["nodes"].pop(node_id, None)
+            for edge_id in data.get("removed_edges", []):
+                state["edges"].pop(edge_id, None)
+            state["nodes"].update((n["id"], n) for n in data.get("nodes", []))
+            state["edges"].update((e["id"], e) for e in data.get("edges", []))
+        state["version"] = data.get("version", 0)
+        state["etag"] = response.headers.get("ETag", "")
+        self._graph_cache[world_id] = state
+        return self._graph_view(state)
+
+    def get_layout(self, world_id=None):
+        """
+        Returns {"version", "positions": {node_id: [x, y]}} computed by the backend.
+        Revalidated with If-None-Match like get_graph_data.
+        """
+        cached = self._layout_cache.get(world_id)
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+        try:
+            # 大きな World では初回計算に時間がかかるため、読み取りタイムアウトは初期化と同じにする
+            response = self.session.get(self._world_url(world_id, "layout"), headers=headers,
+                                        timeout=INITIALIZE_TIMEOUT)
+            if response.status_code == 304 and cached:
+                return cached["data"]
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            return {"error": str(e)}
+        self._layout_cache[world_id] = {"etag": response.headers.get("ETag"), "data": data}
+        return data
+
+    @staticmethod
+    def _graph_view(state):
+        return {"nodes": list(state["nodes"].values()), "edges": list(state["edges"].values()),
+                "version": state["version"], "etag": state["etag"] or None}
@@ -1,31 +1,135 @@
+import streamlit as st
 import streamlit.components.v1 as components
 from pyvis.network import Network
-import tempfile
-import os
+from collections import Counter, defaultdict
 
-def render_graph(graph_data):
+# これを超えるノード数の World は詳細度を落として描画する (上位ノード + クラスタ)
+DEFAULT_MAX_NODES = 300
+CLUSTER_PREFIX = "cluster:"
+
+
+def _assign_clusters(nodes, edges, max_nodes):
     """
-    Renders a PyVis graph in Streamlit using the provided graph data.
-    graph_data should be a dict with 'nodes' and 'edges' lists.
+    The top `max_nodes` nodes by degree and the cluster every other node collapses into.
+    Returns (by_id, ranked ids, visible ids, {cluster_id: {"label", "members"}}, {node_id: cluster_id}).
     """
-    if "error" in graph_data:
-        return f"Error loading graph: {graph_data['error']}"
+    degree = Counter()
+    neighbors = defaultdict(set)
+    for edge in edges:
+        degree[edge["from"]] += 1
+        degree[edge["to"]] += 1
+        neighbors[edge["from"]].add(edge["to"])
+        neighbors[edge["to"]].add(edge["from"])
+
+    by_id = {node["id"]: node for node in nodes}
+    ranked = sorted(by_id, key=lambda n: (-degree[n], n))
+    visible = set(ranked[:max_nodes])
+
+    clusters = {}
+    owner = {}
+    for node_id in ranked[max_nodes:]:
+        hubs = [n for n in neighbors[node_id] if n in visible]
+        if hubs:
+            hub = min(hubs, key=lambda n: (-degree[n], n))
+            cluster_id = f"{CLUSTER_PREFIX}{hub}"
+            label = by_id[hub].get("label", hub)
+        else:
+            group = by_id[node_id].get("group", "concept")
+            cluster_id = f"{CLUSTER_PREFIX}group:{group}"
+            label = group
+        cluster = clusters.setdefault(cluster_id, {"label": label, "members": []})
+        cluster["members"].append(node_id)
+        owner[node_id] = cluster_id
+    return by_id, ranked, visible, clusters, owner
+
+
+def level_of_detail(graph_data, max_nodes=DEFAULT_MAX_NODES, expanded=(), positions=None):
+    """
+    Reduces a large graph for display.
 
+    The `max_nodes` nodes with the highest degree stay visible. Every other node is
+    collapsed into a cluster: the cluster of its highest-degree visible neighbor, or
+    one cluster per node group when it has none. Edges touching a cluster are merged
+    into one edge per pair. Clusters listed in `expanded` show their members (at most
+    `max_nodes` of them) individually. With `positions`, a cluster is placed at the
+    mean position of its collapsed members.
+    Returns (reduced graph_data, {cluster_id: {"label", "members"}}).
+    """
     nodes = graph_data.get("nodes", [])
     edges = graph_data.get("edges", [])
+    if len(nodes) <= max_nodes:
+        return graph_data, {}
 
-    if not nodes:
-        return "No graph data available."
+    by_id, ranked, visible, clusters, owner = _assign_clusters(nodes, edges, max_nodes)
+
+    # 展開されたクラスタのメンバーを個別に表示する (多すぎる分はクラスタに残す)
+    for cluster_id in expanded:
+        for node_id in clusters.get(cluster_id, {}).get("members", [])[:max_nodes]:
+            visible.add(node_id)
+            owner.pop(node_id, None)
+
+    out_nodes = [by_id[n] for n in ranked if n in visible]
+    remaining = Counter(owner.values())
+    for cluster_id, count in remaining.items():
+        cluster = clusters[cluster_id]
+        members = [m for m in cluster["members"] if m in owner]
+        cluster_node = {
+            "id": cluster_id,
+            "label": f"{cluster['label']} +{count}",
+            "title": ", ".join(by_id[m].get("label", m) for m in members[:20]) + (" ..." if count > 20 else ""),
+            "group": "cluster",
+            "value": count,
+        }
+        placed = [positions[m] for m in members if positions and m in positions]
+        if placed:
+            cluster_node["x"] = sum(p[0] for p in placed) / len(placed)
+            cluster_node["y"] = sum(p[1] for p in placed) / len(placed)
+        out_nodes.append(cluster_node)
+
+    out_edges = []
+    merged = defaultdict(list)
+    for edge in edges:
+        u = edge["from"] if edge["from"] in visible else owner.get(edge["from"], edge["from"])
+        v = edge["to"] if edge["to"] in visible else owner.get(edge["to"], edge["to"])
+        if u == edge["from"] and v == edge["to"]:
+            out_edges.append(edge)
+        elif u != v:
+            merged[(u, v)].append(edge.get("label", ""))
+    for (u, v), labels in merged.items():
+        out_edges.append({
+            "from": u,
+            "to": v,
+            "label": f"{len(labels)} laws" if len(labels) > 1 else labels[0],
+            "title": ", ".join(sorted(set(labels))[:10]),
+        })
+
+    return {"nodes": out_nodes, "edges": out_edges}, clusters
+
+
+def generate_graph_html(graph_data, positions=None):
+    """
+    Builds the PyVis page in memory (no temp files).
+    With `positions` ({node_id: [x, y]} from the backend layout) nodes are drawn at
+    fixed coordinates and the browser-side physics simulation is turned off.
+    """
+    nodes = graph_data.get("nodes", [])
+    edges = graph_data.get("edges", [])
 
     net = Network(height="500px", width="100%", bgcolor="#222222", font_color="white", notebook=False)
-    
+
     # Add nodes
     for node in nodes:
+        options = {"value": node["value"]} if "value" in node else {}
+        if positions:
+            xy = (node["x"], node["y"]) if "x" in node else positions.get(node["id"])
+            if xy is not None:
+                options.update(x=xy[0], y=xy[1], physics=False)
         net.add_node(
             node["id"],
             label=node.get("label", node["id"]),
             title=node.get("title", ""),
-            group=node.get("group", "concept")
+            group=node.get("group", "concept"),
+            **options
         )
 
     # Add edges
@@ -37,23 +141,60 @@ def render_graph(graph_data):
             title=edge.get("title", "")
         )
 
-    # Physics options for better layout
-    net.force_atlas_2based()
-    
-    # Save to a temporary file and read it back
+    if positions:
+        # 配置はサーバーで計算済み: ブラウザでの物理シミュレーションを行わない
+        net.toggle_physics(False)
+    else:
+        # Physics options for better layout
+        net.force_atlas_2based()
+    return net.generate_html(notebook=False)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _cached_view(_graph_data, cache_key, max_nodes, expanded, _positions=None, has_positions=False):
+    # _graph_data / _positions はハッシュしない (巨大になりうるため)。キャッシュは cache_key (グラフの版) で区別する
+    reduced, _ = level_of_detail(_graph_data, max_nodes, expanded, _positions)
+    return generate_graph_html(reduced, _positions)
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _cached_clusters(_graph_data, cache_key, max_nodes):
+    # クラスタ分けだけを計算する (HTML は描画しない)
+    return _assign_clusters(_graph_data.get("nodes", []), _graph_data.get("edges", []), max_nodes)[3]
+
+
+def graph_clusters(graph_data, cache_key=None, max_nodes=DEFAULT_MAX_NODES):
+    """Clusters the level-of-detail view would collapse (for an expand-on-demand selector)."""
+    if len(graph_data.get("nodes", [])) <= max_nodes:
+        return {}
+    key = cache_key if cache_key is not None else graph_data.get("etag")
+    if key is None:
+        return _assign_clusters(graph_data.get("nodes", []), graph_data.get("edges", []), max_nodes)[3]
+    return _cached_clusters(graph_data, key, max_nodes)
+
+
+def render_graph(graph_data, cache_key=None, max_nodes=DEFAULT_MAX_NODES, expanded=(), positions=None):
+    """
+    Renders a PyVis graph in Streamlit using the provided graph data.
+    graph_data should be a dict with 'nodes' and 'edges' lists.
+    The HTML is cached per (cache_key, max_nodes, expanded) for the whole process;
+    cache_key defaults to graph_data["etag"] (the ETag the graph payload came with) and
+    must change whenever the graph (or the layout) does.
+    `positions` (backend layout) disables the in-browser physics.
+    """
+    if "error" in graph_data:
+        return f"Error loading graph: {graph_data['error']}"
+
+    if not graph_data.get("nodes"):
+        return "No graph data available."
+
+    key = cache_key if cache_key is not None else graph_data.get("etag")
     try:
-        # Create a temp file, close it so PyVis can write to it, then read it back
-        fd, path = tempfile.mkstemp(suffix=".html")
-        os.close(fd) # Close the file descriptor immediately
-        
-        net.save_graph(path)
-        
-        with open(path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        # Clean up temp file
-        os.unlink(path)
-        
+        if key is None:
+            html_content = generate_graph_html(level_of_detail(graph_data, max_nodes, expanded, positions)[0], positions)
+        else:
+            html_content = _cached_view(graph_data, key, max_nodes, tuple(sorted(expanded)),
+                                           positions, bool(positions))
         components.html(html_content, height=510)
         return None
     except Exception as e:
@@ -0,0 +1,113 @@
+"""
+Offline tests of the LLM gateway (retries, backoff, circuit breaker, 503 mapping)
+driven by the fake model from backend/benchmarks/fake_llm.py.
+
+    cd functor_engine_web && python -m pytest -q test_llm_gateway.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from benchmarks.fake_llm import FakeChatModel  # noqa: E402
+from core import metrics  # noqa: E402
+from core.llm_gateway import LLMGateway, LLMUnavailable  # noqa: E402
+
+
+def make_gateway(name, **kwargs):
+    # バックオフは短くして、待ち時間ではなく回数と状態を確かめる
+    options = dict(max_retries=3, base_delay=0.001, max_delay=0.01, failure_threshold=5, reset_timeout=30.0)
+    options.update(kwargs)
+    return LLMGateway(name, **options)
+
+
+def call(gateway, model, prompt="concept_1 crosses the river"):
+    return asyncio.run(gateway.call(lambda: model.ainvoke(prompt)))
+
+
+def test_retries_429_until_success():
+    model = FakeChatModel(latency=0.0, fail_first=2)
+    gateway = make_gateway("test-retry")
+    retries = metrics.LLM_RETRIES.value(("test-retry",))
+
+    result = call(gateway, model)
+
+    assert result.content
+    assert model.calls == 3
+    assert metrics.LLM_RETRIES.value(("test-retry",)) - retries == 2
+    assert gateway.breaker.state == "closed"
+    assert gateway.breaker.failures == 0
+
+
+def test_rpm_limit_exhausts_retries():
+    model = FakeChatModel(latency=0.0, rpm_limit=1)
+    gateway = make_gateway("test-rpm", max_retries=2)
+    call(gateway, model)
+
+    with pytest.raises(LLMUnavailable) as excinfo:
+        call(gateway, model)
+
+    assert model.calls == 1 + 1 + 2  # 成功 1 回 + 初回と再試行 2 回
+    # 429 の Retry-After (残り約 60 秒) がそのまま返される
+    assert excinfo.value.retry_after > 30
+
+
+def test_breaker_opens_and_closes():
+    model = FakeChatModel(latency=0.0, fail_first=2)
+    gateway = make_gateway("test-breaker", max_retries=0, failure_threshold=2, reset_timeout=0.05)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            call(gateway, model)
+    assert gateway.breaker.state == "open"
+
+    # 開いている間はモデルを呼ばずに拒否する
+    with pytest.raises(LLMUnavailable, match="circuit open"):
+        call(gateway, model)
+    assert model.calls == 2
+
+    time.sleep(0.06)
+    call(gateway, model)  # 半開: 1 件だけ試し、成功したので閉じる
+    assert model.calls == 3
+    assert gateway.breaker.state == "closed"
+
+
+def test_half_open_probe_survives_queue_full_rejection():
+    model = FakeChatModel(latency=0.0, fail_first=1)
+    gateway = make_gateway("test-probe", max_retries=0, failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(LLMUnavailable):
+        call(gateway, model)
+    time.sleep(0.06)
+
+    gateway.max_queue = 0
+    with pytest.raises(LLMUnavailable, match="queue full"):
+        call(gateway, model)
+    gateway.max_queue = 10
+    call(gateway, model)
+    assert gateway.breaker.state == "closed"
+
+
+def test_llm_unavailable_maps_to_503(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", os.environ.get("GEMINI_API_KEY", "offline-test"))
+    monkeypatch.setenv("WORLD_SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setenv("STARTUP_WARMUP", "off")
+    monkeypatch.delenv("TRANSLATION_CACHE_PATH", raising=False)
+    from fastapi.testclient import TestClient
+    import main
+
+    engine = main.load_engine()
+    monkeypatch.setattr(engine, "llm", FakeChatModel(latency=0.0, rpm_limit=1))
+    gateway = main.llm_gateways["text"]
+    for name, value in (("base_delay", 0.001), ("max_delay", 0.01), ("max_retries", 1)):
+        monkeypatch.setattr(gateway, name, value)
+    engine.llm.invoke("use up the rpm limit")
+
+    with TestClient(main.app) as client:
+        response = client.post("/translate", json={"text": "concept_1 crosses the river"})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 30